@@ -92,6 +92,30 @@ def query():
             return jsonify({"error": "Synatx error in pql"})
 
 
+@app.route('/stream', methods=['POST'])
+@api_required
+def stream():
+    pql = request.get_json()
+    if pql is not None:
+        log.debug(f"Got stream PQL <----- {pql}")
+        try:
+            db = DBEngine()
+            result = db.follow(pql["query"])
+            return jsonify(result)
+        except (SyntaxError):
+            return jsonify({"error": "Syntax error in pql"})
+
+
+@app.route('/dns/<address>', methods=['GET'])
+@api_required
+def dns(address: str):
+    try:
+        db = DBEngine()
+        return jsonify(db.dns_names(address))
+    except (ValueError):
+        return jsonify({"error": "Invalid IPv4 address"})
+
+
 @app.route('/node', methods=['GET'])
 @jwt_required()
 def node():
@@ -42,6 +42,26 @@ class Config:
     def pcap_master_index(cls) -> str:
         return os.getenv('PCAP_MASTER_INDEX', '')
 
+    @classmethod
+    def index_format(cls) -> int:
+        index_format = os.getenv('INDEX_FORMAT', 2)
+        try:
+            return int(index_format)
+        except ValueError:
+            log.error(
+                f"Invalid value for INDEX_FORMAT: {index_format} using version 2")
+            return 2
+
+    @classmethod
+    def index_layout(cls) -> int:
+        index_layout = os.getenv('INDEX_LAYOUT', 2)
+        try:
+            return int(index_layout)
+        except ValueError:
+            log.error(
+                f"Invalid value for INDEX_LAYOUT: {index_layout} using layout 2")
+            return 2
+
     @classmethod
     def api_secret_key(cls):
         return os.getenv("API_SECRET_KEY", "")
@@ -2,13 +2,20 @@
 import logging
 import multiprocessing as mp
 from datetime import datetime
-from typing import Any, Generator
+from ipaddress import IPv4Address
+from typing import Any, Generator, Iterable
+
+import numpy as np
 
 from config.config import Config
+from dbase.index_file import INDEX_RECORD_WIDE
 from dbase.index_manager import IndexManager, PktPtr
 from dbase.query_result import QueryResult
+from dbase.segment import SegmentCompactor
 from packet.layers.packet_builder import PacketBuilder
-from pql.interp_raw import exec_program
+from pql.interp_raw import WhereFilter, exec_program, load_packet
+from pql.optimizer import fold_constants
+from pql.pcap_reader import FETCH_BATCH_MAX, FETCH_BATCH_MIN, PcapReaderPool, batched
 from pql.parse import parse_source
 
 # from scapy.all import IP, TCP, UDP, Ether, sr1
@@ -18,26 +25,33 @@ log = logging.getLogger("packetdb")
 
 
 class DBEngine:
-    def __init__(self):
+    def __init__(self) -> None:
         self.pkt_found = 0
         self.index_mgr = IndexManager()
+        self.readers = PcapReaderPool()
 
-    def index_db(self):
+    def index_db(self, rebuild: bool = False):
         index_mgr = IndexManager()
-        index_mgr.create_index()
+        index_mgr.create_index(rebuild)
+
+    def compact_db(self):
+        SegmentCompactor().run()
 
-    def exec(self, pql: str):
+    def exec(self, pql: str, follow: bool = False):
         self.model = parse_source(pql)
+        self.model.where_expr = fold_constants(self.model.where_expr)
         log.debug(self.model)
         log.debug(self.model.index_field)
         log.debug(f"FOUND ID: {self.model.id}:{self.model.has_id}")
 
-        if not self.model.has_id:
-            return self._run()
+        if follow:
+            return self._run_follow()
+        elif not self.model.has_id:
+            return self._run(parallel=Config.nbr_threads() > 1)
         else:
             return self._run_id()
 
-    def _run_id(self):
+    def _run_id(self) -> dict:
         query_result = QueryResult(self.model)
         log.debug("Running with ID")
         result = []
@@ -56,7 +70,7 @@ class DBEngine:
             f"---> Get by ID time: {ttl_time} for {len(result)} packet")
         return query_result.get_result()
 
-    def _run(self):
+    def _run(self, parallel: bool = False):
         # def _run(self, pql: str):
         searched = 0
         self.pkt_found = 0
@@ -67,13 +81,28 @@ class DBEngine:
         log.debug(self.model.index_field)
         log.debug(f"FOUND ID: {self.model.id}:{self.model.has_id}")
         query_result = QueryResult(self.model)
-        index_result = self.index_mgr.search(self.model)
+
+        # --- Aggregates on the wide index records skip the pcap files
+        if self.index_mgr.covers(self.model):
+            records_list = self.index_mgr.search_records(self.model)
+            if records_list is not None:
+                return self._run_index(records_list)
+
+        # --- The workers of a parallel search return the matching packets only
+        if parallel:
+            index_result = self.index_mgr.search_parallel(self.model)
+        else:
+            index_result = self.index_mgr.search(self.model)
+            where = WhereFilter(self.model.where_expr)
 
         start_time = datetime.now()
-        for idx in index_result:
-            r = self.search_pkt(idx, self.model.where_expr)
+        for idx in self.fetch(index_result):
+            if parallel:
+                r: PacketBuilder | None = load_packet(idx, self.readers)
+            else:
+                r = self.search_pkt(idx, where)
             if r is not None:
-                if offset_ptr > self.model.offset:
+                if offset_ptr >= self.model.offset:
                     query_result.add_packet(r)
                     self.pkt_found += 1
                 offset_ptr += 1
@@ -86,67 +115,84 @@ class DBEngine:
 
         ttl_time = datetime.now() - start_time
 
+        index_result.close()
+        self.readers.close()
+
         log.info(
             f"---> Index scan time: {ttl_time} Result: {searched}:{self.pkt_found} TOP: {self.model.top_expr} OFFSET: {self.model.offset} TO_FETCH: {self.model.packet_to_fetch} SELECT: {self.model.select_expr}")
 
         return query_result.get_result()
 
-    def run_parallel(self, pql: str):
-        log.debug(pql)
-        self.pql = pql
-        index_mgr = IndexManager()
-        searched = 0
-        self.pkt_found = 0
-        offset_ptr = 0
-
-        self.model = parse_source(pql)
-        log.debug(self.model.index_field)
+    def fetch(self, index_result: Iterable[PktPtr]) -> Generator[PktPtr, None, None]:
+        """
+        Pointers of the index stream with their packet, read by batch. The
+        pointers of a batch are grouped by file and read in offset order,
+        neighbouring packets with one read. The stream order is kept.
+        """
+        for batch in batched(index_result, FETCH_BATCH_MIN, FETCH_BATCH_MAX):
+            self.readers.fetch(batch)
+            yield from batch
+
+    def _run_index(self, records_list: list[np.ndarray]):
+        start_time = datetime.now()
         query_result = QueryResult(self.model)
-        index_result = index_mgr.search(self.model)
 
-        start_time = datetime.now()
-        pool = mp.Pool(Config.nbr_threads())
-
-        for idx in index_result:
-            params = []
-            for chunk_pkt in self.chunks(idx, Config.nbr_threads()):
-                for pkt in chunk_pkt:
-                    params.append((pkt, self.model.where_expr))
-
-                # dump_params(params)
-                result = pool.starmap(self.search_pkt, params)
-                # log.debug(f"Search PKT:{len(result)} {result}")
-                for r in result:
-                    searched += 1
-                    if r is not None:
-                        if offset_ptr > self.model.offset:
-                            # log.debug(f"Before Query Result add: {r}")
-                            query_result.add_packet(r)
-                            self.pkt_found += 1
-                        else:
-                            log.debug(
-                                f"Skipping for offset: {self.model.offset}:{offset_ptr}")
-                        offset_ptr += 1
-
-                    if query_result.count_reach:
-                        break
+        records = np.concatenate(records_list) if len(records_list) > 0 else np.empty(0, dtype=INDEX_RECORD_WIDE)
+        records = records[self.model.offset:]
+        if self.model.has_top:
+            records = records[:self.model.top_expr]
 
-                if query_result.count_reach:
-                    break
-
-            if query_result.count_reach:
-                break
+        query_result.add_records(records)
+        self.pkt_found = len(records)
 
         ttl_time = datetime.now() - start_time
-
         log.info(
-            f"---> Index scan time: {ttl_time} Result: {searched}:{self.pkt_found} TOP: {self.model.top_expr} OFFSET: {self.model.offset} TO_FETCH: {self.model.packet_to_fetch} SELECT: {self.model.select_expr}")
+            f"---> Index aggregate time: {ttl_time} Result: {self.pkt_found} TOP: {self.model.top_expr} OFFSET: {self.model.offset}")
+
+        return query_result.get_result()
+
+    def follow(self, pql: str):
+        """
+        Packets of the flows of the packets selected by frame.id, in
+        capture order, with the fields of the query
+        """
+        return self.exec(pql, follow=True)
+
+    def _run_follow(self) -> dict:
+        if not self.model.has_id:
+            raise SyntaxError("frame.id of a packet expected")
+
+        query_result = QueryResult(self.model)
+        for packet_id in self.model.id:
+            for pkt_ptr in self.index_mgr.follow_stream(packet_id >> 32, packet_id & 0xffffffff):
+                query_result.add_packet(load_packet(pkt_ptr, self.readers))
 
+        self.readers.close()
         return query_result.get_result()
 
-    def search_pkt(self, pkt_ptr: PktPtr, where_expr) -> PacketBuilder | None:
+    def dns_names(self, address: str) -> dict:
+        """
+        Names answered with the address by the DNS responses of the capture
+        """
+        return {"result": self.index_mgr.dns_names(int(IPv4Address(address)))}
+
+    def run_parallel(self, pql: str):
+        """
+        Run a query with the worker processes whatever the configured
+        number of threads
+        """
+        self.model = parse_source(pql)
+        self.model.where_expr = fold_constants(self.model.where_expr)
+        log.debug(self.model)
+
+        if self.model.has_id:
+            return self._run_id()
+
+        return self._run(parallel=True)
+
+    def search_pkt(self, pkt_ptr: PktPtr, where: WhereFilter) -> PacketBuilder | None:
         # log.debug(pkt_ptr)
-        if pkt_result := exec_program(where_expr, pkt_ptr):
+        if pkt_result := exec_program(where, pkt_ptr, self.readers):
             return pkt_result
         else:
             return None
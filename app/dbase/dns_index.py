@@ -0,0 +1,139 @@
+import logging
+from pathlib import Path
+from struct import calcsize, pack, unpack_from
+from typing import Tuple
+
+import numpy as np
+
+from config.config import Config
+from dbase.file_manager import FileManager
+from dbase.name_index import NameIndex, normalize
+
+log = logging.getLogger("packetdb")
+
+DNS_MAGIC = 0x444e5358
+DNS_VERSION = 0x0002
+
+# --- magic, version, options, number of answers
+DNS_HEADER = ">IHHI"
+DNS_HEADER_SIZE = calcsize(DNS_HEADER)
+
+# --- Address of an A record and the position of the name it answered
+ANSWER_ENTRY = np.dtype([
+    ("ip", ">u4"),
+    ("name", ">u4"),
+])
+
+
+class DnsIndex:
+    """
+    Query names of the DNS packets of an index file with the ordinals of
+    their records, and the names answered for each IPv4 address.
+    """
+
+    def __init__(self, file_id: int | str):
+        self.file_id = file_id
+        self.reset()
+
+    def reset(self) -> None:
+        self.queries = NameIndex()
+        self.answers = np.empty(0, dtype=ANSWER_ENTRY)
+
+    @property
+    def filename(self) -> Path:
+        return Path(f"{Config.pcap_index()}/{self.file_id}.dns")
+
+    @property
+    def exists(self) -> bool:
+        return self.filename.exists()
+
+    @property
+    def names(self) -> list[str]:
+        return self.queries.names
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def build(self, queries: list[Tuple[int, str]], answers: list[Tuple[int, str]]) -> "DnsIndex":
+        """
+        Index of the (ordinal, query name) of the DNS records and the
+        (ip, name) of their A records
+        """
+        self.queries = NameIndex().build(queries, [name for _, name in answers])
+
+        name_ids = self.queries.name_ids()
+        self.answers = np.array(sorted({(ip, name_ids[normalize(name)]) for ip, name in answers}),
+                                dtype=ANSWER_ENTRY)
+
+        return self
+
+    def from_packets(self, dns_list: list[Tuple[int, str, list[int]]]) -> "DnsIndex":
+        """
+        Index of the (ordinal, query name, A record addresses) of the DNS records
+        """
+        return self.build([(ordinal, name) for ordinal, name, _ in dns_list],
+                          [(ip, name) for _, name, addresses in dns_list for ip in addresses])
+
+    def entries(self) -> Tuple[list[Tuple[int, str]], list[Tuple[int, str]]]:
+        """
+        Queries and answers of the index, the input of build
+        """
+        answers = [(ip, self.names[name]) for ip, name in self.answers.tolist()]
+        return (self.queries.entries(), answers)
+
+    def merge(self, parts: list[Tuple["DnsIndex", int]]) -> "DnsIndex":
+        """
+        DNS index of consecutive index files, each part comes with the
+        ordinal of its first record
+        """
+        queries = []
+        answers = []
+        for dns_index, base in parts:
+            part_queries, part_answers = dns_index.entries()
+            queries += [(ordinal + base, name) for ordinal, name in part_queries]
+            answers += part_answers
+
+        return self.build(queries, answers)
+
+    def save(self) -> None:
+        with FileManager.atomic_write(self.filename) as f:
+            f.write(pack(DNS_HEADER, DNS_MAGIC, DNS_VERSION, 0, len(self.answers)))
+            f.write(self.answers.tobytes())
+            self.queries.write(f)
+
+    def load(self) -> "DnsIndex":
+        with open(self.filename, "rb") as f:
+            buffer = f.read()
+
+        (magic_no, version, _, nbr_answers) = unpack_from(DNS_HEADER, buffer)
+        if magic_no != DNS_MAGIC or version != DNS_VERSION:
+            raise ValueError(f"Invalid DNS index: {self.filename}")
+
+        offset = DNS_HEADER_SIZE
+        self.answers = np.frombuffer(buffer, dtype=ANSWER_ENTRY, count=nbr_answers, offset=offset)
+        offset += nbr_answers * ANSWER_ENTRY.itemsize
+        self.queries = NameIndex()
+        self.queries.read(buffer, offset)
+
+        return self
+
+    def lookup(self, name: str) -> np.ndarray:
+        """
+        Records of the queries and responses of a name
+        """
+        return self.queries.lookup(name)
+
+    def suffix(self, domain: str) -> np.ndarray:
+        """
+        Records of the names under a domain, the domain itself excluded
+        """
+        return self.queries.suffix(domain)
+
+    def resolve(self, ip: int) -> list[str]:
+        """
+        Names answered with the address
+        """
+        ips = self.answers["ip"]
+        start = int(np.searchsorted(ips, ip, side="left"))
+        end = int(np.searchsorted(ips, ip, side="right"))
+        return [self.names[int(name)] for name in self.answers["name"][start:end]]
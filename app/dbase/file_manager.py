@@ -1,4 +1,5 @@
 from config.config import Config
+from contextlib import contextmanager
 import io
 import os
 
@@ -6,12 +7,29 @@ import os
 class FileManager:
 
     @classmethod
-    def clean_indexes(cls):
+    def clean_indexes(cls) -> None:
         cls.__clean_folder(Config.pcap_index())
         cls.__clean_folder(Config.pcap_proto_index())
 
     @classmethod
-    def __clean_folder(cls, folder_name):
+    @contextmanager
+    def atomic_write(cls, filename):
+        """
+        Write the file under a temporary name and rename it once complete,
+        readers see the previous or the new content, never a partial one
+        """
+        tmp_filename = f"{filename}.tmp"
+        try:
+            with open(tmp_filename, "wb") as f:
+                yield f
+        except BaseException:
+            os.remove(tmp_filename)
+            raise
+
+        os.replace(tmp_filename, filename)
+
+    @classmethod
+    def __clean_folder(cls, folder_name: str) -> None:
         for filename in os.listdir(folder_name):
             file_path = os.path.join(folder_name, filename)
             if os.path.isfile(file_path):
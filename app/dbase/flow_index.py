@@ -0,0 +1,237 @@
+import logging
+from pathlib import Path
+from struct import calcsize, pack, unpack_from
+from typing import Tuple
+
+import numpy as np
+
+import pql.packet_index as pkt_index
+from config.config import Config
+from dbase.file_manager import FileManager
+from dbase.index_file import network_mask
+
+log = logging.getLogger("packetdb")
+
+FLOW_MAGIC = 0x464c4f57
+FLOW_VERSION = 0x0001
+
+# --- magic, version, options, number of flows, number of postings
+FLOW_HEADER = ">IHHII"
+FLOW_HEADER_SIZE = calcsize(FLOW_HEADER)
+
+# --- Normalized 5-tuple, the (ip_a, port_a) end is the lowest one
+FLOW_ENTRY = np.dtype([
+    ("proto", ">u2"),
+    ("ip_a", ">u4"),
+    ("port_a", ">u2"),
+    ("ip_b", ">u4"),
+    ("port_b", ">u2"),
+    ("first_ts", ">u4"),
+    ("last_ts", ">u4"),
+    ("packets", ">u4"),
+    ("bytes", ">u8"),
+])
+
+FLOW_KEY = ("proto", "ip_a", "port_a", "ip_b", "port_b")
+
+POSTING_DTYPE = np.dtype(">u4")
+
+# --- IP protocol numbers of the flows
+IP_PROTO_ICMP = 1
+IP_PROTO_TCP = 6
+IP_PROTO_UDP = 17
+
+
+def ip_proto(proto_column: np.ndarray) -> np.ndarray:
+    """
+    IP protocol number of the records from their protocol bits
+    """
+    proto_column = np.asarray(proto_column, dtype=np.uint32)
+    return np.select([(proto_column & pkt_index.TCP) != 0,
+                      (proto_column & pkt_index.UDP) != 0,
+                      (proto_column & pkt_index.ICMP) != 0],
+                     [IP_PROTO_TCP, IP_PROTO_UDP, IP_PROTO_ICMP], 0).astype(np.uint16)
+
+
+def group_starts(columns: list[np.ndarray]) -> np.ndarray:
+    """
+    Start of each run of equal keys of sorted key columns
+    """
+    change = np.zeros(len(columns[0]), dtype=bool)
+    change[0] = True
+    for column in columns:
+        change[1:] |= column[1:] != column[:-1]
+
+    return np.flatnonzero(change)
+
+
+class FlowIndex:
+    """
+    Conversations of an index file keyed by normalized 5-tuple with their
+    first and last timestamp, packet and byte counts and the ordinals of
+    their records, in ascending order.
+    """
+
+    def __init__(self, file_id: int | str):
+        self.file_id = file_id
+        self.reset()
+
+    def reset(self) -> None:
+        self.flows = np.empty(0, dtype=FLOW_ENTRY)
+        self.starts = np.zeros(1, dtype=POSTING_DTYPE)
+        self.postings = np.empty(0, dtype=POSTING_DTYPE)
+
+    @property
+    def filename(self) -> Path:
+        return Path(f"{Config.pcap_index()}/{self.file_id}.flow")
+
+    @property
+    def exists(self) -> bool:
+        return self.filename.exists()
+
+    def __len__(self) -> int:
+        return len(self.flows)
+
+    def build(self, records: np.ndarray, lengths: np.ndarray) -> "FlowIndex":
+        """
+        Flows of the IPv4 records, lengths holds the size of each packet
+        """
+        ordinals = np.flatnonzero(np.asarray(records["proto"], dtype=np.uint32) & pkt_index.IPv4)
+        if len(ordinals) == 0:
+            self.reset()
+            return self
+
+        rows = records[ordinals]
+        ip_src = rows["ip_src"].astype(np.uint32)
+        ip_dst = rows["ip_dst"].astype(np.uint32)
+        sport = rows["sport"].astype(np.uint16)
+        dport = rows["dport"].astype(np.uint16)
+
+        swap = (ip_src > ip_dst) | ((ip_src == ip_dst) & (sport > dport))
+        keys = [ip_proto(rows["proto"]),
+                np.where(swap, ip_dst, ip_src), np.where(swap, dport, sport),
+                np.where(swap, ip_src, ip_dst), np.where(swap, sport, dport)]
+
+        # --- lexsort is stable, the ordinals of a flow stay in ascending order
+        order = np.lexsort(keys[::-1])
+        keys = [column[order] for column in keys]
+        starts = group_starts(keys)
+
+        ts = rows["ts"][order].astype(np.uint32)
+        sizes = np.asarray(lengths, dtype=np.uint64)[ordinals][order]
+
+        self.flows = np.zeros(len(starts), dtype=FLOW_ENTRY)
+        for name, column in zip(FLOW_KEY, keys):
+            self.flows[name] = column[starts]
+        self.flows["first_ts"] = np.minimum.reduceat(ts, starts)
+        self.flows["last_ts"] = np.maximum.reduceat(ts, starts)
+        self.flows["packets"] = np.diff(np.append(starts, len(order)))
+        self.flows["bytes"] = np.add.reduceat(sizes, starts)
+
+        self.starts = np.append(starts, len(order)).astype(POSTING_DTYPE)
+        self.postings = ordinals[order].astype(POSTING_DTYPE)
+
+        return self
+
+    def merge(self, parts: list[Tuple["FlowIndex", int]]) -> "FlowIndex":
+        """
+        Flow index of consecutive index files, each part comes with the
+        ordinal of its first record. Flows of the same 5-tuple are merged.
+        """
+        parts = [(flow_index, base) for flow_index, base in parts if len(flow_index) > 0]
+        if len(parts) == 0:
+            self.reset()
+            return self
+
+        # --- concatenate returns native byte order fields
+        flows = np.concatenate([flow_index.flows for flow_index, _ in parts]).astype(FLOW_ENTRY)
+        postings = np.concatenate([flow_index.postings.astype(np.int64) + base
+                                   for flow_index, base in parts])
+        counts = flows["packets"].astype(np.int64)
+
+        order = np.lexsort([flows[name] for name in FLOW_KEY[::-1]])
+        flows = flows[order]
+        starts = group_starts([flows[name] for name in FLOW_KEY])
+
+        self.flows = flows[starts].copy()
+        self.flows["first_ts"] = np.minimum.reduceat(flows["first_ts"], starts)
+        self.flows["last_ts"] = np.maximum.reduceat(flows["last_ts"], starts)
+        self.flows["packets"] = np.add.reduceat(flows["packets"].astype(np.uint64), starts)
+        self.flows["bytes"] = np.add.reduceat(flows["bytes"].astype(np.uint64), starts)
+
+        # --- Postings follow the merged flows, parts keep their order within a flow
+        merged = np.zeros(len(order), dtype=np.int64)
+        merged[starts] = 1
+        flow_of_row = np.empty(len(order), dtype=np.int64)
+        flow_of_row[order] = np.cumsum(merged) - 1
+        posting_flow = np.repeat(flow_of_row, counts)
+        posting_order = np.argsort(posting_flow, kind="stable")
+
+        self.starts = np.append(0, np.cumsum(self.flows["packets"].astype(np.int64))).astype(POSTING_DTYPE)
+        self.postings = postings[posting_order].astype(POSTING_DTYPE)
+
+        return self
+
+    def save(self) -> None:
+        with FileManager.atomic_write(self.filename) as f:
+            f.write(pack(FLOW_HEADER, FLOW_MAGIC, FLOW_VERSION, 0,
+                         len(self.flows), len(self.postings)))
+            f.write(self.flows.tobytes())
+            f.write(self.starts.tobytes())
+            f.write(self.postings.tobytes())
+
+    def load(self) -> "FlowIndex":
+        with open(self.filename, "rb") as f:
+            buffer = f.read()
+
+        (magic_no, _, _, nbr_flows, nbr_postings) = unpack_from(FLOW_HEADER, buffer)
+        if magic_no != FLOW_MAGIC:
+            raise ValueError(f"Invalid flow index: {self.filename}")
+
+        offset = FLOW_HEADER_SIZE
+        self.flows = np.frombuffer(buffer, dtype=FLOW_ENTRY, count=nbr_flows, offset=offset)
+        offset += nbr_flows * FLOW_ENTRY.itemsize
+        self.starts = np.frombuffer(buffer, dtype=POSTING_DTYPE, count=nbr_flows + 1, offset=offset)
+        offset += (nbr_flows + 1) * POSTING_DTYPE.itemsize
+        self.postings = np.frombuffer(buffer, dtype=POSTING_DTYPE, count=nbr_postings, offset=offset)
+
+        return self
+
+    def conversation(self, address_a: Tuple[int, int], address_b: Tuple[int, int]) -> np.ndarray:
+        """
+        Flows between two addresses or networks, in either direction
+        """
+        a_b = network_mask(self.flows["ip_a"], [address_a]) & network_mask(self.flows["ip_b"], [address_b])
+        b_a = network_mask(self.flows["ip_a"], [address_b]) & network_mask(self.flows["ip_b"], [address_a])
+        return np.flatnonzero(a_b | b_a)
+
+    def find(self, key: Tuple[int, ...]) -> np.ndarray:
+        """
+        Flows of a 5-tuple, in the order of FLOW_KEY
+        """
+        mask = np.ones(len(self.flows), dtype=bool)
+        for name, value in zip(FLOW_KEY, key):
+            mask &= self.flows[name] == value
+
+        return np.flatnonzero(mask)
+
+    def ordinals(self, flows: np.ndarray) -> np.ndarray:
+        """
+        Ordinals of the records of the flows as a sorted int64 array
+        """
+        if len(flows) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        result = np.concatenate([self.postings[int(self.starts[flow]):int(self.starts[flow + 1])]
+                                 for flow in flows]).astype(np.int64)
+        return np.sort(result) if len(flows) > 1 else result
+
+    def flow_of(self, ordinal: int) -> int | None:
+        """
+        Flow holding the record ordinal
+        """
+        position = np.flatnonzero(self.postings == ordinal)
+        if len(position) == 0:
+            return None
+
+        return int(np.searchsorted(self.starts, position[0], side="right")) - 1
@@ -0,0 +1,116 @@
+import logging
+from pathlib import Path
+from struct import calcsize, pack, unpack_from
+from typing import Tuple
+
+import numpy as np
+
+from config.config import Config
+from dbase.file_manager import FileManager
+from dbase.name_index import NameIndex
+from pql.model import HOST_NAME_LABELS
+
+log = logging.getLogger("packetdb")
+
+HOST_MAGIC = 0x48535458
+HOST_VERSION = 0x0002
+
+# --- magic, version, options, number of fields
+HOST_HEADER = ">IHHI"
+HOST_HEADER_SIZE = calcsize(HOST_HEADER)
+
+# --- Fields extracted at index time, in their order in the file
+HOST_FIELDS = ("https.sni", "http.host", "http.uri")
+
+
+def host_names(field: str) -> NameIndex:
+    """
+    Dictionary of a field, the URIs are kept byte for byte
+    """
+    return NameIndex(exact=field not in HOST_NAME_LABELS)
+
+
+class HostIndex:
+    """
+    Server names of the TLS ClientHello, Host headers and URIs of the HTTP
+    requests of an index file, each field a dictionary of its strings with
+    the ordinals of their records.
+    """
+
+    def __init__(self, file_id: int | str):
+        self.file_id = file_id
+        self.reset()
+
+    def reset(self) -> None:
+        self.fields = {field: host_names(field) for field in HOST_FIELDS}
+
+    @property
+    def filename(self) -> Path:
+        return Path(f"{Config.pcap_index()}/{self.file_id}.host")
+
+    @property
+    def exists(self) -> bool:
+        return self.filename.exists()
+
+    def __len__(self) -> int:
+        return sum(len(names) for names in self.fields.values())
+
+    def from_packets(self, host_list: list[Tuple[int, str, str]]) -> "HostIndex":
+        """
+        Index of the (ordinal, field, value) of the records
+        """
+        self.fields = {field: host_names(field).build([(ordinal, value) for ordinal, name, value in host_list
+                                                       if name == field])
+                       for field in HOST_FIELDS}
+        return self
+
+    def entries(self) -> list[Tuple[int, str, str]]:
+        """
+        (ordinal, field, value) of the records, the input of from_packets
+        """
+        return [(ordinal, field, value) for field, names in self.fields.items()
+                for ordinal, value in names.entries()]
+
+    def merge(self, parts: list[Tuple["HostIndex", int]]) -> "HostIndex":
+        """
+        Host index of consecutive index files, each part comes with the
+        ordinal of its first record
+        """
+        host_list = []
+        for host_index, base in parts:
+            host_list += [(ordinal + base, field, value) for ordinal, field, value in host_index.entries()]
+
+        return self.from_packets(host_list)
+
+    def save(self) -> None:
+        with FileManager.atomic_write(self.filename) as f:
+            f.write(pack(HOST_HEADER, HOST_MAGIC, HOST_VERSION, 0, len(HOST_FIELDS)))
+            for field in HOST_FIELDS:
+                self.fields[field].write(f)
+
+    def load(self) -> "HostIndex":
+        with open(self.filename, "rb") as f:
+            buffer = f.read()
+
+        (magic_no, version, _, nbr_fields) = unpack_from(HOST_HEADER, buffer)
+        if magic_no != HOST_MAGIC or version != HOST_VERSION or nbr_fields != len(HOST_FIELDS):
+            raise ValueError(f"Invalid host index: {self.filename}")
+
+        offset = HOST_HEADER_SIZE
+        for field in HOST_FIELDS:
+            self.fields[field] = host_names(field)
+            offset = self.fields[field].read(buffer, offset)
+
+        return self
+
+    def lookup(self, field: str, value: str) -> np.ndarray:
+        """
+        Records of a value of the field
+        """
+        return self.fields[field].lookup(value)
+
+    def suffix(self, field: str, domain: str) -> np.ndarray:
+        """
+        Records of the values of the field ending with .domain
+        """
+        return self.fields[field].suffix(domain)
@@ -0,0 +1,150 @@
+import logging
+from struct import calcsize, pack, unpack_from
+from typing import Tuple
+
+import numpy as np
+
+log = logging.getLogger("packetdb")
+
+# --- Column encodings
+ENC_VARINT = 0x01
+ENC_DELTA = 0x02
+ENC_DICT = 0x03
+
+# --- Encoding of each record field, fields not listed are plain varints
+COLUMN_ENCODING = {
+    "ts": ENC_DELTA,
+    "ptr": ENC_DELTA,
+    "proto": ENC_DICT,
+    "ip_dst": ENC_DICT,
+    "ip_src": ENC_DICT,
+    "eth_src": ENC_DICT,
+    "eth_dst": ENC_DICT,
+}
+
+# --- encoding, number of values in the dictionary, payload length
+COLUMN_HEADER = ">BII"
+COLUMN_HEADER_SIZE = calcsize(COLUMN_HEADER)
+
+
+def varint_encode(values: np.ndarray) -> bytes:
+    """
+    LEB128 encoding of an array of unsigned integers, 7 bits per byte
+    with the high bit set on every byte but the last of a value
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return b""
+
+    nbr_bytes = np.ones(len(values), dtype=np.int64)
+    remain = values >> np.uint64(7)
+    while remain.any():
+        nbr_bytes += remain > 0
+        remain >>= np.uint64(7)
+
+    ends = np.cumsum(nbr_bytes)
+    starts = ends - nbr_bytes
+    result = np.empty(int(ends[-1]), dtype=np.uint8)
+
+    for pos in range(int(nbr_bytes.max())):
+        selected = nbr_bytes > pos
+        byte = (values[selected] >> np.uint64(7 * pos)) & np.uint64(0x7f)
+        more = (nbr_bytes[selected] > pos + 1).astype(np.uint64) << np.uint64(7)
+        result[starts[selected] + pos] = byte | more
+
+    return result.tobytes()
+
+
+def varint_decode(buffer, count: int) -> Tuple[np.ndarray, int]:
+    """
+    Decode count varints from the buffer, returns the values and the
+    number of bytes consumed
+    """
+    if count == 0:
+        return (np.empty(0, dtype=np.uint64), 0)
+
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)[:count]
+    if len(ends) < count:
+        raise ValueError("Truncated varint buffer")
+
+    used = int(ends[-1]) + 1
+    data = data[:used]
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    group = np.repeat(np.arange(count), ends - starts + 1)
+    shift = ((np.arange(used) - starts[group]) * 7).astype(np.uint64)
+    parts = (data & 0x7f).astype(np.uint64) << shift
+
+    return (np.bitwise_or.reduceat(parts, starts), used)
+
+
+def zigzag_encode(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def zigzag_decode(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.uint64)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def encode_column(column: np.ndarray, encoding: int) -> bytes:
+    dict_size = 0
+
+    if encoding == ENC_DELTA:
+        values = column.astype(np.int64)
+        deltas = np.diff(values, prepend=np.int64(0))
+        payload = varint_encode(zigzag_encode(deltas))
+
+    elif encoding == ENC_DICT:
+        dictionary, indexes = np.unique(column, return_inverse=True)
+        dict_size = len(dictionary)
+        payload = varint_encode(dictionary) + varint_encode(indexes)
+
+    else:
+        payload = varint_encode(column)
+
+    return pack(COLUMN_HEADER, encoding, dict_size, len(payload)) + payload
+
+
+def decode_column(buffer, offset: int, count: int) -> Tuple[np.ndarray, int]:
+    encoding, dict_size, length = unpack_from(COLUMN_HEADER, buffer, offset)
+    offset += COLUMN_HEADER_SIZE
+    payload = buffer[offset:offset + length]
+
+    if encoding == ENC_DELTA:
+        deltas, _ = varint_decode(payload, count)
+        values = np.cumsum(zigzag_decode(deltas))
+
+    elif encoding == ENC_DICT:
+        dictionary, used = varint_decode(payload, dict_size)
+        indexes, _ = varint_decode(payload[used:], count)
+        values = dictionary[indexes.astype(np.int64)]
+
+    elif encoding == ENC_VARINT:
+        values, _ = varint_decode(payload, count)
+
+    else:
+        raise ValueError(f"Unknown column encoding: {encoding}")
+
+    return (values, offset + length)
+
+
+def encode_block(records: np.ndarray) -> bytes:
+    result = bytearray()
+    for name in records.dtype.names or ():
+        encoding = COLUMN_ENCODING.get(name, ENC_VARINT)
+        result += encode_column(records[name], encoding)
+
+    return bytes(result)
+
+
+def decode_block(buffer, count: int, dtype: np.dtype) -> np.ndarray:
+    records = np.empty(count, dtype=dtype)
+    offset = 0
+    for name in dtype.names or ():
+        values, offset = decode_column(buffer, offset, count)
+        records[name] = values
+
+    return records
@@ -0,0 +1,328 @@
+import logging
+from pathlib import Path
+from struct import calcsize, pack, unpack_from
+from typing import Tuple
+
+import numpy as np
+
+from config.config import Config
+from dbase.file_manager import FileManager
+from dbase.index_codec import decode_block, encode_block
+from dbase.ipv4_search import Ipv4Search
+
+log = logging.getLogger("packetdb")
+
+# --- One record per packet: (ts, ptr, proto, ip_dst, ip_src, hdr_len, dport, sport)
+# --- Same layout as the original ">IIIIIHHH" struct, 26 bytes, big endian
+INDEX_RECORD = np.dtype([
+    ("ts", ">u4"),
+    ("ptr", ">u4"),
+    ("proto", ">u4"),
+    ("ip_dst", ">u4"),
+    ("ip_src", ">u4"),
+    ("hdr_len", ">u2"),
+    ("dport", ">u2"),
+    ("sport", ">u2"),
+])
+
+INDEX_RECORD_SIZE = INDEX_RECORD.itemsize
+
+# --- Wide layout, the base record followed by the hot fields of the packet
+# --- header so predicates and aggregates on them are served by the index
+INDEX_RECORD_WIDE = np.dtype(INDEX_RECORD.descr + [
+    ("orig_len", ">u4"),
+    ("incl_len", ">u4"),
+    ("tcp_flags", ">u2"),
+    ("ttl", "u1"),
+    ("vlan", ">u2"),
+    ("eth_src", ">u8"),
+    ("eth_dst", ">u8"),
+])
+
+# --- Columns of the wide layout kept next to a version 1 file
+INDEX_EXTENSION = np.dtype([field for field in INDEX_RECORD_WIDE.descr
+                            if field[0] not in (INDEX_RECORD.names or ())])
+
+# --- PQL fields stored in the wide records
+RECORD_FIELDS = {
+    "frame.origlen": "orig_len",
+    "frame.inclen": "incl_len",
+    "tcp.flags": "tcp_flags",
+    "ip.ttl": "ttl",
+    "eth.vlan": "vlan",
+}
+
+# --- Version 2: header, block directory and compressed blocks of records
+INDEX_MAGIC = 0x50494458
+INDEX_V1 = 0x0001
+INDEX_V2 = 0x0002
+
+LAYOUT_BASE = 0x0001
+LAYOUT_WIDE = 0x0002
+INDEX_LAYOUTS = {
+    LAYOUT_BASE: INDEX_RECORD,
+    LAYOUT_WIDE: INDEX_RECORD_WIDE,
+}
+
+# --- magic, version, layout, number of records, records per block, number of blocks
+INDEX_HEADER = ">IHHIII"
+INDEX_HEADER_SIZE = calcsize(INDEX_HEADER)
+
+BLOCK_ENTRY = np.dtype([
+    ("offset", ">u8"),
+    ("min_ts", ">u4"),
+    ("max_ts", ">u4"),
+])
+
+BLOCK_SIZE = 4096
+
+
+class IndexFile:
+    """
+    Packet index of a pcap file.
+
+    Version 1 is a flat array of 26 bytes records. Version 2 starts with a
+    header and a block directory followed by blocks of records where the
+    timestamps and offsets are delta encoded and the protocols and ip
+    addresses are dictionary encoded. Both versions are read transparently.
+
+    The wide layout adds the frame lengths, TCP flags, TTL, VLAN id and MAC
+    addresses. A version 1 file keeps these columns in a .pext file of the
+    same length.
+    """
+
+    def __init__(self, filename: Path | str, layout: int = LAYOUT_BASE):
+        self.filename = Path(filename)
+        self.layout = layout
+        self.dtype = INDEX_LAYOUTS[layout]
+        self.version = 0
+        self.nbr_records = 0
+        self.block_size = BLOCK_SIZE
+        self.blocks = np.empty(0, dtype=BLOCK_ENTRY)
+        self.buffer = np.empty(0, dtype=np.uint8)
+
+    @property
+    def file_id(self) -> int | str:
+        # --- Segments are named after the pcap files they hold
+        stem = self.filename.stem
+        return int(stem) if stem.isdigit() else stem
+
+    @property
+    def extension_filename(self) -> Path:
+        return self.filename.with_suffix(".pext")
+
+    def open(self) -> "IndexFile":
+        if self.version != 0:
+            return self
+
+        file_size = self.filename.stat().st_size
+        with open(self.filename, "rb") as f:
+            header = f.read(INDEX_HEADER_SIZE)
+
+        if len(header) == INDEX_HEADER_SIZE and unpack_from(">IH", header) == (INDEX_MAGIC, INDEX_V2):
+            (_, self.version, self.layout, self.nbr_records,
+             self.block_size, nbr_blocks) = unpack_from(INDEX_HEADER, header)
+            self.dtype = INDEX_LAYOUTS[self.layout]
+            self.buffer = np.memmap(self.filename, dtype=np.uint8, mode="r")
+            self.blocks = np.frombuffer(self.buffer, dtype=BLOCK_ENTRY, count=nbr_blocks,
+                                        offset=INDEX_HEADER_SIZE)
+        else:
+            self.version = INDEX_V1
+            self.nbr_records = file_size // INDEX_RECORD_SIZE
+            self.layout = LAYOUT_BASE
+
+            # --- A .pext file being appended is ignored until both files agree
+            if (self.extension_filename.exists() and
+                    self.extension_filename.stat().st_size == self.nbr_records * INDEX_EXTENSION.itemsize):
+                self.layout = LAYOUT_WIDE
+
+            self.dtype = INDEX_LAYOUTS[self.layout]
+
+        return self
+
+    def load(self) -> np.ndarray:
+        self.open()
+
+        if self.version == INDEX_V1:
+            if self.nbr_records == 0:
+                return np.empty(0, dtype=self.dtype)
+
+            # --- Records are paged in by the OS only when a column is touched
+            records = np.memmap(self.filename, dtype=INDEX_RECORD, mode="r", shape=(self.nbr_records,))
+            if self.layout == LAYOUT_BASE:
+                return records
+
+            extension = np.memmap(self.extension_filename, dtype=INDEX_EXTENSION, mode="r",
+                                  shape=(self.nbr_records,))
+            return join_columns(self.dtype, records, extension)
+
+        return self.read_blocks(np.arange(len(self.blocks)))
+
+    def take(self, ordinals: np.ndarray) -> np.ndarray:
+        """
+        Records at the given ordinals, only the blocks holding them are decoded
+        """
+        self.open()
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+
+        if self.version == INDEX_V1:
+            return self.load()[ordinals]
+
+        block_ids = np.unique(ordinals // self.block_size)
+        records = self.read_blocks(block_ids)
+        position = np.searchsorted(block_ids, ordinals // self.block_size) * self.block_size
+        position += ordinals % self.block_size
+
+        return records[position]
+
+    def read_blocks(self, block_ids: np.ndarray) -> np.ndarray:
+        if len(block_ids) == 0:
+            return np.empty(0, dtype=self.dtype)
+
+        return np.concatenate([self.read_block(int(block_id)) for block_id in block_ids])
+
+    def read_block(self, block_id: int) -> np.ndarray:
+        start = int(self.blocks[block_id]["offset"])
+        if block_id + 1 < len(self.blocks):
+            end = int(self.blocks[block_id + 1]["offset"])
+        else:
+            end = len(self.buffer)
+
+        count = min(self.block_size, self.nbr_records - block_id * self.block_size)
+        return decode_block(self.buffer[start:end], count, self.dtype)
+
+    def save(self, index_list: list[Tuple[int, ...]] | np.ndarray, version: int | None = None) -> np.ndarray:
+        records = as_layout(index_list, self.dtype)
+
+        if version is None:
+            version = Config.index_format()
+
+        if version == INDEX_V1:
+            with FileManager.atomic_write(self.filename) as f:
+                as_layout(records, INDEX_RECORD).tofile(f)
+
+            if self.layout == LAYOUT_WIDE:
+                with FileManager.atomic_write(self.extension_filename) as f:
+                    as_layout(records, INDEX_EXTENSION).tofile(f)
+            else:
+                self.extension_filename.unlink(missing_ok=True)
+        else:
+            self.save_blocks(records)
+            self.extension_filename.unlink(missing_ok=True)
+
+        self.version = 0
+        return records
+
+    def append(self, index_list: list[Tuple[int, ...]]) -> np.ndarray:
+        """
+        Add records at the end of a version 1 file, used while the pcap file
+        is still being written
+        """
+        if self.filename.exists() and self.filename.stat().st_size > 0:
+            if self.open().version != INDEX_V1:
+                raise ValueError(f"Only version 1 index files can be extended: {self.filename}")
+        else:
+            self.extension_filename.unlink(missing_ok=True)
+
+        records = as_layout(index_list, self.dtype)
+        with open(self.filename, "ab") as f:
+            as_layout(records, INDEX_RECORD).tofile(f)
+
+        if self.layout == LAYOUT_WIDE:
+            with open(self.extension_filename, "ab") as f:
+                as_layout(records, INDEX_EXTENSION).tofile(f)
+
+        self.version = 0
+        return records
+
+    def save_blocks(self, records: np.ndarray):
+        block_list = []
+        directory = np.zeros((len(records) + BLOCK_SIZE - 1) // BLOCK_SIZE, dtype=BLOCK_ENTRY)
+        offset = INDEX_HEADER_SIZE + directory.nbytes
+
+        for i, start in enumerate(range(0, len(records), BLOCK_SIZE)):
+            block = records[start:start + BLOCK_SIZE]
+            encoded = encode_block(block)
+            directory[i] = (offset, block["ts"].min(), block["ts"].max())
+            block_list.append(encoded)
+            offset += len(encoded)
+
+        with FileManager.atomic_write(self.filename) as f:
+            f.write(pack(INDEX_HEADER, INDEX_MAGIC, INDEX_V2, self.layout,
+                         len(records), BLOCK_SIZE, len(directory)))
+            f.write(directory.tobytes())
+            for encoded in block_list:
+                f.write(encoded)
+
+    def read(self, interval: Tuple[int, int] = (0, 0),
+             candidates: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ordinals and records to evaluate, the candidates or the blocks of the interval
+        """
+        self.open()
+
+        if candidates is not None:
+            # --- Only the candidate records are read from the index file
+            ordinals = np.asarray(candidates, dtype=np.int64)
+            records = self.take(ordinals)
+        elif self.version == INDEX_V2 and interval[0] != 0 and interval[1] != 0:
+            # --- Skip the blocks outside of the interval
+            overlap = (self.blocks["max_ts"] >= interval[0]) & (
+                self.blocks["min_ts"] <= interval[1])
+            block_ids = np.flatnonzero(overlap)
+            records = self.read_blocks(block_ids)
+            ordinals = np.concatenate([np.arange(block_id * self.block_size,
+                                                 min((block_id + 1) * self.block_size, self.nbr_records))
+                                       for block_id in block_ids.tolist()] + [np.empty(0, dtype=np.int64)])
+        else:
+            records = self.load()
+            ordinals = np.arange(len(records), dtype=np.int64)
+
+        return (ordinals, records)
+
+
+def as_layout(index_list: list[Tuple[int, ...]] | np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """
+    Records with the fields of dtype, the fields missing from the source are zero
+    """
+    if isinstance(index_list, np.ndarray) and index_list.dtype.names is not None:
+        records = index_list
+    elif len(index_list) > 0 and len(index_list[0]) == len(INDEX_RECORD_WIDE.names or ()):
+        records = np.array(index_list, dtype=INDEX_RECORD_WIDE)
+    elif len(index_list) > 0 and len(index_list[0]) == len(INDEX_RECORD.names or ()):
+        records = np.array(index_list, dtype=INDEX_RECORD)
+    else:
+        records = np.array(index_list, dtype=dtype)
+
+    if records.dtype == dtype:
+        return records
+
+    return join_columns(dtype, records)
+
+
+def join_columns(dtype: np.dtype, *sources: np.ndarray) -> np.ndarray:
+    result = np.zeros(len(sources[0]), dtype=dtype)
+    for source in sources:
+        for name in source.dtype.names or ():
+            if name in (dtype.names or ()):
+                result[name] = source[name]
+
+    return result
+
+
+def conversation_mask(ip_src: np.ndarray, ip_dst: np.ndarray,
+                      conversation_list: list[Tuple[Tuple[int, int], Tuple[int, int]]]) -> np.ndarray:
+    """
+    Records exchanged between the two ends of a conversation, in either direction
+    """
+    mask = np.zeros(len(ip_src), dtype=bool)
+
+    for address_a, address_b in conversation_list:
+        mask |= network_mask(ip_src, [address_a]) & network_mask(ip_dst, [address_b])
+        mask |= network_mask(ip_src, [address_b]) & network_mask(ip_dst, [address_a])
+
+    return mask
+
+
+def network_mask(column: np.ndarray, address_list: list[Tuple[int, int]]) -> np.ndarray:
+    return Ipv4Search.compile(address_list).mask(column)
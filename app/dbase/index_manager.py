@@ -1,61 +1,118 @@
 import logging
 import multiprocessing as mp
 import sqlite3
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from struct import unpack
 from typing import Any, Generator, Tuple
 
+import numpy as np
+
 import pql.packet_index as pkt_index
 from config.config import Config
 from dbase.packet_ptr import PktPtr
+from pql.aggregate import Count
 from pql.model import SelectStatement
+from pql.interp_raw import WhereFilter, exec_program
+from pql.pcap_reader import FETCH_BATCH_MAX, FETCH_BATCH_MIN, PcapReaderPool, batched
 from pql.pcapfile import PcapFile
 from dbase.proto_index import ProtoIndex
+from dbase.dns_index import DnsIndex
 from dbase.file_manager import FileManager
+from dbase.flow_index import FLOW_KEY, FlowIndex
+from dbase.index_file import LAYOUT_WIDE, RECORD_FIELDS, IndexFile
+from dbase.index_manifest import IndexManifest
+from dbase.index_plan import FileIndexes, IndexPlan, query_plan
+from dbase.master_index import MasterIndex
+from dbase.segment import SegmentCatalog, SegmentDirectory, index_id
+from dbase.zone_map import ZoneMap
 
 log = logging.getLogger("packetdb")
 
+# --- Parallel searches running at the same time
+SEARCH_SLOTS = 64
+
+# --- Protocols of the legacy per protocol index files
+LEGACY_PROTOS = {
+    "ETH_PROTO_ARP": pkt_index.ARP,
+    "DHCP": pkt_index.DHCP,
+    "RDP": pkt_index.RDP,
+    "DNS": pkt_index.DNS,
+    "TELNET": pkt_index.TELNET,
+    "SSH": pkt_index.SSH,
+    "HTTP": pkt_index.HTTP,
+    "HTTPS": pkt_index.HTTPS,
+    "NTP": pkt_index.NTP,
+    "SMB": pkt_index.SMB,
+}
+
 
 class IndexManager:
-    def __init__(self):
+    def __init__(self) -> None:
         pass
 
-    def create_index_seq(self):
-        path = Path(Config.pcap_path())
-        files_list = list(path.glob("*.pcap"))
+    def create_index_seq(self, rebuild: bool = False):
         pcapfile = PcapFile()
-        start_time = datetime.now()
-        # flist = []
-        result = []
-        for i in files_list:
-            start_ts = time.time()
-            r = pcapfile.create_index(i.stem)
-            log.info(f"   ====> Index manager: {time.time() - start_ts:.3}")
-            result.append(r)
-
-        # result.sort(key=lambda a: a[0])
-        pcapfile.build_master_index(result, clean=True)
-        ttl_time = datetime.now() - start_time
-        log.info(f"---> Total Index Time: {ttl_time}")
+        self.update_index(map, pcapfile, rebuild)
 
-    def create_index(self):
-        FileManager.clean_indexes()
-        path = Path(Config.pcap_path())
-        files_list = list(path.glob("*.pcap"))
+    def create_index(self, rebuild: bool = False):
         pcapfile = PcapFile()
-        pool = mp.Pool(Config.nbr_threads())
+        with mp.Pool(Config.nbr_threads()) as pool:
+            self.update_index(pool.imap_unordered, pcapfile, rebuild)
+
+    def update_index(self, map_fn, pcapfile: PcapFile, rebuild: bool = False):
+        """
+        Index the new and changed pcap files only, every file is recorded
+        in the manifest as soon as its index is complete so an interrupted
+        run resumes where it stopped
+        """
         start_time = datetime.now()
-        flist = []
-        for i in files_list:
-            flist.append(i.stem)
-        result = pool.map(pcapfile.create_index, flist)
-        # result.sort(key=lambda a: a[0])
-        pcapfile.build_master_index(result, clean=True)
+        manifest = IndexManifest()
+
+        if rebuild:
+            FileManager.clean_indexes()
+            manifest.clear()
+
+        pcap_files = {int(f.stem): f for f in Path(
+            Config.pcap_path()).glob("*.pcap") if f.stem.isdigit()}
+
+        # --- Captures removed from the store
+        for file_id in set(manifest.file_ids()) - pcap_files.keys():
+            self.remove_index(file_id)
+            manifest.remove(file_id)
+
+        flist = [file_id for file_id, filename in pcap_files.items()
+                 if not manifest.is_current(file_id, filename)]
+
+        # --- A changed or removed file merged in a segment invalidates the
+        #     segment, its other files are indexed again
+        catalog = SegmentCatalog.load()
+        removed = catalog.covered.keys() - pcap_files.keys()
+        for name in {catalog.covered[f] for f in flist + list(removed) if f in catalog.covered}:
+            segment = catalog.segments[name]
+            SegmentDirectory.filename(name).unlink(missing_ok=True)
+            flist.extend(f for f in segment.file_ids if f not in flist and f in pcap_files)
+
+        log.info(f"{len(flist)} of {len(pcap_files)} pcap files to index")
+
+        for first_ts, last_ts, file_id in map_fn(pcapfile.create_index, flist):
+            manifest.record(file_id, pcap_files[file_id], (first_ts, last_ts))
+
+        manifest.close()
+
+        # --- Pick up the new files in the in memory copy of this process
+        MasterIndex.instance().refresh()
+
         ttl_time = datetime.now() - start_time
         log.info(f"---> Total Index Time: {ttl_time}")
 
+    def remove_index(self, file_id: int):
+        path = Path(Config.pcap_index())
+        for filename in list(path.glob(f"{file_id}.*")) + list(path.glob(f"{file_id}_*.plst")):
+            filename.unlink(missing_ok=True)
+
     def chunk_size(self, proto: int) -> int:
         result = []
         db_filename = Config.dbase_path() + "/mindex/packetdb.db"
@@ -78,92 +135,122 @@ class IndexManager:
 
     def search_id(self, id_list: list[int]):
         result = []
+        readers = PcapReaderPool()
 
         for id in id_list:
             file_id = id >> 32
-            ptr = id & 0xffff
+            ptr = id & 0xffffffff
             log.debug(f"ID PCAPfile: {file_id}")
 
             pcapfile = PcapFile()
-            pcapfile.open(file_id)
+            pcapfile.open(file_id, readers.get(file_id))
 
             pkt = pcapfile.get_packet_by_id(ptr)
 
             if pkt:
                 result.append(pkt)
 
+        readers.close()
         return result
 
-    def search_proto(self, file_id: int, proto_id: int, ip_list: dict[str, list[Tuple[int, int]]]):
-        result = []
+    def search_proto(self, file_id: int, proto_id: int, plan: IndexPlan):
         proto_index = ProtoIndex(file_id, proto_id)
-        index_list = proto_index.load(file_id, proto_id)
-
-        for idx in index_list:
-            # (ts, ptr, index, dst_ip, src_ip, hdr_len,
-            #  dport, sport) = unpack(">IIIIIHHH", buffer)
-            # log.debug(f"TS: {ts:x}, ptr: {ptr:x}, Index:{index:x} ")
-            # log.debug(f"Search index: {search_index:x}:{index:x}")
-            found = True
-
-            if len(ip_list["ip.dst"]) > 0:
-                ip_search = Ipv4Search(ip_list["ip.dst"])
-                found = idx.ip_dst in ip_search
-
-            if len(ip_list["ip.src"]) > 0:
-                ip_search = Ipv4Search(ip_list["ip.src"])
-                found = idx.ip_src in ip_search
-
-            if found:
-                pkt = PktPtr(file_id=file_id,
-                             ptr=idx.ptr, ip_dst=0, ip_src=0, pkt_hdr_size=0)
-                # log.debug(f"PTR index: {pkt.file_id}:{pkt.ptr}")
-                result.append(pkt)
+        lines = proto_index.load(file_id, proto_id)
 
-        return result
+        # --- Lines only hold the addresses, the other predicates match every line
+        mask = plan.mask(lines)
+
+        return [PktPtr(file_id=file_id, ptr=ptr, ip_dst=0, ip_src=0, pkt_hdr_size=0)
+                for ptr in lines.ptr[mask].tolist()]
+
+    def search_pkt(self, file_id: Path, plan: IndexPlan, interval: Tuple[int, int] = (0, 0),
+                   segment: SegmentDirectory | None = None):
+        index_file = IndexFile(file_id)
+        ordinals, records = self.select(index_file, plan, interval)
+        ptr_list = records["ptr"]
+
+        if segment is None:
+            return [PktPtr(file_id=int(index_file.file_id), ptr=ptr, ip_dst=0, ip_src=0, pkt_hdr_size=0)
+                    for ptr in ptr_list.tolist()]
+
+        # --- Records of a segment belong to several pcap files, newest file first
+        # --- like the per file search
+        pcap_ids = segment.file_of(ordinals).astype(np.int64)
+        order = np.lexsort((ordinals, -pcap_ids))
+
+        return [PktPtr(file_id=pcap_id, ptr=ptr, ip_dst=0, ip_src=0, pkt_hdr_size=0)
+                for pcap_id, ptr in zip(pcap_ids[order].tolist(), ptr_list[order].tolist())]
+
+    def select(self, index_file: IndexFile, plan: IndexPlan,
+               interval: Tuple[int, int] = (0, 0)) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ordinals and records of an index file matching the plan, the candidate
+        records come from the protocol bitmaps, the flow index, the posting
+        lists and the time index combined like the predicates of the query
+        """
+        index_file.open()
+        candidates = plan.ordinals(FileIndexes(index_file.file_id, index_file.nbr_records))
+
+        ordinals, records = index_file.read(interval, candidates)
+        mask = plan.mask(records)
+
+        return (ordinals[mask], records[mask])
+
+    def follow_stream(self, file_id: int, ptr: int) -> list[PktPtr]:
+        """
+        Packets of the flow of a packet in every index file, in capture order
+        """
+        catalog = SegmentCatalog.load()
+        key = self.flow_key(catalog, file_id, ptr)
+        if key is None:
+            return []
 
-    def search_pkt(self, file_id: Path, search_index: int, ip_list: dict[str, list[Tuple[int, int]]]):
         result = []
+        for filename in catalog.resolve(list(Path(Config.pcap_index()).glob("*.pidx"))):
+            flow_index = FlowIndex(index_id(filename))
+            if not flow_index.exists:
+                continue
 
-        with open(str(file_id), "rb") as f:
-            while True:
-                buffer = f.read(26)
+            ordinals = flow_index.load().ordinals(flow_index.find(key))
+            if len(ordinals) == 0:
+                continue
 
-                if len(buffer) != 26:
-                    break
+            segment = catalog.get(filename)
+            ptr_list = IndexFile(filename).load()["ptr"][ordinals].tolist()
+            pcap_ids = segment.file_of(ordinals).tolist() if segment is not None else [index_id(filename)] * len(ordinals)
+            result += [(int(pcap_id), ptr) for pcap_id, ptr in zip(pcap_ids, ptr_list)]
 
-                (ts, ptr, index, dst_ip, src_ip, hdr_len,
-                 dport, sport) = unpack(">IIIIIHHH", buffer)
-                # log.debug(f"TS: {ts:x}, ptr: {ptr:x}, Index:{index:x} ")
-                found = False
-                if (index & search_index) == search_index:
-                    # log.debug(f"Search index: {search_index:x}:{index:x}")
-                    found = True
+        return [PktPtr(file_id=pcap_id, ptr=ptr, ip_dst=0, ip_src=0, pkt_hdr_size=0)
+                for pcap_id, ptr in sorted(result)]
 
-                    if len(ip_list["ip.dst"]) > 0:
-                        ip_search = Ipv4Search(ip_list["ip.dst"])
-                        found = dst_ip in ip_search
+    def flow_key(self, catalog: SegmentCatalog, file_id: int, ptr: int) -> Tuple[int, ...] | None:
+        """
+        5-tuple of the flow of a packet, from the flow index of its file
+        """
+        segment = catalog.segments.get(catalog.covered.get(file_id, ""))
+        name = segment.name if segment is not None else file_id
 
-                    if len(ip_list["ip.src"]) > 0:
-                        ip_search = Ipv4Search(ip_list["ip.src"])
-                        found = src_ip in ip_search
+        flow_index = FlowIndex(name)
+        if not flow_index.exists:
+            return None
 
-                    if len(ip_list['dport']) > 0:
-                        found = dport in ip_list['dport']
+        records = IndexFile(Path(f"{Config.pcap_index()}/{name}.pidx")).load()
+        start, end = 0, len(records)
+        if segment is not None:
+            entry = segment.entries[segment.entries["file_id"] == file_id][0]
+            start, end = int(entry["start"]), int(entry["start"]) + int(entry["nbr_records"])
 
-                    if len(ip_list['sport']) > 0:
-                        log.error(f"Found sport: {ip_list['sport'][0]}")
-                        found = sport in ip_list['sport']
+        position = np.flatnonzero(records["ptr"][start:end] == ptr)
+        if len(position) == 0:
+            return None
 
-                if found:
-                    pkt = PktPtr(file_id=int(file_id.stem),
-                                 ptr=ptr, ip_dst=0, ip_src=0, pkt_hdr_size=0)
-                    # log.debug(f"PTR index: {pkt.file_id}:{pkt.ptr}")
-                    result.append(pkt)
+        flow = flow_index.load().flow_of(start + int(position[0]))
+        if flow is None:
+            return None
 
-        return result
+        return tuple(int(flow_index.flows[field][flow]) for field in FLOW_KEY)
 
-    def proto_index_files(self, proto: str) -> list[int]:
+    def proto_index_files(self, proto: str) -> list[Path]:
         file_pattern = ""
 
         match proto:
@@ -214,33 +301,98 @@ class IndexManager:
         log.debug(f">>> FOUND {len(files_list)} proto")
         return files_list
 
-    def has_proto_index(self, proto_list: list[str]) -> str:
-        proto_def = ["ETH_PROTO_ARP", "DHCP",
-                     "RDP", "DNS", "TELNET", "SSH", "HTTP", "HTTPS", "NTP", "SMB"]
+    def has_proto_index(self, plan: IndexPlan) -> list[str]:
+        """
+        Legacy protocol indexes holding every packet of the plan, one for
+        each protocol alternative, empty when an alternative has none
+        """
+        alternatives = plan.protocols()
+        if not alternatives:
+            return []
+
+        result = []
+        for bits in alternatives:
+            protos = [proto for proto, proto_bits in LEGACY_PROTOS.items() if bits & proto_bits]
+            if len(protos) == 0:
+                return []
+
+            if protos[0] not in result:
+                result.append(protos[0])
 
-        for proto in proto_def:
-            if proto in proto_list:
-                return proto
+        return result
 
-        return None
+    def has_proto_bitmaps(self) -> bool:
+        return any(Path(Config.pcap_index()).glob("*.pbmp"))
 
-    def search(self, model: SelectStatement) -> Generator[Any, Any, Any]:
+    def covers(self, model: SelectStatement) -> bool:
+        """
+        True when the query is an aggregate the index records can answer alone
+        """
+        if not model.has_aggregate or model.has_groupby or model.has_id:
+            return False
+
+        for aggr in model.aggregate:
+            if not isinstance(aggr, Count) and aggr.fieldname not in RECORD_FIELDS:
+                return False
+
+        return query_plan(model).exact
+
+    def search_records(self, model: SelectStatement) -> list[np.ndarray] | None:
+        """
+        Records matching the query in every index file, None when an index
+        file has no wide records
+        """
+        plan = query_plan(model)
+        files_list, proto_search, _ = self.search_files(model, plan)
+        if proto_search:
+            return None
+
+        index_files = [IndexFile(filename).open() for filename in files_list]
+        if any(index_file.layout != LAYOUT_WIDE for index_file in index_files):
+            return None
+
+        result = []
+        for index_file in index_files:
+            if not self.zone_match(index_file.file_id, plan):
+                continue
+
+            result.append(self.select(index_file, plan, model.interval)[1])
+
+        return result
+
+    def search_files(self, model: SelectStatement, plan: IndexPlan) -> Tuple[list[Path], bool, SegmentCatalog]:
+        """
+        Index files to search, newest first, and whether they are legacy
+        per protocol files
+        """
         proto_search = False
 
         log.debug(f"Search index started: {model.index_field}")
 
         # --- Check for interval
         if model.has_interval:
-            files_list = self.search_interval(model)
-        elif proto := self.has_proto_index(model.index_field):
+            files_list = self.search_interval(model) or []
+        elif (protos := self.has_proto_index(plan)) and not self.has_proto_bitmaps():
+            # --- Legacy per protocol index files
             proto_search = True
-            log.debug(f"-----> PROTO SEARCH: {proto}")
-            files_list = self.proto_index_files(proto)
+            log.debug(f"-----> PROTO SEARCH: {protos}")
+            files_list = [filename for proto in protos for filename in self.proto_index_files(proto)]
+            files_list.sort(key=lambda a: int(a.stem.split('_')[0]), reverse=True)
         else:
             log.debug("======== SHOULD NOT BE HERE =========")
             path = Path(Config.pcap_index())
             files_list = list(path.glob("*.pidx"))
-            files_list.sort(key=lambda a: int(a.stem), reverse=True)
+
+        # --- Files merged by the compaction are read from their segment
+        catalog = SegmentCatalog.load()
+        if not proto_search:
+            files_list = catalog.resolve(files_list)
+
+        return (files_list, proto_search, catalog)
+
+    def search(self, model: SelectStatement) -> Generator[Any, Any, Any]:
+        plan = query_plan(model)
+        files_list, proto_search, catalog = self.search_files(model, plan)
 
         # # --- Check for interval
         # if model.has_interval:
@@ -250,25 +402,77 @@ class IndexManager:
         #     files_list = list(path.glob("*.pidx"))
         #     files_list.sort(key=lambda a: int(a.stem), reverse=True)
 
-        search_index = pkt_index.build_search_index(model.index_field)
-
         log.info(f"Using {Config.nbr_threads()} threads for index search")
         result = []
+        pruned = 0
         for index_file in files_list:
+            if not self.zone_match(index_id(index_file), plan):
+                pruned += 1
+                continue
+
             if proto_search:
                 # log.debug(":::::::::::: In proto search :::::::::::")
                 (file_id, proto_id) = index_file.stem.split('_')
                 # log.debug(
                 #     f":::::::::::: {file_id}:{int(proto_id, 16):x}:::::::::::")
                 result = self.search_proto(
-                    int(file_id), int(proto_id, 16), model.ip_list)
+                    int(file_id), int(proto_id, 16), plan)
             else:
                 result = self.search_pkt(
-                    index_file, search_index, model.ip_list)
+                    index_file, plan, model.interval, catalog.get(index_file))
 
             for r in result:
                 yield (r)
 
+        log.debug(f"Zone maps pruned {pruned} of {len(files_list)} index files")
+
+    def dns_names(self, ip: int) -> list[str]:
+        """
+        Names answered with the address by the DNS responses of every
+        index file, read from the DNS indexes without decoding packets
+        """
+        files_list = SegmentCatalog.load().resolve(list(Path(Config.pcap_index()).glob("*.pidx")))
+
+        result = set()
+        for filename in files_list:
+            dns_index = DnsIndex(index_id(filename))
+            if dns_index.exists:
+                result.update(dns_index.load().resolve(ip))
+
+        return sorted(result)
+
+    def search_parallel(self, model: SelectStatement) -> Generator[PktPtr, None, None]:
+        """
+        Packets matching the query, filtered by the worker processes one
+        index file per task. Results are merged newest file first like the
+        sequential search, closing the generator cancels the pending tasks.
+        """
+        plan = query_plan(model)
+        files_list, proto_search, catalog = self.search_files(model, plan)
+
+        log.info(f"Using {Config.nbr_threads()} processes for {len(files_list)} index files")
+        executor = SearchPool.executor()
+        query = SearchPool.acquire()
+        futures = [executor.submit(search_worker, model, plan, index_file, proto_search,
+                                   None if proto_search else catalog.get(index_file), query)
+                   for index_file in files_list]
+
+        try:
+            for future in futures:
+                for file_id, ptr in future.result():
+                    yield PktPtr(file_id=file_id, ptr=ptr, ip_dst=0, ip_src=0, pkt_hdr_size=0)
+        finally:
+            SearchPool.release(query[0])
+            for future in futures:
+                future.cancel()
+
+    def zone_match(self, file_id: int | str, plan: IndexPlan) -> bool:
+        zone_map = ZoneMap.load(file_id)
+        if zone_map is None:
+            return True
+
+        return plan.may_match(zone_map)
+
     def search_interval(self, model: SelectStatement) -> None | list[Path]:
         if not model.has_interval:
             return None
@@ -276,24 +480,11 @@ class IndexManager:
         log.debug(
             f"Interval s: {model.start_interval}, e: {model.end_interval}")
 
-        conn = sqlite3.connect(Config.pcap_master_index())
-        c = conn.cursor()
-
-        params = (model.start_interval, model.end_interval,
-                  model.start_interval, model.end_interval)
-
-        sql = """
-                select * from master_index where start_ts >= ? and end_ts <= ?
-                union all
-                select * from master_index where ? >= start_ts and ? <= end_ts;
-
-              """
-
-        c.execute(sql, params)
+        master_index = MasterIndex.instance().refresh()
 
         result = []
-        for r in c.fetchall():
-            filename = f"{Config.pcap_index()}/{r[0]}.pidx"
+        for file_id in master_index.search(model.start_interval, model.end_interval):
+            filename = f"{Config.pcap_index()}/{file_id}.pidx"
             result.append(Path(filename))
 
         log.debug(f"Interval packets found: {len(result)}")
@@ -304,56 +495,124 @@ class IndexManager:
             yield l[i:i + n]
 
 
-class Ipv4Search:
-    def __init__(self, address_list: list[Tuple[int, int]]):
-        self.ip_list = address_list
-
-    def __contains__(self, search_ip: int) -> bool:
-        for addr in self.ip_list:
-            if self.is_in_network(search_ip, addr[0], addr[1]):
-                return True
-
-        return False
-
-    def is_in_network(self, address: int, searched_ip: int, mask: int) -> bool:
-        net, broadcast = self.net_broadcast(searched_ip, mask)
-        if address >= net and address <= broadcast:
-            return True
-
-        return False
-
-    def net_broadcast(self, ip: int, mask: int) -> Tuple[int, int]:
-        host_bits = 32 - mask
-        start = (ip >> host_bits) << host_bits  # clear the host bits
-        end = start | ((1 << host_bits) - 1)
-        return (start, end)
-
-    # def search_parallel(self, model: SelectStatement) -> Generator[Any, Any, Any]:
+class SearchPool:
+    """
+    Worker processes of the parallel searches, created on first use and
+    shared by the queries of the process.
 
-    #     log.debug(f"Search index started: {model.index_field}")
+    A running query owns a slot of the cancellation flags given to the
+    workers when they start. The slot holds the query generation and is
+    cleared to cancel it, a task of an older query sees another generation.
+    """
 
-    #     # --- Check for interval
-    #     interval_result = self.search_interval(model)
-    #     if interval_result:
-    #         log.info(f"{len(interval_result)} found in master index")
-    #         files_list = interval_result
-    #     else:
-    #         path = Path(Config.pcap_index())
-    #         files_list = list(path.glob("*.db"))
-    #         files_list.sort(key=lambda a: int(a.stem))
+    lock = threading.Condition()
+    pool: ProcessPoolExecutor | None = None
+    flags: Any = None
+    free_slots: list[int] = []
+    generation = 0
 
-    #     search_index = pkt_index.build_search_index(model.index_field)
-    #     pool = mp.Pool()
+    @classmethod
+    def executor(cls) -> ProcessPoolExecutor:
+        with cls.lock:
+            if cls.pool is None:
+                cls.flags = mp.Array("q", SEARCH_SLOTS, lock=False)
+                cls.free_slots = list(range(SEARCH_SLOTS))
+                cls.pool = ProcessPoolExecutor(max_workers=Config.nbr_threads(),
+                                               initializer=init_worker, initargs=(cls.flags,))
 
-    #     log.info(f"Using {Config.nbr_threads()} threads for index search")
+            return cls.pool
 
-    #     log.info(f"Using {Config.nbr_threads()} threads for index search")
-    #     for index_chunk in self.chunks(files_list, Config.nbr_threads()):
-    #         params = []
-    #         for idx in index_chunk:
-    #             params.append((idx, search_index, model.ip_list))
+    @classmethod
+    def acquire(cls) -> Tuple[int, int]:
+        """
+        Slot and generation of a new query, waits when every slot is taken
+        """
+        with cls.lock:
+            cls.lock.wait_for(lambda: len(cls.free_slots) > 0)
+            slot = cls.free_slots.pop()
+            cls.generation += 1
+            cls.flags[slot] = cls.generation
 
-    #         result = pool.starmap(self.search_pkt, params)
+            return (slot, cls.generation)
 
-    #         for r in result:
-    #             yield (r)
+    @classmethod
+    def release(cls, slot: int):
+        """
+        Cancel the tasks of the query and free its slot
+        """
+        with cls.lock:
+            if cls.flags is None:
+                return
+
+            cls.flags[slot] = 0
+            cls.free_slots.append(slot)
+            cls.lock.notify()
+
+    @classmethod
+    def shutdown(cls):
+        with cls.lock:
+            if cls.pool is not None:
+                cls.pool.shutdown(cancel_futures=True)
+                cls.pool = None
+                cls.flags = None
+                cls.free_slots = []
+
+
+# --- Cancellation flags of the queries, set in each worker process
+search_flags: Any = None
+
+
+def init_worker(flags):
+    global search_flags
+    search_flags = flags
+
+
+def cancelled(query: Tuple[int, int]) -> bool:
+    slot, generation = query
+    return search_flags[slot] != generation
+
+
+def search_worker(model: SelectStatement, plan: IndexPlan, index_file: Path, proto_search: bool,
+                  segment: SegmentDirectory | None, query: Tuple[int, int]) -> list[Tuple[int, int]]:
+    """
+    Filter the packets of an index file in a worker process, returns the
+    (file id, offset) of the matching packets in search order
+    """
+    if cancelled(query):
+        return []
+
+    index_mgr = IndexManager()
+    if not index_mgr.zone_match(index_id(index_file), plan):
+        return []
+
+    if proto_search:
+        (file_id, proto_id) = index_file.stem.split('_')
+        ptr_list = index_mgr.search_proto(int(file_id), int(proto_id, 16), plan)
+    else:
+        ptr_list = index_mgr.search_pkt(index_file, plan, model.interval, segment)
+
+    # --- A file gives no more rows to a plain select than the query returns
+    limit = None
+    if model.has_top and not (model.has_aggregate or model.has_groupby or model.has_distinct):
+        limit = model.packet_to_fetch + 1
+
+    # --- Closures don't pickle, each worker compiles the WHERE clause
+    where = WhereFilter(model.where_expr)
+
+    result = []
+    readers = PcapReaderPool()
+    try:
+        for batch in batched(ptr_list, FETCH_BATCH_MIN, FETCH_BATCH_MAX):
+            if cancelled(query):
+                break
+
+            readers.fetch(batch)
+            result += [(pkt_ptr.file_id, pkt_ptr.ptr) for pkt_ptr in batch
+                       if exec_program(where, pkt_ptr, readers, project=False) is not None]
+
+            if limit is not None and len(result) >= limit:
+                break
+    finally:
+        readers.close()
+
+    return result
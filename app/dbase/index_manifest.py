@@ -0,0 +1,139 @@
+import hashlib
+import logging
+import os
+import sqlite3
+from pathlib import Path
+from typing import Tuple
+
+from config.config import Config
+from pql.pcapfile import PcapFile
+
+log = logging.getLogger("packetdb")
+
+# --- Bytes hashed at the start and at the end of a pcap file
+FINGERPRINT_SIZE = 65536
+
+
+def fingerprint(filename: Path) -> str:
+    """
+    Hash of the size, the first and the last bytes of a pcap file, enough
+    to detect a replaced or rewritten capture without reading all of it
+    """
+    size = os.path.getsize(filename)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+
+    with open(filename, "rb") as f:
+        digest.update(f.read(FINGERPRINT_SIZE))
+        if size > FINGERPRINT_SIZE:
+            f.seek(max(FINGERPRINT_SIZE, size - FINGERPRINT_SIZE))
+            digest.update(f.read(FINGERPRINT_SIZE))
+
+    return digest.hexdigest()
+
+
+class IndexManifest:
+    """
+    Pcap files already indexed with their size, mtime, fingerprint and the
+    index format and layout used. A file is recorded with its master index row in the
+    same transaction once all its index files are written, an interrupted
+    indexing leaves the file unrecorded and it is indexed again next time.
+    """
+
+    def __init__(self, db_name: str | None = None):
+        self.db_name = db_name if db_name is not None else Config.pcap_master_index()
+        self.conn = sqlite3.connect(self.db_name)
+        self.create_tables()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def create_tables(self) -> None:
+        c = self.conn.cursor()
+        PcapFile().create_master_table(c)
+        c.execute("""
+                    create table if not exists index_manifest (
+                        file_id integer primary key,
+                        size integer not null,
+                        mtime integer not null,
+                        fingerprint text not null,
+                        index_format integer not null,
+                        index_layout integer not null
+                        );
+                    """)
+
+        # --- Manifest written before the layout was recorded, its files are
+        #     indexed again
+        columns = [row[1] for row in c.execute("pragma table_info(index_manifest);")]
+        if "index_layout" not in columns:
+            c.execute("alter table index_manifest add column index_layout integer not null default 0;")
+        self.conn.commit()
+
+    def clear(self) -> None:
+        c = self.conn.cursor()
+        c.execute("delete from index_manifest;")
+        c.execute("delete from master_index;")
+        self.conn.commit()
+
+    def file_ids(self) -> list[int]:
+        c = self.conn.cursor()
+        c.execute("select file_id from index_manifest;")
+        return [r[0] for r in c.fetchall()]
+
+    def is_current(self, file_id: int, filename: Path) -> bool:
+        """
+        True when the file was indexed with the current format and layout and
+        did not change since, a new mtime with the same content only updates the entry
+        """
+        c = self.conn.cursor()
+        c.execute("""
+                    select size, mtime, fingerprint, index_format, index_layout
+                    from index_manifest where file_id = ?;
+                    """, (file_id,))
+        row = c.fetchone()
+        if row is None:
+            return False
+
+        size, mtime, file_fingerprint, index_format, index_layout = row
+        stat = os.stat(filename)
+        if index_format != Config.index_format() or index_layout != Config.index_layout():
+            return False
+
+        if size != stat.st_size:
+            return False
+
+        if mtime == stat.st_mtime_ns:
+            return True
+
+        if file_fingerprint != fingerprint(filename):
+            return False
+
+        c.execute("update index_manifest set mtime = ? where file_id = ?;",
+                  (stat.st_mtime_ns, file_id))
+        self.conn.commit()
+        return True
+
+    def record(self, file_id: int, filename: Path, interval: Tuple[int | None, int | None]):
+        """
+        Record an indexed file and replace its master index row
+        """
+        stat = os.stat(filename)
+        c = self.conn.cursor()
+
+        c.execute("delete from master_index where file_id = ?;", (file_id,))
+        if interval[0] is not None:
+            c.execute("INSERT INTO master_index (start_ts, end_ts, file_id) VALUES (?,?,?)",
+                      (interval[0], interval[1], file_id))
+
+        c.execute("""
+                    insert or replace into index_manifest (file_id, size, mtime, fingerprint, index_format,
+                                                           index_layout)
+                    values (?,?,?,?,?,?);
+                    """, (file_id, stat.st_size, stat.st_mtime_ns, fingerprint(filename), Config.index_format(),
+                          Config.index_layout()))
+        self.conn.commit()
+
+    def remove(self, file_id: int):
+        c = self.conn.cursor()
+        c.execute("delete from master_index where file_id = ?;", (file_id,))
+        c.execute("delete from index_manifest where file_id = ?;", (file_id,))
+        self.conn.commit()
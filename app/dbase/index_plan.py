@@ -0,0 +1,580 @@
+import logging
+from typing import Any, Tuple
+
+import numpy as np
+
+import pql.packet_index as pkt_index
+from dbase.dns_index import DnsIndex
+from dbase.flow_index import FlowIndex
+from dbase.host_index import HOST_FIELDS, HostIndex
+from dbase.index_file import conversation_mask
+from dbase.ipv4_search import Ipv4Search, network_range
+from dbase.name_index import NameIndex
+from dbase.posting_index import PostingIndex
+from dbase.proto_bitmap import ProtoBitmapIndex
+from dbase.time_index import TimeIndex
+from dbase.zone_map import ZoneMap
+from pql.model import (BinOp, Boolean, ConstDecl, Grouping, Integer, IPv4,
+                       Label, Mac, SelectStatement, String, Unary)
+from pql.pcapfile import POSTING_FIELDS
+from pql.tokens_list import Tokens
+
+log = logging.getLogger("packetdb")
+
+# --- Labels held by a column of the index records and the type of their values
+LABEL_COLUMNS = {
+    "ip.src": ("ip_src", IPv4),
+    "ip.dst": ("ip_dst", IPv4),
+    "tcp.sport": ("sport", Integer),
+    "tcp.dport": ("dport", Integer),
+    "udp.sport": ("sport", Integer),
+    "udp.dport": ("dport", Integer),
+    "ip.ttl": ("ttl", Integer),
+    "eth.vlan": ("vlan", Integer),
+    "eth.src": ("eth_src", Mac),
+    "eth.dst": ("eth_dst", Mac),
+    "frame.ts_sec": ("ts", Integer),
+    "frame.timestamp": ("ts", Integer),
+}
+
+# --- Labels with a dictionary of their values built at index time
+NAME_LABELS = ("dns.query",) + HOST_FIELDS
+
+COLUMN_MAX = 0xffffffff
+
+RANGE_OPS = (Tokens.TOK_EQ, Tokens.TOK_NE, Tokens.TOK_LT,
+             Tokens.TOK_LE, Tokens.TOK_GT, Tokens.TOK_GE)
+
+
+class FileIndexes:
+    """
+    Secondary indexes of an index file, loaded on first use, None when
+    the index file has no such index
+    """
+
+    def __init__(self, file_id: int | str, nbr_records: int):
+        self.file_id = file_id
+        self.nbr_records = nbr_records
+        self.cache: dict[str, Any] = {}
+
+    def get(self, key: str, index):
+        if key not in self.cache:
+            try:
+                self.cache[key] = index.load() if index.exists else None
+            except ValueError as error:
+                # --- Written by another version, the index is not used
+                log.error(error)
+                self.cache[key] = None
+
+        return self.cache[key]
+
+    def proto_bitmap(self) -> ProtoBitmapIndex | None:
+        return self.get("proto", ProtoBitmapIndex(self.file_id))
+
+    def posting(self, column: str) -> PostingIndex | None:
+        return self.get(column, PostingIndex(self.file_id, column))
+
+    def flow_index(self) -> FlowIndex | None:
+        return self.get("flow", FlowIndex(self.file_id))
+
+    def time_index(self) -> TimeIndex | None:
+        return self.get("time", TimeIndex(self.file_id))
+
+    def dns_index(self) -> DnsIndex | None:
+        return self.get("dns", DnsIndex(self.file_id))
+
+    def host_index(self) -> HostIndex | None:
+        return self.get("host", HostIndex(self.file_id))
+
+
+class IndexPlan:
+    """
+    Node of the boolean expression of the index predicates of a query.
+
+    mask evaluates the node over an array of records, a column missing from
+    the records matches every record. ordinals returns a superset of the
+    matching records from the secondary indexes, None when no index can be
+    used. A node is exact when it selects exactly the packets of its part
+    of the WHERE clause.
+    """
+
+    exact = True
+    exact_ordinals = False
+    columns: frozenset[str] = frozenset()
+
+    def evaluable(self, records: np.ndarray) -> bool:
+        return self.columns <= set(records.dtype.names or ())
+
+    def mask(self, records: np.ndarray) -> np.ndarray:
+        return np.ones(len(records), dtype=bool)
+
+    def ordinals(self, indexes: FileIndexes) -> np.ndarray | None:
+        return None
+
+    def may_match(self, zone_map: ZoneMap) -> bool:
+        return True
+
+    def protocols(self) -> list[int] | None:
+        """
+        Protocol bits of the alternatives of the node, a record of every
+        alternative has all its bits. None when any protocol can match.
+        """
+        return None
+
+
+class AnyRecord(IndexPlan):
+    """
+    Predicate the index can't evaluate, every record may match
+    """
+
+    def __init__(self, exact: bool = False):
+        self.exact = exact
+
+    def __repr__(self):
+        return f"AnyRecord({self.exact})"
+
+
+class Proto(IndexPlan):
+    exact_ordinals = True
+    columns = frozenset({"proto"})
+
+    def __init__(self, bits: int):
+        self.bits = bits
+
+    def __repr__(self):
+        return f"Proto(0x{self.bits:x})"
+
+    def mask(self, records: np.ndarray) -> np.ndarray:
+        if not self.evaluable(records):
+            return super().mask(records)
+
+        return (records["proto"] & self.bits) == self.bits
+
+    def ordinals(self, indexes: FileIndexes) -> np.ndarray | None:
+        proto_bitmap = indexes.proto_bitmap()
+        if proto_bitmap is None:
+            return None
+
+        bitmap = proto_bitmap.match_all(self.bits)
+        return bitmap.to_ordinals() if bitmap is not None else None
+
+    def may_match(self, zone_map: ZoneMap) -> bool:
+        return (zone_map.proto & self.bits) == self.bits
+
+    def protocols(self) -> list[int] | None:
+        return [self.bits]
+
+
+class Range(IndexPlan):
+    """
+    Values of a record column between low and high inclusively
+    """
+
+    def __init__(self, column: str, low: int, high: int):
+        self.column = column
+        self.low = low
+        self.high = high
+        self.columns = frozenset({column})
+        self.exact_ordinals = column in POSTING_FIELDS
+
+    def __repr__(self):
+        return f"Range({self.column}, {self.low}, {self.high})"
+
+    def mask(self, records: np.ndarray) -> np.ndarray:
+        if not self.evaluable(records):
+            return super().mask(records)
+
+        column = records[self.column]
+        return (column >= self.low) & (column <= self.high)
+
+    def ordinals(self, indexes: FileIndexes) -> np.ndarray | None:
+        if self.column in POSTING_FIELDS:
+            posting = indexes.posting(self.column)
+            return posting.range(self.low, self.high) if posting is not None else None
+
+        if self.column == "ts":
+            # --- Blocks of the time index, a superset of the interval
+            time_index = indexes.time_index()
+            if time_index is None:
+                return None
+
+            start, end = time_index.ordinal_range(self.low, self.high)
+            return np.arange(start, end, dtype=np.int64)
+
+        return None
+
+    def may_match(self, zone_map: ZoneMap) -> bool:
+        match self.column:
+            case "ip_src":
+                return self.low <= zone_map.max_ip_src and self.high >= zone_map.min_ip_src
+            case "ip_dst":
+                return self.low <= zone_map.max_ip_dst and self.high >= zone_map.min_ip_dst
+            case "sport" | "dport":
+                return bool(np.any((zone_map.ports >= self.low) & (zone_map.ports <= self.high)))
+            case "ts":
+                return self.low <= zone_map.max_ts and self.high >= zone_map.min_ts
+
+        return True
+
+
+class Conversation(IndexPlan):
+    exact_ordinals = True
+    columns = frozenset({"ip_src", "ip_dst"})
+
+    def __init__(self, address_a: Tuple[int, int], address_b: Tuple[int, int]):
+        self.address_a = address_a
+        self.address_b = address_b
+
+    def __repr__(self):
+        return f"Conversation({self.address_a}, {self.address_b})"
+
+    def mask(self, records: np.ndarray) -> np.ndarray:
+        if not self.evaluable(records):
+            return super().mask(records)
+
+        return conversation_mask(records["ip_src"], records["ip_dst"], [(self.address_a, self.address_b)])
+
+    def ordinals(self, indexes: FileIndexes) -> np.ndarray | None:
+        flow_index = indexes.flow_index()
+        if flow_index is None:
+            return None
+
+        return flow_index.ordinals(flow_index.conversation(self.address_a, self.address_b))
+
+    def may_match(self, zone_map: ZoneMap) -> bool:
+        search_a = Ipv4Search.compile([self.address_a])
+        search_b = Ipv4Search.compile([self.address_b])
+        return ((search_a.overlaps(zone_map.min_ip_src, zone_map.max_ip_src) and
+                 search_b.overlaps(zone_map.min_ip_dst, zone_map.max_ip_dst)) or
+                (search_b.overlaps(zone_map.min_ip_src, zone_map.max_ip_src) and
+                 search_a.overlaps(zone_map.min_ip_dst, zone_map.max_ip_dst)))
+
+
+class TcpFlag(IndexPlan):
+    columns = frozenset({"tcp_flags"})
+
+    def __init__(self, flag: int, value: bool):
+        self.flag = flag
+        self.value = value
+
+    def __repr__(self):
+        return f"TcpFlag(0x{self.flag:x}, {self.value})"
+
+    def mask(self, records: np.ndarray) -> np.ndarray:
+        if not self.evaluable(records):
+            return super().mask(records)
+
+        return ((records["tcp_flags"] & self.flag) != 0) == self.value
+
+
+class NameMatch(IndexPlan):
+    """
+    Packets with a DNS query name, TLS server name or HTTP host equal to a
+    name or under a "*." domain, or with an HTTP URI equal to a string.
+    The records hold no name, the packets are checked once decoded.
+    """
+
+    exact = False
+
+    def __init__(self, label: str, name: String):
+        self.label = label
+        self.name = name
+
+    def __repr__(self):
+        return f"NameMatch({self.label}, {self.name.value})"
+
+    def ordinals(self, indexes: FileIndexes) -> np.ndarray | None:
+        names: NameIndex | None = None
+        if self.label == "dns.query":
+            dns_index = indexes.dns_index()
+            names = dns_index.queries if dns_index is not None else None
+        else:
+            host_index = indexes.host_index()
+            names = host_index.fields[self.label] if host_index is not None else None
+
+        if names is None:
+            return None
+
+        if self.name.is_suffix and not names.exact:
+            return names.suffix(self.name.value[2:])
+
+        return names.lookup(self.name.value)
+
+
+class And(IndexPlan):
+    def __init__(self, children: list[IndexPlan]):
+        self.children = children
+        self.exact = all(child.exact for child in children)
+        self.exact_ordinals = all(child.exact_ordinals for child in children)
+        self.columns = frozenset().union(*(child.columns for child in children))
+
+    def __repr__(self):
+        return f"And({self.children})"
+
+    def mask(self, records: np.ndarray) -> np.ndarray:
+        mask = np.ones(len(records), dtype=bool)
+        for child in self.children:
+            mask &= child.mask(records)
+
+        return mask
+
+    def ordinals(self, indexes: FileIndexes) -> np.ndarray | None:
+        negated = [child for child in self.children if isinstance(child, Not)]
+
+        result = None
+        for child in self.children:
+            if child in negated:
+                continue
+
+            ordinals = child.ordinals(indexes)
+            if ordinals is None:
+                continue
+
+            result = ordinals if result is None else np.intersect1d(result, ordinals, assume_unique=True)
+            if len(result) == 0:
+                return result
+
+        # --- Negated predicates are a difference with the candidates found so far
+        for child in negated:
+            if result is None:
+                ordinals = child.ordinals(indexes)
+                if ordinals is not None:
+                    result = ordinals
+            elif child.exact_ordinals:
+                excluded = child.child.ordinals(indexes)
+                if excluded is not None:
+                    result = np.setdiff1d(result, excluded, assume_unique=True)
+
+        return result
+
+    def may_match(self, zone_map: ZoneMap) -> bool:
+        return all(child.may_match(zone_map) for child in self.children)
+
+    def protocols(self) -> list[int] | None:
+        result = None
+        for child in self.children:
+            alternatives = child.protocols()
+            if alternatives is None:
+                continue
+
+            result = alternatives if result is None else [
+                bits | other for bits in result for other in alternatives]
+
+        return result
+
+
+class Or(IndexPlan):
+    def __init__(self, children: list[IndexPlan]):
+        self.children = children
+        self.exact = all(child.exact for child in children)
+        self.exact_ordinals = all(child.exact_ordinals for child in children)
+        self.columns = frozenset().union(*(child.columns for child in children))
+
+    def __repr__(self):
+        return f"Or({self.children})"
+
+    def mask(self, records: np.ndarray) -> np.ndarray:
+        mask = np.zeros(len(records), dtype=bool)
+        for child in self.children:
+            mask |= child.mask(records)
+
+        return mask
+
+    def ordinals(self, indexes: FileIndexes) -> np.ndarray | None:
+        result = []
+        children = self.children
+
+        # --- Tests of a single protocol are read with one pass over the
+        #     protocol bitmaps
+        protos = [child for child in children if isinstance(child, Proto) and child.bits & (child.bits - 1) == 0]
+        if len(protos) > 1 and (proto_bitmap := indexes.proto_bitmap()) is not None:
+            bits = 0
+            for proto in protos:
+                bits |= proto.bits
+
+            bitmap = proto_bitmap.match_any(bits)
+            if bitmap is not None:
+                result.append(bitmap.to_ordinals())
+                children = [child for child in children if child not in protos]
+
+        for child in children:
+            ordinals = child.ordinals(indexes)
+            if ordinals is None:
+                return None
+
+            result.append(ordinals)
+
+        return np.unique(np.concatenate(result))
+
+    def may_match(self, zone_map: ZoneMap) -> bool:
+        return any(child.may_match(zone_map) for child in self.children)
+
+    def protocols(self) -> list[int] | None:
+        result = []
+        for child in self.children:
+            alternatives = child.protocols()
+            if alternatives is None:
+                return None
+
+            result += alternatives
+
+        return result
+
+
+class Not(IndexPlan):
+    """
+    Complement of an exact node, the complement of a superset is unknown
+    """
+
+    def __init__(self, child: IndexPlan):
+        self.child = child
+        self.exact = child.exact
+        self.exact_ordinals = child.exact and child.exact_ordinals
+        self.columns = child.columns
+
+    def __repr__(self):
+        return f"Not({self.child})"
+
+    def mask(self, records: np.ndarray) -> np.ndarray:
+        if not self.exact or not self.child.evaluable(records):
+            return super().mask(records)
+
+        return ~self.child.mask(records)
+
+    def ordinals(self, indexes: FileIndexes) -> np.ndarray | None:
+        if not self.exact_ordinals:
+            return None
+
+        excluded = self.child.ordinals(indexes)
+        if excluded is None:
+            return None
+
+        return np.setdiff1d(np.arange(indexes.nbr_records, dtype=np.int64), excluded, assume_unique=True)
+
+
+def label_proto(label: str) -> IndexPlan | None:
+    """
+    Protocol of a field, a packet without the protocol never matches it
+    """
+    if "." not in label:
+        return None
+
+    bits = pkt_index.build_search_index({label.split(".")[0].upper()})
+    return Proto(bits) if bits != 0 else None
+
+
+def labels_of(node) -> list[str]:
+    if isinstance(node, Label):
+        return [node.value]
+
+    if isinstance(node, BinOp):
+        return labels_of(node.left) + labels_of(node.right)
+
+    if isinstance(node, (Unary, Grouping)):
+        return labels_of(node.value)
+
+    return []
+
+
+def conjunction(children: list[IndexPlan]) -> IndexPlan:
+    flat = []
+    for child in children:
+        flat += child.children if isinstance(child, And) else [child]
+
+    return flat[0] if len(flat) == 1 else And(flat)
+
+
+def relation_plan(node: BinOp) -> IndexPlan:
+    """
+    Plan of a comparison of a field with a constant
+    """
+    label = node.left.value
+    predicate: IndexPlan = AnyRecord()
+
+    if label in NAME_LABELS and node.op == Tokens.TOK_EQ and isinstance(node.right, String):
+        predicate = NameMatch(label, node.right)
+    elif label in pkt_index.TCP_FLAGS and node.op in (Tokens.TOK_EQ, Tokens.TOK_NE) and isinstance(node.right, Boolean):
+        predicate = TcpFlag(pkt_index.TCP_FLAGS[label], node.right.value == (node.op == Tokens.TOK_EQ))
+    elif label in LABEL_COLUMNS and node.op in RANGE_OPS and isinstance(node.right, LABEL_COLUMNS[label][1]):
+        column = LABEL_COLUMNS[label][0]
+
+        if isinstance(node.right, IPv4):
+            low, high = network_range(node.right.to_int, node.right.mask)
+            if node.op == Tokens.TOK_EQ:
+                predicate = Range(column, low, high)
+            elif node.op == Tokens.TOK_NE:
+                predicate = Not(Range(column, low, high))
+        elif isinstance(node.right, Mac):
+            value = node.right.to_int
+            if node.op == Tokens.TOK_EQ:
+                predicate = Range(column, value, value)
+            elif node.op == Tokens.TOK_NE:
+                predicate = Not(Range(column, value, value))
+        elif isinstance(node.right, Integer):
+            value = int(node.right.value)
+            match node.op:
+                case Tokens.TOK_EQ:
+                    predicate = Range(column, value, value)
+                case Tokens.TOK_NE:
+                    predicate = Not(Range(column, value, value))
+                case Tokens.TOK_LT:
+                    predicate = Range(column, 0, value - 1)
+                case Tokens.TOK_LE:
+                    predicate = Range(column, 0, value)
+                case Tokens.TOK_GT:
+                    predicate = Range(column, value + 1, COLUMN_MAX)
+                case Tokens.TOK_GE:
+                    predicate = Range(column, value, COLUMN_MAX)
+
+    proto = label_proto(label)
+    return conjunction([proto, predicate]) if proto is not None else predicate
+
+
+def expression_plan(node) -> IndexPlan:
+    """
+    Plan of a WHERE expression
+    """
+    if node is None:
+        return AnyRecord(exact=True)
+
+    if isinstance(node, Grouping):
+        return expression_plan(node.value)
+
+    if isinstance(node, ConstDecl):
+        bits = pkt_index.build_search_index({node.name})
+        return Proto(bits) if bits != 0 else AnyRecord()
+
+    if isinstance(node, Unary) and node.op == "!":
+        return Not(expression_plan(node.value))
+
+    if isinstance(node, BinOp) and node.op in (Tokens.TOK_LAND, Tokens.TOK_LOR):
+        node_type = And if node.op == Tokens.TOK_LAND else Or
+        children = []
+        for side in (node.left, node.right):
+            child = expression_plan(side)
+            children += child.children if isinstance(child, node_type) else [child]
+
+        return node_type(children)
+
+    if isinstance(node, BinOp) and node.op == Tokens.TOK_TO and isinstance(node.left, IPv4) and isinstance(node.right, IPv4):
+        return And([Proto(pkt_index.IPv4),
+                    Conversation((node.left.to_int, node.left.mask), (node.right.to_int, node.right.mask))])
+
+    if isinstance(node, BinOp) and isinstance(node.left, Label):
+        return relation_plan(node)
+
+    # --- Any other expression needs the protocols of its fields
+    protos = [proto for proto in map(label_proto, labels_of(node)) if proto is not None]
+    return conjunction(protos + [AnyRecord()])
+
+
+def query_plan(model: SelectStatement) -> IndexPlan:
+    """
+    Plan of the WHERE clause and the interval of a query
+    """
+    plan = expression_plan(model.where_expr)
+    if model.has_interval:
+        plan = conjunction([plan, Range("ts", model.start_interval, model.end_interval)])
+
+    log.debug(f"Index plan: {plan}")
+    return plan
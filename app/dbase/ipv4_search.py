@@ -0,0 +1,84 @@
+import logging
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+
+log = logging.getLogger("packetdb")
+
+
+def network_range(ip: int, netmask: int) -> Tuple[int, int]:
+    host_bits = 32 - int(netmask)
+    start = (ip >> host_bits) << host_bits
+    end = start | ((1 << host_bits) - 1)
+
+    return (start, end)
+
+
+class Ipv4Search:
+    """
+    Addresses and networks of a query compiled into sorted, non overlapping
+    intervals. An address is searched with one binary search whatever the
+    number of networks, a whole column with one searchsorted.
+    """
+
+    def __init__(self, address_list: list[Tuple[int, int]]):
+        self.ip_list = address_list
+
+        ranges = sorted(network_range(ip, netmask) for ip, netmask in address_list)
+        starts: list[int] = []
+        ends: list[int] = []
+        for start, end in ranges:
+            # --- Overlapping or adjacent networks become one interval
+            if len(ends) > 0 and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+        self.starts = starts
+        self.ends = ends
+        self.start_array = np.array(starts, dtype=np.int64)
+        self.end_array = np.array(ends, dtype=np.int64)
+
+    @classmethod
+    def compile(cls, address_list: list[Tuple[int, int]]) -> "Ipv4Search":
+        """
+        Matcher of an address list, shared by the files searched by a query
+        """
+        return cls._compile(tuple((int(ip), int(netmask)) for ip, netmask in address_list))
+
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def _compile(address_list: Tuple[Tuple[int, int], ...]) -> "Ipv4Search":
+        return Ipv4Search(list(address_list))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __contains__(self, search_ip: int) -> bool:
+        position = bisect_right(self.starts, search_ip) - 1
+        return position >= 0 and search_ip <= self.ends[position]
+
+    @property
+    def ranges(self) -> list[Tuple[int, int]]:
+        return list(zip(self.starts, self.ends))
+
+    def mask(self, column: np.ndarray) -> np.ndarray:
+        """
+        Records of the column inside one of the intervals
+        """
+        if len(self.starts) == 0:
+            return np.zeros(len(column), dtype=bool)
+
+        column = np.asarray(column, dtype=np.int64)
+        position = np.searchsorted(self.start_array, column, side="right") - 1
+        return (position >= 0) & (column <= self.end_array[np.maximum(position, 0)])
+
+    def overlaps(self, low: int, high: int) -> bool:
+        """
+        True when an interval intersects [low, high]
+        """
+        position = bisect_right(self.starts, high) - 1
+        return position >= 0 and self.ends[position] >= low
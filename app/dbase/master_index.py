@@ -0,0 +1,136 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import Tuple
+
+import numpy as np
+
+from config.config import Config
+
+log = logging.getLogger("packetdb")
+
+
+class MasterIndex:
+    """
+    In memory copy of the master_index table used to select the pcap files
+    of an interval.
+
+    Files are kept sorted by start timestamp with the running maximum of the
+    end timestamps, an overlap search is two binary searches and a mask over
+    the files in between. New rows of the table are appended incrementally.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, db_name: str | None = None):
+        self.db_name = db_name
+        self.reset()
+
+    @classmethod
+    def instance(cls) -> "MasterIndex":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = MasterIndex()
+
+            return cls._instance
+
+    @property
+    def filename(self) -> str:
+        return self.db_name if self.db_name is not None else Config.pcap_master_index()
+
+    def __len__(self) -> int:
+        return len(self.file_id)
+
+    def reset(self) -> None:
+        self.last_id = 0
+        self.signature: Tuple[str, int, int] | None = None
+        self.start_ts = np.empty(0, dtype=np.int64)
+        self.end_ts = np.empty(0, dtype=np.int64)
+        self.file_id = np.empty(0, dtype=np.int64)
+        self.max_end_ts = np.empty(0, dtype=np.int64)
+
+    def refresh(self) -> "MasterIndex":
+        """
+        Append the rows added to the table since the last refresh, the table
+        is only read when the database file changed
+        """
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            self.reset()
+            return self
+
+        signature = (self.filename, stat.st_mtime_ns, stat.st_size)
+        if signature == self.signature:
+            return self
+
+        if self.signature is not None and self.signature[0] != self.filename:
+            # --- Another database
+            self.reset()
+
+        with self._lock:
+            try:
+                conn = sqlite3.connect(self.filename)
+                try:
+                    c = conn.cursor()
+                    c.execute("select count(*) from master_index;")
+                    nbr_rows = c.fetchone()[0]
+                    c.execute(
+                        "select id, start_ts, end_ts, file_id from master_index where id > ? order by id;", (self.last_id,))
+                    rows = c.fetchall()
+
+                    # --- A file still being written is replaced by a new row
+                    replaced = np.isin(self.file_id, [r[3] for r in rows]).sum()
+                    if nbr_rows != len(self) - replaced + len(rows):
+                        # --- Table rebuilt, reload everything
+                        self.reset()
+                        c.execute(
+                            "select id, start_ts, end_ts, file_id from master_index order by id;")
+                        rows = c.fetchall()
+                finally:
+                    conn.close()
+            except sqlite3.OperationalError as e:
+                log.error(f"Master index not available: {e}")
+                return self
+
+            self.add(rows)
+            self.signature = signature
+
+        return self
+
+    def add(self, rows: list[Tuple[int, int, int, int]]):
+        """
+        Add (id, start_ts, end_ts, file_id) rows
+        """
+        if len(rows) == 0:
+            return
+
+        new_rows = np.array(rows, dtype=np.int64).reshape(-1, 4)
+        self.last_id = max(self.last_id, int(new_rows[:, 0].max()))
+
+        # --- Rows of a file already present replace the previous one
+        kept = ~np.isin(self.file_id, new_rows[:, 3])
+        start_ts = np.concatenate((self.start_ts[kept], new_rows[:, 1]))
+        end_ts = np.concatenate((self.end_ts[kept], new_rows[:, 2]))
+        file_id = np.concatenate((self.file_id[kept], new_rows[:, 3]))
+
+        if np.any(np.diff(start_ts) < 0):
+            order = np.argsort(start_ts, kind="stable")
+            start_ts, end_ts, file_id = start_ts[order], end_ts[order], file_id[order]
+
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.file_id = file_id
+        self.max_end_ts = np.maximum.accumulate(end_ts)
+
+    def search(self, start_ts: int, end_ts: int) -> list[int]:
+        """
+        Id of every file overlapping the interval, in start timestamp order
+        """
+        last = int(np.searchsorted(self.start_ts, end_ts, side="right"))
+        first = int(np.searchsorted(self.max_end_ts[:last], start_ts, side="left"))
+
+        mask = self.end_ts[first:last] >= start_ts
+        return self.file_id[first:last][mask].tolist()
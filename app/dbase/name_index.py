@@ -0,0 +1,139 @@
+import logging
+from hashlib import blake2b
+from struct import calcsize, pack, unpack_from
+from typing import BinaryIO, Tuple
+
+import numpy as np
+
+log = logging.getLogger("packetdb")
+
+# --- number of names, number of postings, size of the names
+NAME_HEADER = ">III"
+NAME_HEADER_SIZE = calcsize(NAME_HEADER)
+
+HASH_DTYPE = np.dtype(">u8")
+POSTING_DTYPE = np.dtype(">u4")
+
+
+def name_hash(name: str) -> int:
+    return int.from_bytes(blake2b(name.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def normalize(name: str) -> str:
+    return name.replace("\0", "").lower().rstrip(".")
+
+
+class NameIndex:
+    """
+    Dictionary of the names of an index file sorted by hash with the
+    ordinals of the records holding each name. Names are compared in
+    lower case, or byte for byte by an exact index, a name is found with
+    one binary search.
+    """
+
+    def __init__(self, exact: bool = False):
+        self.exact = exact
+        self.names: list[str] = []
+        self.hashes = np.empty(0, dtype=HASH_DTYPE)
+        self.starts = np.zeros(1, dtype=POSTING_DTYPE)
+        self.postings = np.empty(0, dtype=POSTING_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def key(self, name: str) -> str:
+        # --- The names are stored separated by NUL
+        return name.replace("\0", "") if self.exact else normalize(name)
+
+    def build(self, entries: list[Tuple[int, str]], names: list[str] | None = None) -> "NameIndex":
+        """
+        Index of the (ordinal, name) of the records, names adds names held
+        by no record
+        """
+        self.names = sorted({self.key(name) for _, name in entries} | {self.key(name) for name in names or []},
+                            key=name_hash)
+        self.hashes = np.array([name_hash(name) for name in self.names], dtype=HASH_DTYPE)
+
+        name_ids = self.name_ids()
+        postings = np.array(sorted({(name_ids[self.key(name)], ordinal) for ordinal, name in entries}),
+                            dtype=np.int64).reshape(-1, 2)
+        self.starts = np.searchsorted(postings[:, 0], np.arange(len(self.names) + 1)).astype(POSTING_DTYPE)
+        self.postings = postings[:, 1].astype(POSTING_DTYPE)
+
+        return self
+
+    def name_ids(self) -> dict[str, int]:
+        return {name: position for position, name in enumerate(self.names)}
+
+    def entries(self) -> list[Tuple[int, str]]:
+        """
+        (ordinal, name) of the records, the input of build
+        """
+        return [(int(ordinal), name) for position, name in enumerate(self.names)
+                for ordinal in self.postings[int(self.starts[position]):int(self.starts[position + 1])]]
+
+    def write(self, f: BinaryIO):
+        blob = "\0".join(self.names).encode("utf-8")
+        f.write(pack(NAME_HEADER, len(self.names), len(self.postings), len(blob)))
+        f.write(self.hashes.tobytes())
+        f.write(self.starts.tobytes())
+        f.write(self.postings.tobytes())
+        f.write(blob)
+
+    def read(self, buffer: bytes, offset: int) -> int:
+        """
+        Load the names written at offset, returns the offset of their end
+        """
+        (nbr_names, nbr_postings, blob_size) = unpack_from(NAME_HEADER, buffer, offset)
+
+        offset += NAME_HEADER_SIZE
+        self.hashes = np.frombuffer(buffer, dtype=HASH_DTYPE, count=nbr_names, offset=offset)
+        offset += nbr_names * HASH_DTYPE.itemsize
+        self.starts = np.frombuffer(buffer, dtype=POSTING_DTYPE, count=nbr_names + 1, offset=offset)
+        offset += (nbr_names + 1) * POSTING_DTYPE.itemsize
+        self.postings = np.frombuffer(buffer, dtype=POSTING_DTYPE, count=nbr_postings, offset=offset)
+        offset += nbr_postings * POSTING_DTYPE.itemsize
+
+        blob = buffer[offset:offset + blob_size].decode("utf-8")
+        self.names = blob.split("\0") if nbr_names > 0 else []
+
+        return offset + blob_size
+
+    def position(self, name: str) -> int | None:
+        """
+        Position of a name, the hash is checked against the name itself
+        """
+        name = self.key(name)
+        key = name_hash(name)
+        position = int(np.searchsorted(self.hashes, key))
+        while position < len(self.names) and int(self.hashes[position]) == key:
+            if self.names[position] == name:
+                return position
+            position += 1
+
+        return None
+
+    def ordinals(self, positions: list[int]) -> np.ndarray:
+        """
+        Ordinals of the records of the names as a sorted int64 array
+        """
+        result = [self.postings[int(self.starts[position]):int(self.starts[position + 1])]
+                  for position in positions]
+        if len(result) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        return np.unique(np.concatenate(result).astype(np.int64))
+
+    def lookup(self, name: str) -> np.ndarray:
+        """
+        Records of a name
+        """
+        position = self.position(name)
+        return self.ordinals([position] if position is not None else [])
+
+    def suffix(self, domain: str) -> np.ndarray:
+        """
+        Records of the names under a domain, the domain itself excluded
+        """
+        domain = "." + normalize(domain)
+        return self.ordinals([position for position, name in enumerate(self.names) if name.endswith(domain)])
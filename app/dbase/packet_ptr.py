@@ -12,4 +12,4 @@ class PktPtr:
     ip_src: int
     pkt_hdr_size: int
     header: Optional[PktHeader] = None
-    packet: Optional[bytes] = None
+    packet: Optional[bytes | memoryview] = None
@@ -0,0 +1,143 @@
+import logging
+from pathlib import Path
+from struct import calcsize, pack, unpack_from
+from typing import Tuple
+
+import numpy as np
+
+from config.config import Config
+from dbase.file_manager import FileManager
+from dbase.ipv4_search import Ipv4Search, network_range
+
+log = logging.getLogger("packetdb")
+
+POSTING_MAGIC = 0x504c5354
+POSTING_VERSION = 0x0001
+
+# --- magic, version, key size, number of keys, number of postings
+POSTING_HEADER = ">IHHII"
+POSTING_HEADER_SIZE = calcsize(POSTING_HEADER)
+
+POSTING_DTYPE = np.dtype(">u4")
+
+
+class PostingIndex:
+    """
+    Inverted index of one field of an index file.
+
+    The file holds the sorted distinct keys, the start of each key posting
+    list and the postings themselves. A posting is the ordinal of the record
+    in the .pidx file, the postings of a key are in ascending order so they
+    follow the packet offsets order.
+    """
+
+    def __init__(self, file_id: int | str, name: str):
+        self.file_id = file_id
+        self.name = name
+        self.keys = np.empty(0, dtype=">u4")
+        self.starts = np.zeros(1, dtype=POSTING_DTYPE)
+        self.postings = np.empty(0, dtype=POSTING_DTYPE)
+
+    @property
+    def filename(self) -> Path:
+        return Path(f"{Config.pcap_index()}/{self.file_id}_{self.name}.plst")
+
+    @property
+    def exists(self) -> bool:
+        return self.filename.exists()
+
+    def build(self, column: np.ndarray, key_dtype: str = ">u4") -> "PostingIndex":
+        order = np.argsort(column, kind="stable")
+        keys, starts = np.unique(column[order], return_index=True)
+
+        self.keys = keys.astype(key_dtype)
+        self.starts = np.append(starts, len(column)).astype(POSTING_DTYPE)
+        self.postings = order.astype(POSTING_DTYPE)
+
+        return self
+
+    def merge(self, parts: list[Tuple["PostingIndex", int]]) -> "PostingIndex":
+        """
+        Posting index of consecutive index files, each part comes with the
+        ordinal of its first record
+        """
+        keys = np.concatenate([np.repeat(index.keys, np.diff(index.starts).astype(np.int64))
+                               for index, _ in parts])
+        postings = np.concatenate([index.postings.astype(np.int64) + base for index, base in parts])
+
+        # --- The parts are in ordinal order, a stable sort keeps the
+        #     postings of a key ascending
+        order = np.argsort(keys, kind="stable")
+        keys, starts = np.unique(keys[order], return_index=True)
+
+        # --- concatenate returns native byte order keys
+        self.keys = keys.astype(parts[0][0].keys.dtype)
+        self.starts = np.append(starts, len(order)).astype(POSTING_DTYPE)
+        self.postings = postings[order].astype(POSTING_DTYPE)
+
+        return self
+
+    def save(self) -> None:
+        with FileManager.atomic_write(self.filename) as f:
+            f.write(pack(POSTING_HEADER, POSTING_MAGIC, POSTING_VERSION,
+                         self.keys.dtype.itemsize, len(self.keys), len(self.postings)))
+            f.write(self.keys.tobytes())
+            f.write(self.starts.tobytes())
+            f.write(self.postings.tobytes())
+
+    def load(self) -> "PostingIndex":
+        with open(self.filename, "rb") as f:
+            header = f.read(POSTING_HEADER_SIZE)
+
+        (magic_no, _, key_size, nbr_keys,
+         nbr_postings) = unpack_from(POSTING_HEADER, header)
+
+        if magic_no != POSTING_MAGIC:
+            raise ValueError(f"Invalid posting index: {self.filename}")
+
+        offset = POSTING_HEADER_SIZE
+        self.keys = self.section(f">u{key_size}", offset, nbr_keys)
+        offset += nbr_keys * key_size
+        self.starts = self.section(POSTING_DTYPE, offset, nbr_keys + 1)
+        offset += (nbr_keys + 1) * POSTING_DTYPE.itemsize
+        self.postings = self.section(POSTING_DTYPE, offset, nbr_postings)
+
+        return self
+
+    def section(self, dtype, offset: int, count: int) -> np.ndarray:
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+
+        return np.memmap(self.filename, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+    def lookup(self, key: int) -> np.ndarray:
+        return self.range(key, key)
+
+    def range(self, low: int, high: int) -> np.ndarray:
+        """
+        Postings of every key between low and high inclusively, in ascending order
+        """
+        first = int(np.searchsorted(self.keys, low, side="left"))
+        last = int(np.searchsorted(self.keys, high, side="right"))
+
+        if first >= last:
+            return np.empty(0, dtype=np.int64)
+
+        postings = self.postings[int(self.starts[first]):int(self.starts[last])]
+        if last - first == 1:
+            return postings.astype(np.int64)
+
+        return np.sort(postings.astype(np.int64))
+
+
+def network_postings(index: PostingIndex, address_list: list[Tuple[int, int]]) -> np.ndarray:
+    """
+    Union of the postings of every address or network of the list
+    """
+    ranges = Ipv4Search.compile(address_list).ranges
+    if len(ranges) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # --- Merged intervals never share a key, their postings are disjoint
+    result = np.concatenate([index.range(start, end) for start, end in ranges])
+    return np.sort(result) if len(ranges) > 1 else result
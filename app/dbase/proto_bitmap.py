@@ -0,0 +1,267 @@
+import logging
+from pathlib import Path
+from struct import calcsize, pack, unpack_from
+from typing import Tuple
+
+import numpy as np
+
+from config.config import Config
+from dbase.file_manager import FileManager
+
+log = logging.getLogger("packetdb")
+
+PROTO_BITMAP_MAGIC = 0x50424d50
+PROTO_BITMAP_VERSION = 0x0001
+
+# --- magic, version, options, number of bitmaps
+PROTO_BITMAP_HEADER = ">IHHI"
+PROTO_BITMAP_HEADER_SIZE = calcsize(PROTO_BITMAP_HEADER)
+
+# --- protocol bit, number of containers
+BITMAP_HEADER = ">II"
+BITMAP_HEADER_SIZE = calcsize(BITMAP_HEADER)
+
+# --- high 16 bits of the ordinals, container kind, cardinality
+CONTAINER_HEADER = ">HHI"
+CONTAINER_HEADER_SIZE = calcsize(CONTAINER_HEADER)
+
+# --- Container kinds
+CONTAINER_ARRAY = 0x0001
+CONTAINER_BITMAP = 0x0002
+
+# --- Above this cardinality a 64K bits bitmap is smaller than a sorted array
+ARRAY_MAX = 4096
+CONTAINER_BITS = 65536
+CONTAINER_BYTES = CONTAINER_BITS // 8
+
+
+def make_container(values: np.ndarray) -> Tuple[int, np.ndarray]:
+    """
+    Container of the sorted low 16 bits values, an array or a bitmap
+    depending on the cardinality
+    """
+    if len(values) <= ARRAY_MAX:
+        return (CONTAINER_ARRAY, values.astype(np.uint16))
+
+    bits = np.zeros(CONTAINER_BITS, dtype=bool)
+    bits[values] = True
+    return (CONTAINER_BITMAP, np.packbits(bits, bitorder="little"))
+
+
+def container_values(container: Tuple[int, np.ndarray]) -> np.ndarray:
+    kind, data = container
+    if kind == CONTAINER_ARRAY:
+        return data
+
+    return np.flatnonzero(np.unpackbits(data, bitorder="little")).astype(np.uint16)
+
+
+def container_bits(container: Tuple[int, np.ndarray]) -> np.ndarray:
+    kind, data = container
+    if kind == CONTAINER_BITMAP:
+        return data
+
+    bits = np.zeros(CONTAINER_BITS, dtype=bool)
+    bits[data] = True
+    return np.packbits(bits, bitorder="little")
+
+
+def container_and(left: Tuple[int, np.ndarray], right: Tuple[int, np.ndarray]) -> Tuple[int, np.ndarray]:
+    if left[0] == CONTAINER_ARRAY and right[0] == CONTAINER_ARRAY:
+        return (CONTAINER_ARRAY, np.intersect1d(left[1], right[1], assume_unique=True))
+
+    if left[0] == CONTAINER_ARRAY or right[0] == CONTAINER_ARRAY:
+        # --- Probe the bitmap with the values of the array
+        array, bitmap = (left, right) if left[0] == CONTAINER_ARRAY else (right, left)
+        bits = np.unpackbits(bitmap[1], bitorder="little")
+        return (CONTAINER_ARRAY, array[1][bits[array[1]] == 1])
+
+    bits = np.bitwise_and(left[1], right[1])
+    return make_container(container_values((CONTAINER_BITMAP, bits)))
+
+
+def container_or(left: Tuple[int, np.ndarray], right: Tuple[int, np.ndarray]) -> Tuple[int, np.ndarray]:
+    if left[0] == CONTAINER_ARRAY and right[0] == CONTAINER_ARRAY:
+        return make_container(np.union1d(left[1], right[1]))
+
+    return (CONTAINER_BITMAP, np.bitwise_or(container_bits(left), container_bits(right)))
+
+
+class RoaringBitmap:
+    """
+    Compressed set of record ordinals. The ordinals are split on their high
+    16 bits, each chunk is stored as a sorted array of the low 16 bits when
+    sparse or as a 64K bits bitmap when dense.
+    """
+
+    def __init__(self, containers: dict[int, Tuple[int, np.ndarray]] | None = None):
+        self.containers = containers if containers is not None else {}
+
+    @classmethod
+    def from_ordinals(cls, ordinals: np.ndarray) -> "RoaringBitmap":
+        ordinals = np.unique(np.asarray(ordinals, dtype=np.int64))
+        keys, starts = np.unique(ordinals >> 16, return_index=True)
+        ends = np.append(starts[1:], len(ordinals))
+
+        containers = {}
+        for key, start, end in zip(keys.tolist(), starts.tolist(), ends.tolist()):
+            containers[key] = make_container(ordinals[start:end] & 0xffff)
+
+        return cls(containers)
+
+    def to_ordinals(self) -> np.ndarray:
+        """
+        Ordinals of the set as a sorted int64 array
+        """
+        if len(self.containers) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        return np.concatenate([(key << 16) + container_values(self.containers[key]).astype(np.int64)
+                               for key in sorted(self.containers)])
+
+    def __len__(self) -> int:
+        return sum(len(container_values(c)) for c in self.containers.values())
+
+    def __and__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        containers = {}
+        for key in self.containers.keys() & other.containers.keys():
+            container = container_and(self.containers[key], other.containers[key])
+            if len(container[1]) > 0:
+                containers[key] = container
+
+        return RoaringBitmap(containers)
+
+    def __or__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        containers = dict(self.containers)
+        for key, container in other.containers.items():
+            if key in containers:
+                containers[key] = container_or(containers[key], container)
+            else:
+                containers[key] = container
+
+        return RoaringBitmap(containers)
+
+
+class ProtoBitmapIndex:
+    """
+    One compressed bitmap of record ordinals per protocol bit of the
+    packet index, replaces the per protocol .pidx files.
+    """
+
+    def __init__(self, file_id: int | str):
+        self.file_id = file_id
+        self.bitmaps: dict[int, RoaringBitmap] = {}
+
+    @property
+    def filename(self) -> Path:
+        return Path(f"{Config.pcap_index()}/{self.file_id}.pbmp")
+
+    @property
+    def exists(self) -> bool:
+        return self.filename.exists()
+
+    def build(self, proto_column: np.ndarray) -> "ProtoBitmapIndex":
+        proto_column = np.asarray(proto_column, dtype=np.uint32)
+        all_protos = int(np.bitwise_or.reduce(proto_column)) if len(proto_column) > 0 else 0
+
+        self.bitmaps = {}
+        for bit in range(32):
+            proto = 1 << bit
+            if all_protos & proto:
+                self.bitmaps[proto] = RoaringBitmap.from_ordinals(
+                    np.flatnonzero(proto_column & proto))
+
+        return self
+
+    def merge(self, parts: list[Tuple["ProtoBitmapIndex", int]]) -> "ProtoBitmapIndex":
+        """
+        Bitmaps of consecutive index files, each part comes with the
+        ordinal of its first record
+        """
+        bitmaps: dict[int, RoaringBitmap] = {}
+        for proto_index, base in parts:
+            for proto, bitmap in proto_index.bitmaps.items():
+                if base > 0:
+                    bitmap = RoaringBitmap.from_ordinals(bitmap.to_ordinals() + base)
+                bitmaps[proto] = bitmaps[proto] | bitmap if proto in bitmaps else bitmap
+
+        self.bitmaps = bitmaps
+        return self
+
+    def save(self) -> None:
+        with FileManager.atomic_write(self.filename) as f:
+            f.write(pack(PROTO_BITMAP_HEADER, PROTO_BITMAP_MAGIC,
+                         PROTO_BITMAP_VERSION, 0, len(self.bitmaps)))
+
+            for proto, bitmap in self.bitmaps.items():
+                f.write(pack(BITMAP_HEADER, proto, len(bitmap.containers)))
+                for key in sorted(bitmap.containers):
+                    kind, data = bitmap.containers[key]
+                    cardinality = len(data) if kind == CONTAINER_ARRAY else len(
+                        container_values((kind, data)))
+                    f.write(pack(CONTAINER_HEADER, key, kind, cardinality))
+                    f.write(data.astype(">u2").tobytes() if kind == CONTAINER_ARRAY else data.tobytes())
+
+    def load(self) -> "ProtoBitmapIndex":
+        with open(self.filename, "rb") as f:
+            buffer = f.read()
+
+        (magic_no, _, _, nbr_bitmaps) = unpack_from(PROTO_BITMAP_HEADER, buffer)
+        if magic_no != PROTO_BITMAP_MAGIC:
+            raise ValueError(f"Invalid protocol bitmap index: {self.filename}")
+
+        offset = PROTO_BITMAP_HEADER_SIZE
+        self.bitmaps = {}
+        for _ in range(nbr_bitmaps):
+            proto, nbr_containers = unpack_from(BITMAP_HEADER, buffer, offset)
+            offset += BITMAP_HEADER_SIZE
+
+            containers = {}
+            for _ in range(nbr_containers):
+                key, kind, cardinality = unpack_from(CONTAINER_HEADER, buffer, offset)
+                offset += CONTAINER_HEADER_SIZE
+
+                if kind == CONTAINER_ARRAY:
+                    data = np.frombuffer(buffer, dtype=">u2", count=cardinality,
+                                         offset=offset).astype(np.uint16)
+                    offset += cardinality * 2
+                else:
+                    data = np.frombuffer(buffer, dtype=np.uint8, count=CONTAINER_BYTES,
+                                         offset=offset)
+                    offset += CONTAINER_BYTES
+
+                containers[key] = (kind, data)
+
+            self.bitmaps[proto] = RoaringBitmap(containers)
+
+        return self
+
+    def bitmap(self, proto: int) -> RoaringBitmap:
+        return self.bitmaps.get(proto, RoaringBitmap())
+
+    def match_all(self, search_index: int) -> RoaringBitmap | None:
+        """
+        Records having every protocol bit of the search index, None when
+        the search index has no protocol
+        """
+        result: RoaringBitmap | None = None
+        for bit in range(32):
+            proto = 1 << bit
+            if search_index & proto:
+                bitmap = self.bitmap(proto)
+                result = bitmap if result is None else result & bitmap
+
+        return result
+
+    def match_any(self, search_index: int) -> RoaringBitmap | None:
+        """
+        Records having at least one protocol bit of the search index
+        """
+        result: RoaringBitmap | None = None
+        for bit in range(32):
+            proto = 1 << bit
+            if search_index & proto:
+                bitmap = self.bitmap(proto)
+                result = bitmap if result is None else result | bitmap
+
+        return result
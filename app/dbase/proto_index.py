@@ -1,10 +1,12 @@
 
-from struct import pack, unpack
+from struct import calcsize, pack, unpack_from
 from config.config import Config
+from dbase.file_manager import FileManager
 
 from dataclasses import dataclass
 import logging
-import time
+
+import numpy as np
 
 log = logging.getLogger("packetdb")
 
@@ -22,42 +24,58 @@ class IndexLine:
         return f"Ptr: {self.ptr}, IP dst: {self.ip_dst:x}, IP src: {self.ip_src:x}"
 
 
+PROTO_INDEX_MAGIC = 0xa1b2c3d4
+PROTO_INDEX_VERSION = 0x0001
+
+# --- magic, version, options, number of lines
+PROTO_INDEX_HEADER = ">IHHI"
+PROTO_INDEX_HEADER_SIZE = calcsize(PROTO_INDEX_HEADER)
+
+PROTO_INDEX_LINE = np.dtype([
+    ("ptr", ">u4"),
+    ("ip_dst", ">u4"),
+    ("ip_src", ">u4"),
+])
+
+
 class ProtoIndex:
     def __init__(self, file_id: int, proto_id: int):
         self.file_id = file_id
         self.proto_id = proto_id
 
-    def save(self, index_list: list[IndexLine]):
-        filename = f"{Config.pcap_proto_index()}/{self.file_id}_{self.proto_id:x}.pidx"
+    def filename(self, file_id: int, proto_id: int) -> str:
+        return f"{Config.pcap_proto_index()}/{file_id}_{proto_id:x}.pidx"
 
-        start_time = time.time()
-        with open(filename, "w+b") as f:
-            f.write(pack(">I", 0xa1b2c3d4))
-            f.write(pack(">H", 0x0001))
-            f.write(pack(">H", 0x0000))
-            f.write(pack(">I", len(index_list)))
+    def save(self, index_list: list[IndexLine] | np.ndarray):
+        if isinstance(index_list, np.ndarray):
+            lines = index_list.astype(PROTO_INDEX_LINE)
+        else:
+            lines = np.array([(ix.ptr, ix.ip_dst, ix.ip_src) for ix in index_list], dtype=PROTO_INDEX_LINE)
 
-            for ix in index_list:
-                f.write(pack(">I", ix.ptr))
-                f.write(pack(">I", ix.ip_dst))
-                f.write(pack(">I", ix.ip_src))
-        # log.info(f"Proto index creation time: {time.time() - start_time}")
+        with FileManager.atomic_write(self.filename(self.file_id, self.proto_id)) as f:
+            f.write(pack(PROTO_INDEX_HEADER, PROTO_INDEX_MAGIC,
+                         PROTO_INDEX_VERSION, 0x0000, len(lines)))
+            lines.tofile(f)
 
-    def load(self, file_id: int, proto_id: int) -> list[IndexLine]:
-        filename = f"{Config.pcap_proto_index()}/{file_id}_{proto_id:x}.pidx"
-        result = []
+    def load(self, file_id: int, proto_id: int) -> np.recarray:
+        """
+        Lines of the index mapped from the file, rows are read lazily and
+        expose ptr, ip_dst and ip_src like IndexLine
+        """
+        filename = self.filename(file_id, proto_id)
 
         with open(filename, "rb") as f:
-            magic_no = unpack(">I", f.read(4))[0]
-            version = unpack(">H", f.read(2))[0]
-            options = unpack(">H", f.read(2))[0]
-            idx_len = unpack(">I", f.read(4))[0]
+            header = f.read(PROTO_INDEX_HEADER_SIZE)
+
+        (magic_no, _, _, idx_len) = unpack_from(PROTO_INDEX_HEADER, header)
+        if magic_no != PROTO_INDEX_MAGIC:
+            raise ValueError(f"Invalid proto index: {filename}")
 
-            for _ in range(idx_len):
-                idx_line = unpack(">III", f.read(12))
-                result.append(IndexLine(idx_line[0], idx_line[1], idx_line[2]))
+        if idx_len == 0:
+            return np.empty(0, dtype=PROTO_INDEX_LINE).view(np.recarray)
 
-            return result
+        return np.memmap(filename, dtype=PROTO_INDEX_LINE, mode="r",
+                         offset=PROTO_INDEX_HEADER_SIZE, shape=(idx_len,)).view(np.recarray)
 
 
 class ProtoManager:
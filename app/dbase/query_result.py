@@ -3,10 +3,13 @@ import sys
 from collections import defaultdict
 from dataclasses import dataclass
 
+import numpy as np
+
+from dbase.index_file import RECORD_FIELDS
 from packet.layers.field_type import get_type
 from packet.layers.fields import IPv4Address
 from packet.layers.packet_builder import PacketBuilder
-from pql.aggregate import Count
+from pql.aggregate import Bandwidth, Count
 from pql.model import SelectStatement
 
 log = logging.getLogger("packetdb")
@@ -63,6 +66,18 @@ class QueryResult:
         else:
             self.process_pkt(packet)
 
+    def add_records(self, records: np.ndarray):
+        """
+        Aggregate wide index records, the query is answered by the index
+        """
+        if len(records) == 0:
+            return
+
+        self.found += len(records)
+        self.ts_start = min(self.ts_start, int(records["ts"].min()))
+        self.ts_end = max(self.ts_end, int(records["ts"].max()))
+        self.aggby.add_records(records)
+
     def get_columns(self):
         for field in self.model.select_expr:
             self.result["columns"].append({field: get_type(field)})
@@ -70,6 +85,11 @@ class QueryResult:
     def get_result(self) -> dict:
         self.distinct = []
         self.get_columns()
+
+        for aggr in self.model.aggregate:
+            if isinstance(aggr, Bandwidth) and self.found > 0:
+                aggr.time_range(self.ts_start, max(self.ts_end, self.ts_start + 1))
+
         if self.model.has_groupby:
             # self.groupby.print()
             self.result['result'] = self.groupby.get_result()
@@ -134,6 +154,15 @@ class AggregateBy:
                 value = packet.get_field(aggr.fieldname)
                 self.aggr_result[aggr.fieldname].append(value)
 
+    def add_records(self, records: np.ndarray):
+        self.packet_count += len(records)
+        for aggr in self.model.aggregate:
+            if isinstance(aggr, Count):
+                self.aggr_result[aggr.fieldname].extend([1] * len(records))
+            else:
+                self.aggr_result[aggr.fieldname].extend(
+                    records[RECORD_FIELDS[aggr.fieldname]].tolist())
+
     @property
     def count(self) -> int:
         return self.packet_count
@@ -0,0 +1,273 @@
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from struct import calcsize, pack, unpack_from
+
+import numpy as np
+
+from config.config import Config
+from dbase.dns_index import DnsIndex
+from dbase.flow_index import FlowIndex
+from dbase.host_index import HostIndex
+from dbase.index_file import INDEX_LAYOUTS, IndexFile, as_layout
+from pql.pcapfile import PcapFile
+
+log = logging.getLogger("packetdb")
+
+SEGMENT_MAGIC = 0x53444952
+SEGMENT_VERSION = 0x0001
+
+# --- magic, version, options, number of files
+SEGMENT_HEADER = ">IHHI"
+SEGMENT_HEADER_SIZE = calcsize(SEGMENT_HEADER)
+
+SEGMENT_ENTRY = np.dtype([
+    ("file_id", ">u4"),
+    ("start", ">u4"),
+    ("nbr_records", ">u4"),
+    ("min_ts", ">u4"),
+    ("max_ts", ">u4"),
+])
+
+# --- Records of a segment before a new one is started
+SEGMENT_MAX_RECORDS = 4_000_000
+
+# --- Files replaced by a segment are removed after this delay, queries
+# --- started before the swap can still read them
+SEGMENT_GRACE = 300
+
+
+def segment_name(first_id: int | str, last_id: int | str) -> str:
+    return f"s{first_id}-{last_id}"
+
+
+def index_id(filename: Path) -> int | str:
+    """
+    Id of an index file, the pcap file id or the segment name
+    """
+    stem = filename.stem.split('_')[0]
+    return int(stem) if stem.isdigit() else stem
+
+
+@dataclass
+class SegmentDirectory:
+    """
+    Pcap files merged in a segment index and the range of record ordinals
+    of each file. The directory is written last, a segment only exists
+    once its directory is in place.
+    """
+    name: str
+    entries: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=SEGMENT_ENTRY))
+
+    @classmethod
+    def filename(cls, name: str) -> Path:
+        return Path(f"{Config.pcap_index()}/{name}.sdir")
+
+    @property
+    def file_ids(self) -> list[int]:
+        return self.entries["file_id"].tolist()
+
+    @property
+    def last_id(self) -> int:
+        return int(self.entries["file_id"][-1])
+
+    def file_of(self, ordinals: np.ndarray) -> np.ndarray:
+        """
+        Pcap file id of each record ordinal of the segment
+        """
+        position = np.searchsorted(self.entries["start"], ordinals, side="right") - 1
+        return self.entries["file_id"][position]
+
+    def save(self) -> None:
+        filename = self.filename(self.name)
+        tmp_filename = filename.with_suffix(".tmp")
+
+        with open(tmp_filename, "wb") as f:
+            f.write(pack(SEGMENT_HEADER, SEGMENT_MAGIC, SEGMENT_VERSION, 0, len(self.entries)))
+            f.write(self.entries.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_filename, filename)
+
+    @classmethod
+    def load(cls, name: str) -> "SegmentDirectory | None":
+        try:
+            with open(cls.filename(name), "rb") as f:
+                buffer = f.read()
+        except FileNotFoundError:
+            return None
+
+        (magic_no, _, _, nbr_files) = unpack_from(SEGMENT_HEADER, buffer)
+        if magic_no != SEGMENT_MAGIC:
+            log.error(f"Invalid segment directory: {name}")
+            return None
+
+        entries = np.frombuffer(buffer, dtype=SEGMENT_ENTRY, count=nbr_files,
+                                offset=SEGMENT_HEADER_SIZE)
+        return cls(name, entries)
+
+
+class SegmentCatalog:
+    """
+    Segments of the index folder and the pcap files they hold
+    """
+
+    def __init__(self):
+        self.segments: dict[str, SegmentDirectory] = {}
+        self.covered: dict[int, str] = {}
+
+    @classmethod
+    def load(cls) -> "SegmentCatalog":
+        catalog = cls()
+        for filename in Path(Config.pcap_index()).glob("*.sdir"):
+            directory = SegmentDirectory.load(filename.stem)
+            if directory is not None:
+                catalog.add(directory)
+
+        return catalog
+
+    def add(self, directory: SegmentDirectory):
+        self.segments[directory.name] = directory
+        for file_id in directory.file_ids:
+            self.covered[file_id] = directory.name
+
+    def get(self, filename: Path) -> SegmentDirectory | None:
+        return self.segments.get(filename.stem)
+
+    def resolve(self, files_list: list[Path]) -> list[Path]:
+        """
+        Replace the index files merged in a segment by the segment, drop the
+        segments not committed yet. Newest files first.
+        """
+        result = {}
+        for filename in files_list:
+            file_id = index_id(filename)
+            if isinstance(file_id, int):
+                if file_id in self.covered:
+                    name = self.covered[file_id]
+                    result[name] = (self.segments[name].last_id,
+                                    Path(f"{Config.pcap_index()}/{name}.pidx"))
+                else:
+                    result[filename.stem] = (file_id, filename)
+            elif file_id in self.segments:
+                result[file_id] = (self.segments[file_id].last_id, filename)
+
+        return [filename for _, filename in sorted(result.values(), key=lambda a: a[0], reverse=True)]
+
+
+class SegmentCompactor:
+    """
+    Merge the index files of adjacent pcap files into time ordered segments
+    """
+
+    def __init__(self, max_records: int = SEGMENT_MAX_RECORDS, grace: int = SEGMENT_GRACE):
+        self.max_records = max_records
+        self.grace = grace
+
+    def run(self, exclude: set[int] | None = None) -> list[str]:
+        """
+        Compact the per file indexes, the files of exclude are still being
+        written and are left alone
+        """
+        self.purge()
+
+        created = []
+        for group in self.groups(exclude or set()):
+            created.append(self.merge(group))
+
+        return created
+
+    def groups(self, exclude: set[int]) -> list[list[IndexFile]]:
+        """
+        Runs of per file indexes in file id order, each run holding at most
+        max_records records. A run of a single file is left alone.
+        """
+        catalog = SegmentCatalog.load()
+        files_list = [IndexFile(f) for f in Path(Config.pcap_index()).glob("*.pidx")
+                      if f.stem.isdigit() and int(f.stem) not in catalog.covered and int(f.stem) not in exclude]
+        files_list.sort(key=lambda a: a.file_id)
+
+        result = []
+        group: list[IndexFile] = []
+        nbr_records = 0
+        for index_file in files_list:
+            size = index_file.open().nbr_records
+            if len(group) > 0 and nbr_records + size > self.max_records:
+                result.append(group)
+                group = []
+                nbr_records = 0
+
+            group.append(index_file)
+            nbr_records += size
+
+        result.append(group)
+
+        return [g for g in result if len(g) > 1]
+
+    def merge(self, group: list[IndexFile]) -> str:
+        start_time = time.time()
+        name = segment_name(group[0].file_id, group[-1].file_id)
+
+        records_list = [index_file.load() for index_file in group]
+
+        # --- Files of both layouts are merged with the base layout
+        layout = min(index_file.layout for index_file in group)
+        records_list = [as_layout(records, INDEX_LAYOUTS[layout]) for records in records_list]
+        entries = np.zeros(len(group), dtype=SEGMENT_ENTRY)
+        start = 0
+        for i, (index_file, records) in enumerate(zip(group, records_list)):
+            entries[i] = (index_file.file_id, start, len(records),
+                          records["ts"].min() if len(records) > 0 else 0,
+                          records["ts"].max() if len(records) > 0 else 0)
+            start += len(records)
+
+        records = np.concatenate(records_list)
+        records = IndexFile(Path(f"{Config.pcap_index()}/{name}.pidx"), layout).save(records)
+        PcapFile().create_field_index(name, records)
+
+        # --- Base records have no length, the flows of the files are merged
+        flow_list = [FlowIndex(index_file.file_id) for index_file in group]
+        if "orig_len" not in (records.dtype.names or ()) and all(flow_index.exists for flow_index in flow_list):
+            FlowIndex(name).merge([(flow_index.load(), int(entry["start"]))
+                                   for flow_index, entry in zip(flow_list, entries)]).save()
+
+        dns_list = [DnsIndex(index_file.file_id) for index_file in group]
+        if all(dns_index.exists for dns_index in dns_list):
+            DnsIndex(name).merge([(dns_index.load(), int(entry["start"]))
+                                  for dns_index, entry in zip(dns_list, entries)]).save()
+
+        host_list = [HostIndex(index_file.file_id) for index_file in group]
+        if all(host_index.exists for host_index in host_list):
+            HostIndex(name).merge([(host_index.load(), int(entry["start"]))
+                                   for host_index, entry in zip(host_list, entries)]).save()
+
+        # --- Commit point, the segment replaces the files from now on
+        SegmentDirectory(name, entries).save()
+
+        log.info(f"Segment {name} created with {len(group)} files, {len(records)} packets, time: {time.time() - start_time:.3}")
+        return name
+
+    def purge(self) -> None:
+        """
+        Remove the index files replaced by a segment once the grace delay
+        is over and the leftovers of an interrupted compaction
+        """
+        index_path = Path(Config.pcap_index())
+        catalog = SegmentCatalog.load()
+        now = time.time()
+
+        for name, directory in catalog.segments.items():
+            if now - SegmentDirectory.filename(name).stat().st_mtime < self.grace:
+                continue
+
+            for file_id in directory.file_ids:
+                for filename in list(index_path.glob(f"{file_id}.*")) + list(index_path.glob(f"{file_id}_*.plst")):
+                    filename.unlink(missing_ok=True)
+
+        for filename in index_path.glob("s*.pidx"):
+            if filename.stem not in catalog.segments and now - filename.stat().st_mtime >= self.grace:
+                for leftover in list(index_path.glob(f"{filename.stem}.*")) + list(index_path.glob(f"{filename.stem}_*.plst")):
+                    leftover.unlink(missing_ok=True)
@@ -0,0 +1,125 @@
+import logging
+from pathlib import Path
+from struct import calcsize, pack, unpack_from
+from typing import Tuple
+
+import numpy as np
+
+from config.config import Config
+from dbase.file_manager import FileManager
+
+log = logging.getLogger("packetdb")
+
+TIME_INDEX_MAGIC = 0x54494458
+TIME_INDEX_VERSION = 0x0001
+
+# --- magic, version, options, records per entry, number of records, number of entries
+TIME_INDEX_HEADER = ">IHHIII"
+TIME_INDEX_HEADER_SIZE = calcsize(TIME_INDEX_HEADER)
+
+TIME_INDEX_ENTRY = np.dtype([
+    ("ordinal", ">u4"),
+    ("min_ts", ">u4"),
+    ("max_ts", ">u4"),
+])
+
+TIME_INDEX_STEP = 1024
+
+
+class TimeIndex:
+    """
+    Sparse timestamp index of an index file, one entry every step records
+    with the first ordinal and the timestamp range of the records it covers.
+
+    Capture timestamps are not strictly ordered so the lookup uses the
+    running maximum and the reverse running minimum of the entries, both
+    sorted, to find the first and the last entry of an interval.
+    """
+
+    def __init__(self, file_id: int | str, step: int = TIME_INDEX_STEP):
+        self.file_id = file_id
+        self.step = step
+        self.nbr_records = 0
+        self.entries = np.empty(0, dtype=TIME_INDEX_ENTRY)
+
+    @property
+    def filename(self) -> Path:
+        return Path(f"{Config.pcap_index()}/{self.file_id}.tidx")
+
+    @property
+    def exists(self) -> bool:
+        return self.filename.exists()
+
+    def build(self, ts_column: np.ndarray) -> "TimeIndex":
+        self.nbr_records = len(ts_column)
+        starts = np.arange(0, self.nbr_records, self.step)
+
+        self.entries = np.zeros(len(starts), dtype=TIME_INDEX_ENTRY)
+        if len(starts) > 0:
+            self.entries["ordinal"] = starts
+            self.entries["min_ts"] = np.minimum.reduceat(ts_column, starts)
+            self.entries["max_ts"] = np.maximum.reduceat(ts_column, starts)
+
+        return self
+
+    def append(self, ts_column: np.ndarray) -> "TimeIndex":
+        """
+        Add the records following the indexed ones, the last entry is
+        completed before new entries are started
+        """
+        fill = min((-self.nbr_records) % self.step, len(ts_column))
+        entries = self.entries.copy()
+        if fill > 0:
+            entries["min_ts"][-1] = min(int(entries["min_ts"][-1]), int(ts_column[:fill].min()))
+            entries["max_ts"][-1] = max(int(entries["max_ts"][-1]), int(ts_column[:fill].max()))
+
+        new_entries = TimeIndex(self.file_id, self.step).build(ts_column[fill:]).entries
+        new_entries["ordinal"] += self.nbr_records + fill
+
+        # --- concatenate returns native byte order fields
+        self.entries = np.concatenate([entries, new_entries]).astype(TIME_INDEX_ENTRY)
+        self.nbr_records += len(ts_column)
+        return self
+
+    def save(self) -> None:
+        with FileManager.atomic_write(self.filename) as f:
+            f.write(pack(TIME_INDEX_HEADER, TIME_INDEX_MAGIC, TIME_INDEX_VERSION,
+                         0, self.step, self.nbr_records, len(self.entries)))
+            f.write(self.entries.tobytes())
+
+    def load(self) -> "TimeIndex":
+        with open(self.filename, "rb") as f:
+            buffer = f.read()
+
+        (magic_no, _, _, self.step, self.nbr_records,
+         nbr_entries) = unpack_from(TIME_INDEX_HEADER, buffer)
+        if magic_no != TIME_INDEX_MAGIC:
+            raise ValueError(f"Invalid time index: {self.filename}")
+
+        self.entries = np.frombuffer(buffer, dtype=TIME_INDEX_ENTRY, count=nbr_entries,
+                                     offset=TIME_INDEX_HEADER_SIZE)
+
+        return self
+
+    def ordinal_range(self, start_ts: int, end_ts: int) -> Tuple[int, int]:
+        """
+        Range of record ordinals [first, last) holding every record
+        between start_ts and end_ts inclusively
+        """
+        if len(self.entries) == 0:
+            return (0, 0)
+
+        running_max = np.maximum.accumulate(self.entries["max_ts"])
+        first = int(np.searchsorted(running_max, start_ts, side="left"))
+
+        reverse_min = np.minimum.accumulate(self.entries["min_ts"][::-1])[::-1]
+        last = int(np.searchsorted(reverse_min, end_ts, side="right"))
+
+        if first >= last:
+            return (0, 0)
+
+        first_ordinal = int(self.entries["ordinal"][first])
+        last_ordinal = int(self.entries["ordinal"][last]) if last < len(
+            self.entries) else self.nbr_records
+
+        return (first_ordinal, last_ordinal)
@@ -0,0 +1,113 @@
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from struct import calcsize, pack, unpack_from
+
+import numpy as np
+
+from config.config import Config
+from dbase.file_manager import FileManager
+
+log = logging.getLogger("packetdb")
+
+ZONE_MAP_MAGIC = 0x5a4d4150
+ZONE_MAP_VERSION = 0x0001
+
+# --- Options
+PORT_BITMAP = 0x0001
+
+# --- Above this number of distinct ports a 64K bits bitmap is smaller
+PORT_LIST_MAX = 4096
+
+ZONE_MAP_HEADER = ">IHHIIIIIIII"
+
+
+@dataclass
+class ZoneMap:
+    """
+    Summary of an index file used to skip it without reading its records
+    """
+    proto: int = 0
+    min_ts: int = 0
+    max_ts: int = 0
+    min_ip_src: int = 0
+    max_ip_src: int = 0
+    min_ip_dst: int = 0
+    max_ip_dst: int = 0
+    ports: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.uint16))
+
+    @classmethod
+    def from_records(cls, records: np.ndarray) -> "ZoneMap":
+        if len(records) == 0:
+            return cls()
+
+        ports = np.union1d(records["dport"], records["sport"]).astype(np.uint16)
+
+        return cls(proto=int(np.bitwise_or.reduce(records["proto"])),
+                   min_ts=int(records["ts"].min()),
+                   max_ts=int(records["ts"].max()),
+                   min_ip_src=int(records["ip_src"].min()),
+                   max_ip_src=int(records["ip_src"].max()),
+                   min_ip_dst=int(records["ip_dst"].min()),
+                   max_ip_dst=int(records["ip_dst"].max()),
+                   ports=ports)
+
+    def merge(self, other: "ZoneMap") -> "ZoneMap":
+        """
+        Summary of the records of both zone maps
+        """
+        return ZoneMap(proto=self.proto | other.proto,
+                       min_ts=min(self.min_ts, other.min_ts),
+                       max_ts=max(self.max_ts, other.max_ts),
+                       min_ip_src=min(self.min_ip_src, other.min_ip_src),
+                       max_ip_src=max(self.max_ip_src, other.max_ip_src),
+                       min_ip_dst=min(self.min_ip_dst, other.min_ip_dst),
+                       max_ip_dst=max(self.max_ip_dst, other.max_ip_dst),
+                       ports=np.union1d(self.ports, other.ports).astype(np.uint16))
+
+    @classmethod
+    def filename(cls, file_id: int | str) -> Path:
+        return Path(f"{Config.pcap_index()}/{file_id}.zmap")
+
+    def save(self, file_id: int | str) -> None:
+        options = 0
+        if len(self.ports) > PORT_LIST_MAX:
+            options |= PORT_BITMAP
+            bitmap = np.zeros(65536, dtype=bool)
+            bitmap[self.ports] = True
+            port_data = np.packbits(bitmap).tobytes()
+        else:
+            port_data = self.ports.astype(">u2").tobytes()
+
+        with FileManager.atomic_write(self.filename(file_id)) as f:
+            f.write(pack(ZONE_MAP_HEADER, ZONE_MAP_MAGIC, ZONE_MAP_VERSION, options,
+                         self.proto, self.min_ts, self.max_ts,
+                         self.min_ip_src, self.max_ip_src,
+                         self.min_ip_dst, self.max_ip_dst,
+                         len(self.ports)))
+            f.write(port_data)
+
+    @classmethod
+    def load(cls, file_id: int | str) -> "ZoneMap | None":
+        try:
+            with open(cls.filename(file_id), "rb") as f:
+                buffer = f.read()
+        except FileNotFoundError:
+            return None
+
+        (magic_no, _, options, proto, min_ts, max_ts, min_ip_src, max_ip_src,
+         min_ip_dst, max_ip_dst, nbr_ports) = unpack_from(ZONE_MAP_HEADER, buffer)
+
+        if magic_no != ZONE_MAP_MAGIC:
+            log.error(f"Invalid zone map for file: {file_id}")
+            return None
+
+        port_data = buffer[calcsize(ZONE_MAP_HEADER):]
+        if options & PORT_BITMAP:
+            bitmap = np.unpackbits(np.frombuffer(port_data, dtype=np.uint8))
+            ports = np.flatnonzero(bitmap).astype(np.uint16)
+        else:
+            ports = np.frombuffer(port_data, dtype=">u2",
+                                  count=nbr_ports).astype(np.uint16)
+
+        return cls(proto, min_ts, max_ts, min_ip_src, max_ip_src, min_ip_dst, max_ip_dst, ports)
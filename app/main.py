@@ -12,6 +12,7 @@ from api.server import start
 from config.config import Config
 from config.config_db import ConfigDB
 from dbase.dbengine import DBEngine
+from dbase.master_index import MasterIndex
 from rich.logging import RichHandler
 from server.file_monitor import start_db_watcher
 
@@ -55,11 +56,20 @@ def group():
 
 
 @click.command()
-def indexdb():
+@click.option("--rebuild", is_flag=True, help="Drop every index and index all the pcap files")
+def indexdb(rebuild):
     init()
 
     db = DBEngine()
-    db.index_db()
+    db.index_db(rebuild)
+
+
+@click.command()
+def compact():
+    init()
+
+    db = DBEngine()
+    db.compact_db()
 
 
 @click.command("server")
@@ -67,8 +77,9 @@ def indexdb():
 def server():
     log.info(f"PCAP DB starting on plateform {platform.system()}")
     init()
+    MasterIndex.instance().refresh()
 
-    # start_db_watcher(Config.pcap_path(), 1)
+    # start_db_watcher(Config.pcap_path(), 1, f"{Config.dbase_path()}/capture")
 
     api_thread = Thread(target=start, daemon=True)
     api_thread.start()
@@ -76,6 +87,7 @@ def server():
 
 
 group.add_command(indexdb)
+group.add_command(compact)
 group.add_command(server)
 if __name__ == "__main__":
     log.info(sys.version)
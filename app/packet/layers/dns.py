@@ -1,4 +1,5 @@
 from struct import unpack
+from typing import Any
 
 from packet.layers.fields import IPv4Address
 from packet.layers.layer_type import LayerID
@@ -87,20 +88,20 @@ class DnsHeader:
 
 
 class DnsQuery:
-    def __init__(self, query):
+    def __init__(self, query: bytes) -> None:
         self.query = query
         # print_hex(self.query)
-        self.label_list = []
+        self.label_list: list[str] = []
         self.qtype = 0
         self.qclass = 0
         self.answer_pos = 0
 
         self.decode()
 
-    def get_label(self, index, label_len):
+    def get_label(self, index: int, label_len: int) -> str:
         return self.query[index: index + label_len].decode("utf-8")
 
-    def decode(self):
+    def decode(self) -> None:
         index = 0
 
         while self.query[index] != 0:
@@ -129,7 +130,7 @@ class DnsQuery:
         return result
 
     def export(self) -> dict[str, int | str]:
-        result = {
+        result: dict[str, int | str] = {
             "dns.type": type_values.get(self.qtype, "Undefined"),
             "dns.class": self.qclass,
             "dns.answer": ".".join(self.label_list)
@@ -179,23 +180,23 @@ class Dns(Packet):
 
     __slots__ = ["packet"]
 
-    def __init__(self, packet):
+    def __init__(self, packet: bytes) -> None:
         self.packet = packet
         # print('*************************************')
         # print_hex(packet)
         # print('*************************************')
         self.header = DnsHeader(packet)
         self.queries = DnsQuery(self.packet[12:])
-        self.answer_list = []
+        self.answer_list: list[DnsAnswer] = []
 
         if self.header.response:
             self.decode_answer(self.packet[self.queries.answer_pos + 12:])
         else:
             self.answer = None
 
-    def decode_answer(self, answer):
+    def decode_answer(self, answer: bytes) -> None:
         for a in range(self.header.answer_rr):
-            result = "Type not implemented yet"
+            result: str | IPv4Address = "Type not implemented yet"
             start = unpack("!H", answer[0:2])[0]
             # print(f'******* Decode answer: {start:x}')
             if (start & 0xFF00) == 0xC000:
@@ -217,7 +218,7 @@ class Dns(Packet):
 
                 answer = answer[12 + data_len:]
 
-    def get_srv(self, packet, data_len):
+    def get_srv(self, packet: bytes, data_len: int) -> str:
         priority = unpack("!H", packet[0:2])[0]
         weight = unpack("!H", packet[2:4])[0]
         port = unpack("!H", packet[4:6])[0]
@@ -271,7 +272,7 @@ class Dns(Packet):
 
         return result
 
-    def export(self) -> dict[str, int | str]:
+    def export(self) -> dict[str, Any]:
         result = {
             "dns.id": self.header.id,
             "dns.flags": self.header.flags,
@@ -290,7 +291,7 @@ class Dns(Packet):
 
         return result
 
-    def get_field(self, fieldname: str) -> int | None:
+    def get_field(self, fieldname: str) -> int | str | list[DnsAnswer] | None:
         match fieldname:
             case "dns.opcode":
                 return self.header.opcode
@@ -302,6 +303,8 @@ class Dns(Packet):
                 return self.header.questions
             case "dns.answers":
                 return self.header.answer_rr
+            case "dns.query":
+                return ".".join(self.queries.label_list)
             case "dns.answer_list":
                 return self.answer_list
             case _:
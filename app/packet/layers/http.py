@@ -4,6 +4,8 @@ from struct import unpack
 from packet.layers.layer_type import LayerID
 from packet.layers.packet import Packet
 
+HTTP_METHODS = (b"GET", b"POST", b"PUT", b"DELETE", b"HEAD", b"OPTIONS", b"PATCH", b"CONNECT", b"TRACE")
+
 
 class Http(Packet):
     name = LayerID.HTTP
@@ -17,6 +19,47 @@ class Http(Packet):
     def payload(self) -> bytes:
         return self.packet[5:]
 
+    @property
+    def request_line(self) -> list[str] | None:
+        """
+        Method, URI and version of a request, None for other packets
+        """
+        line = bytes(self.packet).split(b"\r\n", 1)[0]
+        parts = line.split(b" ")
+        if len(parts) != 3 or parts[0] not in HTTP_METHODS:
+            return None
+
+        return [part.decode("latin-1") for part in parts]
+
+    @property
+    def method(self) -> str | None:
+        request = self.request_line
+        return request[0] if request is not None else None
+
+    @property
+    def uri(self) -> str | None:
+        request = self.request_line
+        return request[1] if request is not None else None
+
+    @property
+    def host(self) -> str | None:
+        """
+        Host header of a request without its port
+        """
+        if self.request_line is None:
+            return None
+
+        for line in bytes(self.packet).split(b"\r\n")[1:]:
+            if len(line) == 0:
+                break
+
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"host":
+                host = value.strip().decode("latin-1")
+                return host if host.endswith("]") else host.rsplit(":", 1)[0]
+
+        return None
+
     def summary(self, offset: int) -> str:
         result = f"{' ' * offset}HTTP -> \n"
 
@@ -28,19 +71,15 @@ class Http(Packet):
 
     def get_field(self, fieldname: str) -> None | int | str:
         field = fieldname.split('.')[1]
-        # match field:
-        #     case 'content_type':
-        #         return self.content_type
-        #     case 'tls_version':
-        #         return self.tls_version
-        #     case 'tls_version_str':
-        #         return self.tls_version_str
-        #     case 'length':
-        #         return self.length
-        #     case 'payload':
-        #         return str(self.payload)
-        #     case _:
-        #         return None
+        match field:
+            case 'method':
+                return self.method
+            case 'uri':
+                return self.uri
+            case 'host':
+                return self.host
+            case _:
+                return None
 
     def get_array(self, offset: int, length: int) -> bytes | None:
         if offset < len(self.payload) and (offset + length) < len(self.payload):
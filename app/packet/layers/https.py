@@ -1,5 +1,5 @@
 from enum import Enum
-from struct import unpack
+from struct import error as StructError, unpack
 
 from packet.layers.layer_type import LayerID
 from packet.layers.packet import Packet
@@ -14,6 +14,10 @@ class TlsVersion(Enum):
 
 CONTENT_TYPE = [0x15, 0x16, 0x17]
 
+CONTENT_HANDSHAKE = 0x16
+HANDSHAKE_CLIENT_HELLO = 0x01
+EXTENSION_SERVER_NAME = 0x0000
+
 
 class Https(Packet):
     name = LayerID.HTTPS
@@ -72,6 +76,38 @@ class Https(Packet):
     def payload(self) -> bytes:
         return self.packet[5:]
 
+    @property
+    def server_name(self) -> str | None:
+        """
+        Server name indication of a ClientHello, None for other records
+        """
+        hello = self.payload
+        if self.content_type != CONTENT_HANDSHAKE or len(hello) < 39 or hello[0] != HANDSHAKE_CLIENT_HELLO:
+            return None
+
+        try:
+            # --- Skip handshake header, version, random, session id, ciphers and compressions
+            pos = 38
+            pos += 1 + hello[pos]
+            pos += 2 + unpack("!H", hello[pos:pos + 2])[0]
+            pos += 1 + hello[pos]
+
+            end = min(pos + 2 + unpack("!H", hello[pos:pos + 2])[0], len(hello))
+            pos += 2
+            while pos + 4 <= end:
+                (ext_type, ext_len) = unpack("!HH", hello[pos:pos + 4])
+                pos += 4
+                if ext_type == EXTENSION_SERVER_NAME:
+                    # --- First entry of the list, list length and name type skipped
+                    name_len = unpack("!H", hello[pos + 3:pos + 5])[0]
+                    return bytes(hello[pos + 5:pos + 5 + name_len]).decode("ascii")
+
+                pos += ext_len
+        except (IndexError, UnicodeDecodeError, StructError):
+            return None
+
+        return None
+
     def summary(self, offset: int) -> str:
         result = f"{' ' * offset}HTTPS -> \n"
         result += f"{' ' * offset} Content type.: {self.content_type}"
@@ -101,6 +137,8 @@ class Https(Packet):
                 return self.length
             case 'payload':
                 return str(self.payload)
+            case 'sni':
+                return self.server_name
             case _:
                 return None
 
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Any
 
 from packet.layers.layer_type import LayerID
 
@@ -11,7 +12,7 @@ class Packet(ABC):
         pass
 
     @abstractmethod
-    def get_field(self, fieldname: str) -> None | int | str:
+    def get_field(self, fieldname: str) -> Any:
         return None
 
     @abstractmethod
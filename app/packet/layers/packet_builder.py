@@ -1,6 +1,6 @@
 import base64
 import logging
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Tuple
 
 from packet.layers.arp import ARP
 from packet.layers.dhcp import Dhcp
@@ -76,7 +76,11 @@ class PacketBuilder:
             case other:
                 return None
 
-    def from_bytes(self, raw_packet, header: PktHeader | Frame = None):
+    def from_bytes(self, raw_packet, header: PktHeader | Frame = None, payload: bool = True):
+        """
+        Layers of a raw packet, the application layers and ICMP are left to
+        decode_payload when payload is False
+        """
         self.layers: Dict[LayerID, Packet] = {}
         self.packet = raw_packet
 
@@ -105,6 +109,38 @@ class PacketBuilder:
                 tcp = TCP(raw_packet[offset + 34:])
                 self.add(tcp)
 
+            elif ip.protocol == IP_PROTO_UDP:
+                udp = UDP(raw_packet[offset + 34:])
+                self.add(udp)
+
+        if e.ethertype == ETHER_TYPE_IPV6:
+            ip = IPV6(raw_packet[offset + 14:])
+
+            self.add(ip)
+            if ip.protocol == IP_PROTO_TCP:
+                tcp = TCP(raw_packet[offset + 40:])
+                self.add(tcp)
+            elif ip.protocol == IP_PROTO_UDP:
+                udp = UDP(raw_packet[offset + 40:])
+                self.add(udp)
+
+        if payload:
+            self.decode_payload()
+
+    def decode_payload(self) -> None:
+        """
+        Application layers of the TCP and UDP payloads of an IPv4 packet, and
+        ICMP, on top of the layers of from_bytes
+        """
+        e = self.get_layer(LayerID.ETHERNET)
+        offset = 4 if e.frametype == 0x8100 else 0
+
+        ip = self.get_layer(LayerID.IPV4)
+        if ip is not None:
+            tcp = self.get_layer(LayerID.TCP)
+            udp = self.get_layer(LayerID.UDP)
+
+            if tcp is not None:
                 if tcp.dst_port == 443 and not tcp.flag_syn and not tcp.flag_fin and len(tcp.payload) > 0:
                     https = Https(tcp.payload)
                     if https.is_valid:
@@ -130,9 +166,7 @@ class PacketBuilder:
                     smb = Smb(tcp.payload)
                     self.add(smb)
 
-            elif ip.protocol == IP_PROTO_UDP:
-                udp = UDP(raw_packet[offset + 34:])
-                self.add(udp)
+            elif udp is not None:
                 if udp.src_port in [67, 68] and udp.dst_port in [67, 68]:
                     dhcp = Dhcp(udp.payload)
                     self.add(dhcp)
@@ -144,23 +178,14 @@ class PacketBuilder:
                     self.add(ntp)
 
             elif ip.protocol == IP_PROTO_ICMP:
-                icmp = icmp_builder(raw_packet[offset + 34:])
+                icmp = icmp_builder(self.packet[offset + 34:])
                 if icmp:
                     self.add(icmp)
 
-        if e.ethertype == ETHER_TYPE_IPV6:
-            ip = IPV6(raw_packet[offset + 14:])
-
-            self.add(ip)
-            if ip.protocol == IP_PROTO_TCP:
-                tcp = TCP(raw_packet[offset + 40:])
-                self.add(tcp)
-            elif ip.protocol == IP_PROTO_UDP:
-                udp = UDP(raw_packet[offset + 40:])
-                self.add(udp)
-            elif ip.protocol == IP_PROTO_ICMP:
-                icmp = icmp_builder(raw_packet[offset + 34:])
-                self.add(icmp)
+        ip = self.get_layer(IPV6.name)
+        if ip is not None and ip.protocol == IP_PROTO_ICMP:
+            icmp = icmp_builder(self.packet[offset + 34:])
+            self.add(icmp)
 
     def __str__(self) -> str:
         result = ""
@@ -193,7 +218,7 @@ class PacketBuilder:
         result = self.layers.get(layer_name, None)
         return result is not None
 
-    def get_layer(self, layer_id):
+    def get_layer(self, layer_id) -> Any:
         return self.layers.get(layer_id, None)
 
     def get_field(self, field: str) -> None | int | str | Dict:
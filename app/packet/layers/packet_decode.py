@@ -1,6 +1,6 @@
 import logging
 from struct import unpack
-from typing import List
+from typing import Any, List
 
 from packet.layers.fields import IPv4Address
 from packet.layers.packet_hdr import PktHeader
@@ -29,9 +29,9 @@ class PacketDecode:
 
     __slots__ = ["packet", "header", "offset"]
 
-    def __init__(self):
-        self.packet = bytes()
-        self.header = None
+    def __init__(self) -> None:
+        self.packet: Any = bytes()
+        self.header = PktHeader(0, 0, 0, 0)
         self.offset = 0
 
     def decode(self, header: PktHeader, packet):
@@ -493,6 +493,14 @@ class PacketDecode:
     def ip_payload(self) -> bytes:
         return self.packet[20 + self.offset:]
 
+    @property
+    def tcp_payload(self) -> bytes:
+        return self.packet[self.ip_offset + self.tcp_offset * 4:]
+
+    @property
+    def udp_payload(self) -> bytes:
+        return self.packet[self.ip_offset + 8:]
+
     @property
     def ip_version(self) -> int:
         return (self.packet[self.offset] & 0xf0) >> 4
@@ -17,6 +17,6 @@ class PktHeader:
     def packet_id_int(self) -> int:
         id = self.file_ptr << 32
 
-        id += self.pkt_ptr & 0xffff
+        id += self.pkt_ptr & 0xffffffff
 
         return id
@@ -0,0 +1,334 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+from packet.layers.fields import MacAddress
+from packet.layers.packet_builder import PacketBuilder
+from pql.model import (HOST_NAME_LABELS, Array, BinOp, Boolean, Chain,
+                       ConstDecl, Date, Expression, Grouping, Integer, IPv4,
+                       Label, LabelByte, Mac, NetworkSet, Now, String, Unary)
+from pql.tokens_list import Tokens
+
+log = logging.getLogger("packetdb")
+
+# --- A compiled expression, evaluated with the packet only
+Program = Callable[[PacketBuilder], Any]
+
+# --- Nodes evaluating to themselves
+CONST_NODES = (Array, IPv4, Mac, String, ConstDecl)
+
+
+def now_timestamp(node: Now) -> int:
+    """
+    Timestamp of now() minus its offset, the time of the query is taken
+    when it is parsed
+    """
+    time_result = datetime.fromtimestamp(node.value)
+    if node.modifier == "s":
+        time_result -= timedelta(seconds=node.offset)
+    elif node.modifier == "m":
+        time_result -= timedelta(minutes=node.offset)
+    elif node.modifier == "h":
+        time_result -= timedelta(hours=node.offset)
+    elif node.modifier == "d":
+        time_result -= timedelta(days=node.offset)
+    elif node.modifier == "w":
+        time_result -= timedelta(weeks=node.offset)
+    elif node.modifier == "M":
+        time_result -= timedelta(days=node.offset)
+
+    return int(round(time_result.timestamp()))
+
+
+def compile_expr(node) -> Program:
+    """
+    Closure evaluating the expression on a packet. Fields, constants,
+    network bounds and operators are resolved once here instead of for
+    every packet.
+    """
+    if isinstance(node, Integer):
+        return constant(node.value)
+
+    elif isinstance(node, Date):
+        return constant(node.timestamp)
+
+    elif isinstance(node, Now):
+        return constant(now_timestamp(node))
+
+    elif isinstance(node, Boolean):
+        return constant(node.value)
+
+    elif isinstance(node, CONST_NODES):
+        return constant(node)
+
+    elif isinstance(node, Label):
+        return compile_label(node.value)
+
+    elif isinstance(node, LabelByte):
+        proto, offset, length = node.value, node.offset, node.length
+        return lambda packet: packet.get_byte_field(proto, offset, length)
+
+    elif isinstance(node, Grouping):
+        return compile_expr(node.value)
+
+    elif isinstance(node, Unary):
+        return compile_unary(node)
+
+    elif isinstance(node, BinOp):
+        return compile_binop(node)
+
+    elif isinstance(node, Chain):
+        return compile_chain(node)
+
+    elif isinstance(node, NetworkSet):
+        return compile_networks(node)
+
+    elif isinstance(node, list):
+        programs = [compile_expr(n) for n in node]
+
+        def sequence(packet):
+            result = None
+            for program in programs:
+                result = program(packet)
+            return result
+
+        return sequence
+
+    raise RuntimeError(f"Can't interpret {node}")
+
+
+def constant(value) -> Program:
+    return lambda packet: value
+
+
+def compile_label(field: str) -> Program:
+    def label(packet):
+        value = packet.get_field(field)
+        if isinstance(value, IPv4):
+            return value.to_int
+        elif isinstance(value, MacAddress):
+            return value.to_int()
+        else:
+            return value
+
+    return label
+
+
+def compile_unary(node: Unary) -> Program:
+    value = compile_expr(node.value)
+
+    if node.op == "-":
+        return lambda packet: value(packet) * -1
+    elif node.op == "+":
+        return value
+    elif node.op == "!":
+        return lambda packet: not value(packet)
+
+    raise RuntimeError(f"Can't interpret {node}")
+
+
+def const_node(node) -> Expression | None:
+    """
+    The constant node of an operand, None when it depends on the packet
+    """
+    while isinstance(node, Grouping):
+        node = node.value
+
+    return node if isinstance(node, CONST_NODES + (Boolean,)) else None
+
+
+def compile_binop(node: BinOp) -> Program:
+    op = node.op
+    left = compile_expr(node.left)
+    right = compile_expr(node.right)
+
+    if op == Tokens.TOK_EQ:
+        return compile_eq(left, right, const_node(node.right), node.left)
+    elif op == Tokens.TOK_NE:
+        return compile_ne(left, right, const_node(node.right), node.left)
+    elif op == Tokens.TOK_TO:
+        return lambda packet: is_conversation(packet, left(packet), right(packet))
+    elif op == Tokens.TOK_WILDCARD:
+        return constant("*")
+
+    elif op == Tokens.TOK_LAND:
+        return lambda packet: left(packet) and right(packet)
+    elif op == Tokens.TOK_LOR:
+        return lambda packet: left(packet) or right(packet)
+
+    elif op == Tokens.TOK_PLUS:
+        return lambda packet: left(packet) + right(packet)
+    elif op == Tokens.TOK_MINUS:
+        return lambda packet: left(packet) - right(packet)
+    elif op == Tokens.TOK_LT:
+        return lambda packet: left(packet) < right(packet)
+    elif op == Tokens.TOK_LE:
+        return lambda packet: left(packet) <= right(packet)
+    elif op == Tokens.TOK_GT:
+        return lambda packet: left(packet) > right(packet)
+    elif op == Tokens.TOK_GE:
+        return lambda packet: left(packet) >= right(packet)
+    elif op == Tokens.TOK_BITSHIFT_RIGHT:
+        return lambda packet: int(left(packet)) >> int(right(packet))
+    elif op == Tokens.TOK_BITSHIFT_LEFT:
+        return lambda packet: int(left(packet)) << int(right(packet))
+    elif op == Tokens.TOK_BIT_AND:
+        return lambda packet: int(left(packet)) & int(right(packet))
+    elif op == Tokens.TOK_BIT_OR:
+        return lambda packet: int(left(packet)) | int(right(packet))
+    elif op == Tokens.TOK_BIT_XOR:
+        return lambda packet: int(left(packet)) ^ int(right(packet))
+
+    raise RuntimeError(f"Can't interpret {node}")
+
+
+def compile_chain(node: Chain) -> Program:
+    """
+    Operands evaluated in order, and stops at the first false one, or at
+    the first true one
+    """
+    programs = tuple(compile_expr(value) for value in node.values)
+
+    if node.op == Tokens.TOK_LAND:
+        def all_of(packet):
+            result = True
+            for program in programs:
+                if not (result := program(packet)):
+                    return result
+            return result
+        return all_of
+    elif node.op == Tokens.TOK_LOR:
+        def any_of(packet):
+            result = False
+            for program in programs:
+                if result := program(packet):
+                    return result
+            return result
+        return any_of
+
+    raise RuntimeError(f"Can't interpret {node}")
+
+
+def compile_networks(node: NetworkSet) -> Program:
+    """
+    Address in the networks with one binary search, a packet without the
+    field is in none of them
+    """
+    field = compile_label(node.label.value)
+    search = node.search
+    negate = node.negate
+
+    def in_networks(packet):
+        address = field(packet)
+        if address is None:
+            return negate
+
+        return (address in search) != negate
+
+    return in_networks
+
+
+def is_host_name(node) -> bool:
+    return isinstance(node, Label) and node.value in HOST_NAME_LABELS
+
+
+def compile_eq(left: Program, right: Program, const, label=None) -> Program:
+    """
+    Equality specialized on the type of a constant right operand, a
+    network matches the addresses inside its bounds
+    """
+    if isinstance(const, IPv4):
+        low, high = const.min, const.max
+
+        def in_network(packet):
+            address = left(packet)
+            return address >= low and address <= high
+        return in_network
+    elif isinstance(const, Mac):
+        mac = const.to_int
+        return lambda packet: left(packet) == mac
+    elif isinstance(const, String) and is_host_name(label):
+        return lambda packet: const.matches_name(left(packet))
+    elif isinstance(const, String):
+        return lambda packet: const.matches(left(packet))
+    elif isinstance(const, Array):
+        array = const.value
+        return lambda packet: left(packet) == array
+    elif isinstance(const, ConstDecl):
+        layer = const.value
+        return lambda packet: packet.has_layer(layer)
+    elif isinstance(const, Boolean):
+        flag = int(const.value)
+        return lambda packet: int(left(packet)) == flag
+
+    return lambda packet: equal(packet, left(packet), right(packet))
+
+
+def compile_ne(left: Program, right: Program, const, label=None) -> Program:
+    if isinstance(const, IPv4):
+        low, high = const.min, const.max
+
+        def not_in_network(packet):
+            address = left(packet)
+            return not (address >= low and address <= high)
+        return not_in_network
+    elif isinstance(const, Mac):
+        mac = const.to_int
+        return lambda packet: left(packet) != mac
+    elif isinstance(const, String) and is_host_name(label):
+        return lambda packet: not const.matches_name(left(packet))
+    elif isinstance(const, String):
+        return lambda packet: not const.matches(left(packet))
+
+    return lambda packet: not_equal(left(packet), right(packet))
+
+
+def equal(packet: PacketBuilder, leftval, rightval) -> bool:
+    """
+    Equality of operands only known with the packet
+    """
+    if isinstance(rightval, IPv4):
+        return rightval.is_in_network(leftval)
+    elif isinstance(rightval, Mac):
+        return leftval == rightval.to_int
+    elif isinstance(rightval, String):
+        return rightval.matches(leftval)
+    elif isinstance(rightval, Array):
+        return leftval == rightval.value
+    elif isinstance(rightval, ConstDecl):
+        return packet.has_layer(rightval.value)
+    elif isinstance(rightval, bool):
+        return int(leftval) == int(rightval)
+    else:
+        return leftval == rightval
+
+
+def not_equal(leftval, rightval) -> bool:
+    if isinstance(rightval, IPv4):
+        return not rightval.is_in_network(leftval)
+    elif isinstance(rightval, Mac):
+        return leftval != rightval.to_int
+    elif isinstance(rightval, String):
+        return not rightval.matches(leftval)
+    else:
+        return leftval != rightval
+
+
+def is_conversation(packet: PacketBuilder, left: IPv4, right: IPv4) -> bool:
+    """
+    True when the packet goes between the two hosts or networks, either way
+    """
+    ip_src = int_ip(packet.get_field("ip.src"))
+    ip_dst = int_ip(packet.get_field("ip.dst"))
+    if ip_src is None or ip_dst is None:
+        return False
+
+    return ((left.is_in_network(ip_src) and right.is_in_network(ip_dst)) or
+            (right.is_in_network(ip_src) and left.is_in_network(ip_dst)))
+
+
+def int_ip(value) -> int | None:
+    if isinstance(value, IPv4):
+        return value.to_int
+    else:
+        return value
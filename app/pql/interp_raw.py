@@ -1,16 +1,15 @@
 # interp.py
 
 import logging
-from datetime import datetime, timedelta
+from typing import Tuple
 
 from dbase.packet_ptr import PktPtr
-from packet.layers.layer_type import LayerID
 from packet.layers.packet_builder import PacketBuilder
-from pql.model import (Array, BinOp, Boolean, ConstDecl, Date, Grouping,
-                       Integer, IPv4, Label, LabelByte, Mac, Now,
-                       SelectStatement, Unary)
+from packet.layers.packet_hdr import PktHeader
+from pql.compiler import Program, compile_expr
+from pql.optimizer import optimize, split_header
+from pql.pcap_reader import PcapReaderPool
 from pql.pcapfile import PcapFile
-from pql.tokens_list import Tokens
 
 # ---------------------------------------------
 # Process a pcap file to filter
@@ -20,174 +19,69 @@ from pql.tokens_list import Tokens
 log = logging.getLogger("packetdb")
 
 
-def exec_program(model, pkt_ref: PktPtr):
-    pfile = PcapFile()
-    pfile.open(f"{pkt_ref.file_id}")
-    env = {}
+def read_packet(pkt_ref: PktPtr, readers: PcapReaderPool | None = None) -> Tuple[PktHeader, bytes]:
+    # --- Packets fetched with their batch are already in memory
+    if pkt_ref.header is not None and pkt_ref.packet is not None:
+        hdr, pkt = pkt_ref.header, pkt_ref.packet
+    else:
+        pfile = PcapFile()
+        if readers is not None:
+            pfile.open(f"{pkt_ref.file_id}", readers.get(pkt_ref.file_id))
+        else:
+            pfile.open(f"{pkt_ref.file_id}")
+
+        hdr, pkt = pfile.get(pkt_ref.ptr, 0)
+
+    return (hdr, bytes(pkt))
+
+
+def load_packet(pkt_ref: PktPtr, readers: PcapReaderPool | None = None) -> PacketBuilder:
+    hdr, pkt = read_packet(pkt_ref, readers)
 
-    hdr, pkt = pfile.get(pkt_ref.ptr, 0)
     pb = PacketBuilder()
     pb.from_bytes(pkt, hdr)
-    # log.debug(pb)
-    if interpret(model, env, pb):
-        return pb
-    else:
-        return None
+    return pb
 
 
-def cmp_array(left, right) -> bool:
-    if len(left) != len(right):
-        return False
+class WhereFilter:
+    """
+    WHERE clause in two phases: the predicates on the L2-L4 headers run on
+    the header layers, read straight from the raw bytes, and the
+    application layers are only decoded for the packets passing them
+    """
 
-    for l, r in zip(left, right):
-        if l != r:
-            return False
-    return True
+    def __init__(self, where_expr) -> None:
+        header, rest = split_header(optimize(where_expr))
+        self.header: Program | None = compile_expr(header) if header is not None else None
+        self.rest: Program | None = compile_expr(rest) if rest is not None else None
 
 
-def interpret(node, env, packet: PacketBuilder):
-    if isinstance(node, Integer):
-        return node.value
+def exec_program(where: WhereFilter, pkt_ref: PktPtr, readers: PcapReaderPool | None = None,
+                 project: bool = True) -> PacketBuilder | None:
+    """
+    The packet when the WHERE clause is true, with all its layers for the
+    select when project is set
+    """
+    hdr, pkt = read_packet(pkt_ref, readers)
 
-    elif isinstance(node, Date):
-        return node.timestamp
+    pb = PacketBuilder()
+    if where.header is not None:
+        pb.from_bytes(pkt, hdr, payload=False)
+        if not where.header(pb):
+            return None
 
-    elif isinstance(node, Label):
-        value = packet.get_field(node.value)
-        if isinstance(value, IPv4):
-            return value.to_int
-        else:
-            return value
-    elif isinstance(node, LabelByte):
-        value = packet.get_byte_field(node.value, node.offset, node.length)
-        return value
-
-    elif isinstance(node, Array):
-        return node
-
-    elif isinstance(node, IPv4):
-        return node
-
-    elif isinstance(node, Mac):
-        return node
-
-    elif isinstance(node, ConstDecl):
-        return node
-
-    elif isinstance(node, Now):
-        time_result = datetime.fromtimestamp(node.value)
-        if node.modifier == "s":
-            time_result -= timedelta(seconds=node.offset)
-        elif node.modifier == "m":
-            time_result -= timedelta(minutes=node.offset)
-        elif node.modifier == "h":
-            time_result -= timedelta(hours=node.offset)
-        elif node.modifier == "d":
-            time_result -= timedelta(days=node.offset)
-        elif node.modifier == "w":
-            time_result -= timedelta(weeks=node.offset)
-        elif node.modifier == "M":
-            time_result -= timedelta(days=node.offset)
-
-        # print(f"In Now {int(round(time_result.timestamp()))}")
-        return int(round(time_result.timestamp()))
-
-    elif isinstance(node, SelectStatement):
-        value = interpret(node.select_expr, env, packet)
-        return None
+        if where.rest is None and not project:
+            return pb
 
-    elif isinstance(node, Unary):
-        value = interpret(node.value, env, packet)
-        if node.op == "-":
-            return value * -1
-        elif node.op == "+":
-            return value
-        elif node.op == "!":
-            return not value
-
-    elif isinstance(node, Grouping):
-        return interpret(node.value, env, packet)
-
-    elif isinstance(node, Boolean):
-        return node.value
-
-    elif isinstance(node, BinOp):
-        leftval = interpret(node.left, env, packet)
-        rightval = interpret(node.right, env, packet)
-
-        # if node.op == "/":
-        #     return IPv4(leftval).to_network(rightval)[0] <= IPv4(leftval).to_network(rightval)[1]
-        if node.op == Tokens.TOK_TO:
-            return f"(ip_src = {leftval} and ip_dst = {rightval}) or (ip_dst = {leftval} and ip_src = {rightval})"
-        # elif node.op == "in":
-        #     rern rightval.is_in_network(leftval)
-        elif node.op == Tokens.TOK_WILDCARD:
-            return "*"
-            # return leftval * rightval
-        elif node.op == Tokens.TOK_PLUS:
-            return leftval + rightval
-        elif node.op == Tokens.TOK_MINUS:
-            return leftval - rightval
-        elif node.op == Tokens.TOK_LT:
-            return leftval < rightval
-        elif node.op == Tokens.TOK_LE:
-            return leftval <= rightval
-        elif node.op == Tokens.TOK_GT:
-            return leftval > rightval
-        elif node.op == Tokens.TOK_GE:
-            # print(f"{leftval},{rightval}")
-            return leftval >= rightval
-        elif node.op == Tokens.TOK_EQ:
-            # print(f"Equality: {leftval}, {rightval}")
-            if isinstance(rightval, IPv4):
-                return rightval.is_in_network(leftval)
-            elif isinstance(rightval, Mac):
-                return leftval == rightval.to_int
-            elif isinstance(rightval, Array):
-                return leftval == rightval.value
-            elif isinstance(rightval, ConstDecl):
-                return packet.has_layer(rightval.value)
-            elif isinstance(rightval, bool):
-                # log.debug(f"BOOLEAN EVAL: {leftval},{rightval}")
-                return int(leftval) == int(rightval)
-            else:
-                return leftval == rightval
-        elif node.op == Tokens.TOK_LAND:
-            return leftval and rightval
-        elif node.op == Tokens.TOK_LOR:
-            return leftval or rightval
-        elif node.op == Tokens.TOK_NE:
-            if isinstance(rightval, IPv4):
-                return not rightval.is_in_network(leftval)
-            elif isinstance(rightval, Mac):
-                return leftval != rightval.to_int
-            else:
-                return leftval != rightval
-        elif node.op == Tokens.TOK_BITSHIFT_RIGHT:
-            return int(leftval) >> int(rightval)
-        elif node.op == Tokens.TOK_BITSHIFT_LEFT:
-            return int(leftval) << int(rightval)
-        elif node.op == Tokens.TOK_BIT_AND:
-            return int(leftval) & int(rightval)
-        elif node.op == Tokens.TOK_BIT_OR:
-            return int(leftval) | int(rightval)
-        elif node.op == Tokens.TOK_BIT_XOR:
-            return int(leftval) ^ int(rightval)
-
-    elif isinstance(node, list):
-        result = None
-        for n in node:
-            result = interpret(n, env, packet)
-        return result
-
-    raise RuntimeError(f"Can't interpret {node}")
-
-
-def int_ip(value):
-    if isinstance(value, IPv4):
-        return value.to_int
+        pb.decode_payload()
     else:
-        return value
+        pb.from_bytes(pkt, hdr)
+
+    # log.debug(pb)
+    if where.rest is None or where.rest(pb):
+        return pb
+    else:
+        return None
 
 
 class Break(Exception):
@@ -76,7 +76,7 @@ _token_comment = {"//", "/*", "*/"}
 
 
 class Token:
-    def __init__(self, type: int, value: str, line: int, col: int):
+    def __init__(self, type: Tokens, value: str, line: int, col: int):
         # def __init__(self, type: Tok, value: str, line: int, col: int):
         self.type: Tokens = type
         # self.type: Tok = type
@@ -127,8 +127,8 @@ class Lexer:
             #     print(f'TIMESPAN FOUND')
 
             # --- String
-            # elif self.is_string():
-            #     token = self.read_string()
+            elif self.text[self.pos] == '"':
+                token = self.read_string()
 
             # --- Token 2 characters
             elif self.text[self.pos: self.pos + 2] in _token2:
@@ -175,6 +175,19 @@ class Lexer:
         return self.token_list
         # yield (Token(TOK_EOF, "EOF", self.line, self.col))
 
+    def read_string(self) -> Token:
+        tok_start = self.pos + 1
+        end = self.text.find('"', tok_start)
+        if end < 0:
+            raise SyntaxError(f"Unterminated string at line: {self.line} col: {self.col}")
+
+        value = self.text[tok_start: end]
+        token = Token(Tokens.TOK_STRING, value, self.line, self.col)
+
+        self.pos = end + 1
+        self.col += len(value) + 2
+        return token
+
     def is_hex_digit(self, c: str) -> bool:
         if self.pos + 1 < self.text_len:
             return c.isdigit() and self.text[self.pos + 1] == 'x'
@@ -1,7 +1,8 @@
 from datetime import datetime
 from functools import lru_cache
-from typing import List
+from typing import List, Tuple
 
+from dbase.ipv4_search import Ipv4Search
 from packet.layers.fields import IPv4Address, MacAddress
 from packet.layers.layer_type import LayerID
 from pql.aggregate import Aggregate
@@ -9,6 +10,11 @@ from pql.aggregate import Aggregate
 # from pql.pql_constant import Constants
 
 
+# --- Fields holding host names, compared case insensitively and matched
+#     by "*." domains, the other strings are compared byte for byte
+HOST_NAME_LABELS = ("dns.query", "https.sni", "http.host")
+
+
 class Node:
     pass
 
@@ -26,7 +32,7 @@ class Expression(Node):
 
 
 class Unary(Expression):
-    def __init__(self, op, value):
+    def __init__(self, op, value) -> None:
         self.op = op
         self.value = value
 
@@ -72,7 +78,7 @@ class VarDecl(Expression):
 
 
 class Label(Expression):
-    def __init__(self, value):
+    def __init__(self, value) -> None:
         self._value = value
 
     @property
@@ -149,7 +155,6 @@ class SelectStatement(Statement):
         from_fields,
         include_field,
         index_field,
-        ip_list,
         where_expr,
         groupby_fields=None,
         orderby_fields=None,
@@ -165,7 +170,6 @@ class SelectStatement(Statement):
         self.from_fields = from_fields
         self.include = include_field
         self.index_field = index_field
-        self.ip_list = ip_list
         self.where_expr = where_expr
         self.groupby_fields = groupby_fields
         self.orderby_fields = orderby_fields
@@ -228,7 +232,7 @@ class SelectStatement(Statement):
     def __repr__(self) -> str:
         return f"""SelectStatement Select: {self.select_expr},
                    From: {repr(self.from_fields)},
-                   Index: {self.index_field}, IP: {self.ip_list},
+                   Index: {self.index_field},
                    Include: {self.include},
                    Where: {repr(self.where_expr)},
                    Group By: {self.has_groupby}: {self.groupby_fields},
@@ -257,6 +261,30 @@ class String(Expression):
     def __repr__(self):
         return f"String({self.value})"
 
+    @property
+    def is_suffix(self) -> bool:
+        return self.value.startswith("*.")
+
+    def matches(self, value) -> bool:
+        """
+        Byte exact comparison with a string
+        """
+        return isinstance(value, str) and value == self.value
+
+    def matches_name(self, name) -> bool:
+        """
+        Case insensitive comparison with a host name, "*.domain" matches
+        the names under the domain
+        """
+        if not isinstance(name, str):
+            return False
+
+        name = name.lower().rstrip(".")
+        if self.is_suffix:
+            return name.endswith(self.value[1:].lower())
+
+        return name == self.value.lower().rstrip(".")
+
 
 class Float(Expression):
     def __init__(self, value):
@@ -303,7 +331,7 @@ class Mac(Expression):
 
 
 class Integer(Expression):
-    def __init__(self, value):
+    def __init__(self, value) -> None:
         if isinstance(value, str):
             self._value = int(value)
         else:
@@ -319,7 +347,7 @@ class Integer(Expression):
 
 
 class Boolean(Expression):
-    def __init__(self, value):
+    def __init__(self, value) -> None:
         self.value = True if value == "true" else False
 
     def __repr__(self):
@@ -335,10 +363,43 @@ class Grouping(Expression):
 
 
 class BinOp(Expression):
-    def __init__(self, op, left, right):
+    def __init__(self, op, left, right) -> None:
         self.op = op
         self.left = left
         self.right = right
 
     def __repr__(self):
         return f"BinOp({self.op}, {self.left}, {self.right})"
+
+
+class Chain(Expression):
+    """
+    Operands of consecutive and / or, evaluated in order until the result
+    is known
+    """
+
+    def __init__(self, op, values: list):
+        self.op = op
+        self.values = values
+
+    def __repr__(self):
+        return f"Chain({self.op}, {self.values})"
+
+
+class NetworkSet(Expression):
+    """
+    Address field within one of the networks of search, or outside all of
+    them when negated
+    """
+
+    def __init__(self, label: Label, search: Ipv4Search, negate: bool = False):
+        self.label = label
+        self.search = search
+        self.negate = negate
+
+    @property
+    def ranges(self) -> List[Tuple[int, int]]:
+        return self.search.ranges
+
+    def __repr__(self):
+        return f"NetworkSet({self.label}, {self.ranges}, {self.negate})"
@@ -0,0 +1,250 @@
+import logging
+from typing import Tuple
+
+from dbase.ipv4_search import Ipv4Search, network_range
+from pql.compiler import now_timestamp
+from pql.model import (Array, BinOp, Boolean, Chain, Date, Expression,
+                       Grouping, Integer, IPv4, Label, LabelByte, Mac,
+                       NetworkSet, Now, String, Unary)
+from pql.tokens_list import Tokens
+
+log = logging.getLogger("packetdb")
+
+# --- Protocols of the fields decoded from the packet headers, the fields of
+#     the index records are among them
+HEADER_PROTOS = ("frame", "eth", "arp", "ip", "tcp", "udp")
+
+# --- Fields of the whole packet rather than of its headers
+PACKET_LABELS = ("frame.packet", "frame.all")
+
+# --- Evaluation cost of a predicate, the cheapest come first in a chain
+COST_LAYER = 0
+COST_HEADER = 1
+COST_BYTES = 2
+COST_PAYLOAD = 3
+
+
+def optimize(node) -> Expression | None:
+    """
+    Rewrite of a WHERE expression for compile_expr: constants folded,
+    and / or turned into short-circuit chains with the network tests of a
+    field merged and the cheapest predicates first
+    """
+    if node is None:
+        return None
+
+    return build_chains(fold_constants(node))
+
+
+# --- Constant folding, the result is still a tree of the parser nodes and
+#     can be planned
+
+
+def boolean(value: bool) -> Boolean:
+    return Boolean("true" if value else "false")
+
+
+def fold_int(op, left: int, right: int) -> int | None:
+    if op == Tokens.TOK_PLUS:
+        return left + right
+    elif op == Tokens.TOK_MINUS:
+        return left - right
+    elif op == Tokens.TOK_BITSHIFT_RIGHT:
+        return left >> right
+    elif op == Tokens.TOK_BITSHIFT_LEFT:
+        return left << right
+    elif op == Tokens.TOK_BIT_AND:
+        return left & right
+    elif op == Tokens.TOK_BIT_OR:
+        return left | right
+    elif op == Tokens.TOK_BIT_XOR:
+        return left ^ right
+
+    return None
+
+
+def fold_constants(node) -> Expression | None:
+    """
+    now(), dates and integer arithmetic evaluated once, groupings removed,
+    and / or with a boolean constant reduced
+    """
+    if isinstance(node, Now):
+        return Integer(now_timestamp(node))
+
+    elif isinstance(node, Date):
+        try:
+            return Integer(node.timestamp)
+        except ValueError:
+            return node
+
+    elif isinstance(node, Grouping):
+        return fold_constants(node.value)
+
+    elif isinstance(node, Unary):
+        value = fold_constants(node.value)
+        if isinstance(value, Integer) and node.op == "-":
+            return Integer(-value.value)
+        elif isinstance(value, Integer) and node.op == "+":
+            return value
+        elif isinstance(value, Boolean) and node.op == "!":
+            return boolean(not value.value)
+
+        return Unary(node.op, value)
+
+    elif isinstance(node, BinOp):
+        left = fold_constants(node.left)
+        right = fold_constants(node.right)
+
+        if isinstance(left, Integer) and isinstance(right, Integer):
+            if (folded := fold_int(node.op, left.value, right.value)) is not None:
+                return Integer(folded)
+
+        if node.op in (Tokens.TOK_LAND, Tokens.TOK_LOR):
+            # --- The constant decides the result or leaves the other operand
+            decides = node.op == Tokens.TOK_LOR
+            for const, other in ((left, right), (right, left)):
+                if isinstance(const, Boolean):
+                    return const if const.value == decides else other
+
+        return BinOp(node.op, left, right)
+
+    return node
+
+
+# --- Chains of and / or
+
+
+def build_chains(node) -> Expression:
+    if isinstance(node, BinOp) and node.op in (Tokens.TOK_LAND, Tokens.TOK_LOR):
+        operands = [build_chains(operand) for operand in chain_operands(node, node.op)]
+        operands = sorted(merge_networks(node.op, operands), key=cost)
+        return operands[0] if len(operands) == 1 else Chain(node.op, operands)
+
+    elif isinstance(node, BinOp):
+        return BinOp(node.op, build_chains(node.left), build_chains(node.right))
+
+    elif isinstance(node, Unary):
+        return Unary(node.op, build_chains(node.value))
+
+    return node
+
+
+def chain_operands(node, op) -> list:
+    if isinstance(node, BinOp) and node.op == op:
+        return chain_operands(node.left, op) + chain_operands(node.right, op)
+
+    return [node]
+
+
+def network_test(node) -> Tuple[str, bool] | None:
+    """
+    (field, equal) of the comparison of a field with a network
+    """
+    if (isinstance(node, BinOp) and node.op in (Tokens.TOK_EQ, Tokens.TOK_NE) and
+            isinstance(node.left, Label) and isinstance(node.right, IPv4)):
+        return (node.left.value, node.op == Tokens.TOK_EQ)
+
+    return None
+
+
+def merge_networks(op, operands: list) -> list:
+    """
+    Network tests of the same field and the same polarity as one test of
+    the union or the intersection of their ranges
+    """
+    groups: dict[Tuple[str, bool], list[BinOp]] = {}
+    for operand in operands:
+        if (key := network_test(operand)) is not None:
+            groups.setdefault(key, []).append(operand)
+
+    result = []
+    for operand in operands:
+        key = network_test(operand)
+        if key is None or len(groups[key]) == 1:
+            result.append(operand)
+        elif groups[key][0] is operand:
+            field, equal = key
+            address_list = [(test.right.to_int, test.right.mask) for test in groups[key]]
+            # --- a or b keeps the addresses of either network, a and b those
+            #     of both, the negated tests the other way round
+            if (op == Tokens.TOK_LOR) != equal:
+                address_list = intersection(address_list)
+            result.append(NetworkSet(Label(field), Ipv4Search.compile(address_list), negate=not equal))
+
+    return result
+
+
+def intersection(address_list: list[Tuple[int, int]]) -> list[Tuple[int, int]]:
+    """
+    Networks are nested or disjoint, the narrowest one is the intersection
+    when it is inside all the others
+    """
+    ip, netmask = max(address_list, key=lambda address: address[1])
+    start, _ = network_range(ip, netmask)
+    if all(start in Ipv4Search.compile([address]) for address in address_list):
+        return [(ip, netmask)]
+
+    return []
+
+
+def cost(node) -> int:
+    if isinstance(node, Label):
+        return COST_HEADER if node.value.split(".")[0] in HEADER_PROTOS else COST_PAYLOAD
+    elif isinstance(node, LabelByte):
+        return COST_BYTES
+    elif isinstance(node, NetworkSet):
+        return cost(node.label)
+    elif isinstance(node, BinOp):
+        return max(cost(node.left), cost(node.right))
+    elif isinstance(node, Unary):
+        return cost(node.value)
+    elif isinstance(node, Chain):
+        return max(cost(value) for value in node.values)
+
+    # --- Constants and layer tests
+    return COST_LAYER
+
+
+# --- Predicates of the packet headers
+
+
+def header_only(node) -> bool:
+    """
+    True when the expression reads the L2-L4 headers only, with the same
+    result on a packet decoded without its application layers
+    """
+    if isinstance(node, Label):
+        return node.value.split(".")[0] in HEADER_PROTOS and node.value not in PACKET_LABELS
+    elif isinstance(node, LabelByte):
+        return node.value in HEADER_PROTOS
+    elif isinstance(node, NetworkSet):
+        return header_only(node.label)
+    elif isinstance(node, BinOp):
+        return header_only(node.left) and header_only(node.right)
+    elif isinstance(node, Unary):
+        return header_only(node.value)
+    elif isinstance(node, Chain):
+        return all(header_only(value) for value in node.values)
+
+    # --- Layer tests need the application layers
+    return isinstance(node, (Integer, Boolean, Date, IPv4, Mac, String, Array))
+
+
+def conjunction(values: list):
+    if len(values) == 0:
+        return None
+
+    return values[0] if len(values) == 1 else Chain(Tokens.TOK_LAND, values)
+
+
+def split_header(node) -> Tuple:
+    """
+    (header, rest) of an optimized expression, the conjuncts on the packet
+    headers and the others, None when there are none
+    """
+    if node is None:
+        return (None, None)
+
+    values = node.values if isinstance(node, Chain) and node.op == Tokens.TOK_LAND else [node]
+    return (conjunction([value for value in values if header_only(value)]),
+            conjunction([value for value in values if not header_only(value)]))
@@ -30,6 +30,19 @@ BGP = 0x4000000
 SMB = 0x8000000
 ICMP_UNREACHABLE = 0x10000000
 
+# --- Bits of the TCP flags field of the wide index records
+TCP_FLAGS = {
+    "tcp.flag_fin": 0x01,
+    "tcp.flag_syn": 0x02,
+    "tcp.flag_rst": 0x04,
+    "tcp.flag_push": 0x08,
+    "tcp.flag_ack": 0x10,
+    "tcp.flag_urg": 0x20,
+    "tcp.flag_ece": 0x40,
+    "tcp.flag_cwr": 0x80,
+    "tcp.flag_ns": 0x100,
+}
+
 
 def packet_index(pd: PacketDecode) -> int:
     pindex = 0
@@ -98,7 +111,7 @@ def packet_index(pd: PacketDecode) -> int:
     return pindex
 
 
-def build_search_index(index_set: set[int]) -> int:
+def build_search_index(index_set: set[str]) -> int:
     pindex = 0
 
     if 'ETH' in index_set:
@@ -156,5 +169,4 @@ def build_search_index(index_set: set[int]) -> int:
     if 'SMB' in index_set:
         pindex = pindex + SMB
 
-    print(f"Search index: {pindex:x} in {index_set}")
     return pindex
@@ -14,8 +14,6 @@ index_field = set()
 # ip_list = set()
 # prev_label = []
 prev_ip = 0
-ip_search = {'ip.src': [], 'ip.dst': []}
-port_search = {'sport': [], 'dport': []}
 id = []
 
 log = logging.getLogger("packetdb")
@@ -269,7 +267,6 @@ def parse_select(tokens):
                            from_fields,
                            None,
                            index_field,
-                           ip_search,
                            where_value,
                            groupby_value,
                            orderby_value,
@@ -320,10 +317,6 @@ def parse_integer(tokens):
     if tokens.prev_label is not None and tokens.prev_label == "frame.id":
         log.debug(f"FOUND packet ID: {token.value}")
         id.append(int(token.value))
-    # --- Check if value is assigned to an index field
-    elif tokens.prev_label is not None:
-        log.debug(f"Label: {tokens.prev_label}, {token.value}")
-        ip_search[tokens.prev_label.split(".")[1]].append(int(token.value))
 
     return Integer(token.value)
 
@@ -362,11 +355,7 @@ def parse_ipv4(tokens):
         mask = tokens.expect(Tokens.TOK_INTEGER)
         mask_value = mask.value
 
-    ip_addr = IPv4(token.value, mask_value)
-    if tokens.prev_label is not None:
-        ip_search[tokens.prev_label].append((ip_addr.to_int, int(mask_value)))
-
-    return ip_addr
+    return IPv4(token.value, mask_value)
 
 
 def parse_mac(tokens):
@@ -445,6 +434,8 @@ def parse_and(tokens):
 
 
 def parse_relation(tokens):
+    # --- Values only belong to the label of their own relation
+    tokens.prev_label = None
     leftval = parse_sum(tokens)
 
     optok = tokens.accept(Tokens.TOK_LT, Tokens.TOK_LE, Tokens.TOK_GT,
@@ -455,9 +446,7 @@ def parse_relation(tokens):
                           Tokens.TOK_BIT_OR, Tokens.TOK_BIT_XOR)
     if not optok:
         return leftval
-    binop = BinOp(optok.type, leftval, parse_sum(tokens))
-
-    return binop
+    return BinOp(optok.type, leftval, parse_sum(tokens))
 
 
 def parse_sum(tokens):
@@ -561,8 +550,6 @@ def parse_unary(tokens):
 def parse_source(text):
     global index_field
     index_field = set()
-    global ip_search
-    ip_search = {'ip.src': [], 'ip.dst': [], 'sport': [], 'dport': []}
     global id
     id = []
     tokens = tokenize(text)
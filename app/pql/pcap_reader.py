@@ -0,0 +1,196 @@
+import logging
+import mmap
+import os
+from struct import Struct, unpack_from
+from typing import Any, Generator, Iterable, Tuple
+
+from config.config import Config
+from dbase.packet_ptr import PktPtr
+from packet.layers.packet_hdr import PktHeader
+
+log = logging.getLogger("packetdb")
+
+PCAP_GLOBAL_HEADER_SIZE = 24
+PCAP_PACKET_HEADER_SIZE = 16
+MAGIC_BE = 0xa1b2c3d4
+
+HEADER_BE = Struct("!IIII")
+HEADER_LE = Struct("<IIII")
+
+# --- Packets of a batch less than this apart are copied with one read,
+# --- up to the maximum size of a read
+COALESCE_GAP = 64 * 1024
+COALESCE_MAX = 8 * 1024 * 1024
+
+# --- Packets read per batch, batches double up to the maximum so a query
+# --- with a small TOP doesn't read far beyond its last result
+FETCH_BATCH_MIN = 64
+FETCH_BATCH_MAX = 4096
+
+
+class PcapReader:
+    """
+    Memory mapped view of a pcap file. The global header is decoded once
+    when the file is opened and packets are returned as memoryview slices
+    of the mapping, no bytes are copied until the caller asks for them.
+    """
+
+    def __init__(self, file_id: int | str):
+        self.file_id = int(file_id)
+        self.filename = f"{Config.pcap_path()}/{file_id}.pcap"
+        self.map = None
+        self.view = memoryview(b"")
+        self.header_fmt = HEADER_LE
+        self.reads = 0
+
+        with open(self.filename, "rb") as fd:
+            if os.fstat(fd.fileno()).st_size >= PCAP_GLOBAL_HEADER_SIZE:
+                self.map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+                self.view = memoryview(self.map)
+
+        if self.map is not None and unpack_from("!I", self.view, 0)[0] == MAGIC_BE:
+            self.header_fmt = HEADER_BE
+
+    @property
+    def size(self) -> int:
+        return len(self.view)
+
+    def header(self, ptr: int) -> PktHeader | None:
+        if ptr + PCAP_PACKET_HEADER_SIZE > self.size:
+            return None
+
+        (timestamp, ts_offset, orig_len,
+         incl_len) = self.header_fmt.unpack_from(self.view, ptr)
+
+        return PktHeader(timestamp=timestamp, ts_offset=ts_offset, orig_len=orig_len, incl_len=incl_len,
+                         file_ptr=self.file_id, pkt_ptr=ptr)
+
+    def packet(self, ptr: int, hdr_size: int = 0) -> Tuple[PktHeader, memoryview] | None:
+        pkt_header = self.header(ptr)
+        if pkt_header is None:
+            return None
+
+        start = ptr + PCAP_PACKET_HEADER_SIZE
+        length = pkt_header.incl_len if hdr_size == 0 else hdr_size
+
+        return (pkt_header, self.view[start:start + length])
+
+    def read_batch(self, ptr_list: list[int]) -> dict[int, Tuple[PktHeader, memoryview]]:
+        """
+        Packets at the offsets, read in offset order. Neighbouring packets
+        are read together, the pages of a run are requested from the kernel
+        with one call and copied once.
+        """
+        result: dict[int, Tuple[PktHeader, memoryview]] = {}
+        run: list[Tuple[int, PktHeader]] = []
+        run_end = 0
+        for ptr in sorted(set(ptr_list)):
+            pkt_header = self.header(ptr)
+            if pkt_header is None:
+                continue
+
+            end = min(ptr + PCAP_PACKET_HEADER_SIZE + pkt_header.incl_len, self.size)
+            if len(run) > 0 and (ptr - run_end > COALESCE_GAP or end - run[0][0] > COALESCE_MAX):
+                self.read_run(run, run_end, result)
+                run = []
+
+            run_end = end if len(run) == 0 else max(run_end, end)
+            run.append((ptr, pkt_header))
+
+        if len(run) > 0:
+            self.read_run(run, run_end, result)
+
+        return result
+
+    def read_run(self, run: list[Tuple[int, PktHeader]], end: int,
+                 result: dict[int, Tuple[PktHeader, memoryview]]) -> None:
+        start = run[0][0]
+        page_start = start - start % mmap.PAGESIZE
+        if self.map is not None and hasattr(self.map, "madvise"):
+            self.map.madvise(mmap.MADV_WILLNEED, page_start, end - page_start)
+
+        chunk = memoryview(bytes(self.view[start:end]))
+        self.reads += 1
+
+        for ptr, pkt_header in run:
+            offset = ptr - start + PCAP_PACKET_HEADER_SIZE
+            result[ptr] = (pkt_header, chunk[offset:offset + pkt_header.incl_len])
+
+    def packets(self, offset: int = PCAP_GLOBAL_HEADER_SIZE) -> Generator[Tuple[PktHeader, memoryview, int], None, None]:
+        while True:
+            result = self.packet(offset)
+            if result is None:
+                break
+
+            pkt_header, packet = result
+            if len(packet) < pkt_header.incl_len:
+                # --- Packet still being written
+                break
+
+            yield (pkt_header, packet, offset)
+            offset += pkt_header.incl_len + PCAP_PACKET_HEADER_SIZE
+
+    def close(self) -> None:
+        self.view.release()
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                # --- Packets handed out are still alive, the mapping is
+                # --- released by the garbage collector once they are gone
+                pass
+            self.map = None
+
+
+class PcapReaderPool:
+    """
+    Readers opened for the duration of a query, one per pcap file
+    """
+
+    def __init__(self) -> None:
+        self.readers: dict[int, PcapReader] = {}
+
+    def get(self, file_id: int | str) -> PcapReader:
+        reader = self.readers.get(int(file_id))
+        if reader is None:
+            reader = PcapReader(file_id)
+            self.readers[reader.file_id] = reader
+
+        return reader
+
+    def fetch(self, ptr_list: list[PktPtr]) -> None:
+        """
+        Read the header and packet of the pointers, grouped by file
+        """
+        files: dict[int, list[PktPtr]] = {}
+        for pkt_ptr in ptr_list:
+            files.setdefault(int(pkt_ptr.file_id), []).append(pkt_ptr)
+
+        for file_id, file_ptrs in files.items():
+            packets = self.get(file_id).read_batch([pkt_ptr.ptr for pkt_ptr in file_ptrs])
+            for pkt_ptr in file_ptrs:
+                if pkt_ptr.ptr in packets:
+                    pkt_ptr.header, pkt_ptr.packet = packets[pkt_ptr.ptr]
+
+    def close(self) -> None:
+        for reader in self.readers.values():
+            reader.close()
+
+        self.readers = {}
+
+
+def batched(items: Iterable[Any], size: int, max_size: int) -> Generator[list[Any], None, None]:
+    """
+    Lists of consecutive items, each list twice the size of the previous
+    one up to max_size
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+            size = min(size * 2, max_size)
+
+    if len(batch) > 0:
+        yield batch
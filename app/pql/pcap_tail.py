@@ -0,0 +1,293 @@
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, Tuple
+
+import numpy as np
+
+from config.config import Config
+from dbase.dns_index import DnsIndex
+from dbase.flow_index import FlowIndex
+from dbase.host_index import HostIndex
+from dbase.index_file import INDEX_V1, IndexFile
+from dbase.index_manifest import IndexManifest
+from dbase.posting_index import PostingIndex
+from dbase.proto_bitmap import ProtoBitmapIndex
+from dbase.time_index import TimeIndex
+from dbase.zone_map import ZoneMap
+from packet.layers.packet_decode import PacketDecode
+from pql.pcap_reader import PCAP_GLOBAL_HEADER_SIZE, PCAP_PACKET_HEADER_SIZE, PcapReader
+from pql.pcapfile import POSTING_FIELDS, PcapFile
+
+log = logging.getLogger("packetdb")
+
+
+class PcapTail:
+    """
+    Index a pcap file while it is being written.
+
+    Each step indexes the packets written since the previous one, the
+    records are appended to a version 1 index file and the posting lists,
+    bitmaps, time index, zone map and master index range of the new
+    records are merged with the existing ones.
+    Once the capture file is rotated finalize() rewrites the index in the
+    configured format.
+    """
+
+    def __init__(self, file_id: int | str):
+        self.file_id = int(file_id)
+        self.pcapfile = PcapFile()
+        self.pd = PacketDecode()
+        self.offset = PCAP_GLOBAL_HEADER_SIZE
+        self.nbr_records = 0
+        self.first_ts: int | None = None
+        self.last_ts: int | None = None
+        self.resume()
+
+    @property
+    def index_filename(self) -> Path:
+        return Path(f"{Config.pcap_index()}/{self.file_id}.pidx")
+
+    def resume(self) -> None:
+        """
+        Continue after the last packet of an existing index file
+        """
+        if not self.index_filename.exists():
+            return
+
+        records = IndexFile(self.index_filename).load()
+        if len(records) == 0:
+            return
+
+        reader = PcapReader(self.file_id)
+        try:
+            last_ptr = int(records["ptr"][-1])
+            pkt_header = reader.header(last_ptr)
+            if pkt_header is not None:
+                self.offset = last_ptr + PCAP_PACKET_HEADER_SIZE + pkt_header.incl_len
+        finally:
+            reader.close()
+
+        self.nbr_records = len(records)
+        self.first_ts = int(records["ts"].min())
+        self.last_ts = int(records["ts"].max())
+
+    def step(self) -> int:
+        """
+        Index the new packets of the file, returns the number of packets added
+        """
+        index_list: list[Tuple[int, ...]] = []
+        lengths: list[int] = []
+        dns_list: list[Tuple[int, str, list[int]]] = []
+        host_list: list[Tuple[int, str, str]] = []
+
+        reader = PcapReader(self.file_id)
+        try:
+            for pkt_header, packet, offset in reader.packets(self.offset):
+                self.pd.decode(pkt_header, packet)
+                if (dns_record := self.pcapfile.dns_record(self.pd)) is not None:
+                    dns_list.append((len(index_list), *dns_record))
+                host_list += [(len(index_list), field, value) for field, value in self.pcapfile.host_record(self.pd)]
+
+                index_list.append(self.pcapfile.index_record(self.pd, offset))
+                lengths.append(pkt_header.orig_len)
+                self.offset = offset + PCAP_PACKET_HEADER_SIZE + pkt_header.incl_len
+        finally:
+            reader.close()
+
+        if len(index_list) == 0:
+            return 0
+
+        start_time = time.time()
+        base = self.nbr_records
+        new_records = IndexFile(self.index_filename, Config.index_layout()).append(index_list)
+        self.nbr_records += len(new_records)
+
+        self.update_field_index(base, new_records)
+        self.update_flows(base, new_records, lengths)
+        self.update_dns(base, dns_list)
+        self.update_hosts(base, host_list)
+
+        first_ts = int(new_records["ts"].min())
+        last_ts = int(new_records["ts"].max())
+        self.first_ts = first_ts if self.first_ts is None else min(self.first_ts, first_ts)
+        self.last_ts = last_ts if self.last_ts is None else max(self.last_ts, last_ts)
+        self.pcapfile.update_master_index(self.first_ts, self.last_ts, self.file_id)
+
+        log.debug(f"{self.index_filename}: {len(index_list)} packets added, time: {time.time() - start_time:.3}")
+        return len(index_list)
+
+    def update_field_index(self, base: int, new_records: np.ndarray) -> None:
+        """
+        Merge the zone map, bitmaps, time index and posting lists of the new
+        records with those of the records already indexed, an index missing
+        from a resumed file is left out
+        """
+        zone_map = ZoneMap.from_records(new_records)
+        if base == 0:
+            zone_map.save(self.file_id)
+        elif (indexed := ZoneMap.load(self.file_id)) is not None:
+            indexed.merge(zone_map).save(self.file_id)
+
+        proto_index = ProtoBitmapIndex(self.file_id)
+        new_protos = ProtoBitmapIndex(self.file_id).build(new_records["proto"])
+        if base == 0:
+            new_protos.save()
+        elif proto_index.exists:
+            proto_index.load().merge([(proto_index, 0), (new_protos, base)]).save()
+
+        time_index = TimeIndex(self.file_id)
+        if base == 0:
+            time_index.build(new_records["ts"]).save()
+        elif time_index.exists:
+            time_index.load().append(new_records["ts"]).save()
+
+        # --- Layer 2 fields are only held by the wide records
+        for field, key_dtype in POSTING_FIELDS.items():
+            if field not in (new_records.dtype.names or ()):
+                continue
+
+            posting_index = PostingIndex(self.file_id, field)
+            new_postings = PostingIndex(self.file_id, field).build(new_records[field], key_dtype)
+            if base == 0:
+                new_postings.save()
+            elif posting_index.exists:
+                posting_index.load().merge([(posting_index, 0), (new_postings, base)]).save()
+
+    def update_flows(self, base: int, new_records: np.ndarray, lengths: list[int]) -> None:
+        """
+        Merge the flows of the new records with the flows already indexed,
+        a file resumed without flow index is left without one
+        """
+        new_flows = FlowIndex(self.file_id).build(new_records, np.asarray(lengths))
+
+        flow_index = FlowIndex(self.file_id)
+        if base == 0:
+            new_flows.save()
+        elif flow_index.exists:
+            flow_index.load().merge([(flow_index, 0), (new_flows, base)]).save()
+
+    def update_dns(self, base: int, dns_list: list[Tuple[int, str, list[int]]]) -> None:
+        """
+        Add the DNS records of the new records to the DNS index, a file
+        resumed without DNS index is left without one
+        """
+        dns_index = DnsIndex(self.file_id)
+        if base == 0:
+            dns_index.from_packets(dns_list).save()
+        elif dns_index.exists and len(dns_list) > 0:
+            new_names = DnsIndex(self.file_id).from_packets(dns_list)
+            dns_index.load().merge([(dns_index, 0), (new_names, base)]).save()
+
+    def update_hosts(self, base: int, host_list: list[Tuple[int, str, str]]) -> None:
+        """
+        Add the server names, hosts and URIs of the new records to the
+        host index, a file resumed without host index is left without one
+        """
+        host_index = HostIndex(self.file_id)
+        if base == 0:
+            host_index.from_packets(host_list).save()
+        elif host_index.exists and len(host_list) > 0:
+            new_hosts = HostIndex(self.file_id).from_packets(host_list)
+            host_index.load().merge([(host_index, 0), (new_hosts, base)]).save()
+
+    def finalize(self) -> None:
+        """
+        Index the last packets and write the index in its final format
+        """
+        self.step()
+
+        if Config.index_format() != INDEX_V1 and self.index_filename.exists():
+            index_file = IndexFile(self.index_filename).open()
+            records = np.array(index_file.load())
+            IndexFile(self.index_filename, index_file.layout).save(records)
+
+        manifest = IndexManifest()
+        manifest.record(self.file_id, Path(f"{Config.pcap_path()}/{self.file_id}.pcap"),
+                        (self.first_ts, self.last_ts))
+        manifest.close()
+
+
+class LiveCapture:
+    """
+    Index the files of a tcpdump capture.
+
+    tcpdump writes in the capture folder and its postrotate script moves
+    every complete file out of it. The file being written gets its pcap id
+    as soon as it appears, it is hard linked in the pcap folder under that
+    id and followed by a PcapTail. The link and the moved file are the
+    same file, once moved the link is kept and the tail finalized.
+    """
+
+    def __init__(self, capture_dir: str | Path, next_id: Callable[[], int]):
+        self.capture_dir = Path(capture_dir)
+        self.next_id = next_id
+        self.tail: PcapTail | None = None
+        # --- Files of the capture folder linked in the pcap folder, by name
+        self.followed: dict[str, int] = {}
+
+    @staticmethod
+    def pcap_filename(file_id: int) -> Path:
+        return Path(f"{Config.pcap_path()}/{file_id}.pcap")
+
+    def active_file(self) -> Path | None:
+        """
+        The newest pcap file of the capture folder, the one tcpdump writes
+        """
+        files = [f for f in self.capture_dir.iterdir() if f.is_file() and f.suffix != ".sh"]
+        return max(files, key=lambda f: (f.stat().st_mtime_ns, f.name), default=None)
+
+    def rotated(self, filename: str | Path) -> int | None:
+        """
+        A complete file moved out of the capture folder, returns its new id
+        when it still has to be indexed
+        """
+        path = Path(filename)
+        # --- The links of the followed files are created in the pcap folder too
+        if path.name in {self.pcap_filename(file_id).name for file_id in self.followed.values()}:
+            return None
+
+        file_id = self.followed.pop(path.name, None)
+        if file_id is None:
+            file_id = self.next_id()
+            os.rename(path, self.pcap_filename(file_id))
+            return file_id
+
+        if self.tail is not None and self.tail.file_id == file_id:
+            self.finalize()
+
+        if os.path.samefile(path, self.pcap_filename(file_id)):
+            path.unlink()
+        else:
+            os.rename(path, self.pcap_filename(file_id))
+
+        return None
+
+    def step(self) -> int:
+        """
+        Index the new packets of the file being written, a new file in the
+        capture folder means the followed one is complete
+        """
+        active = self.active_file()
+        if active is not None and active.name not in self.followed:
+            self.finalize()
+
+            file_id = self.next_id()
+            os.link(active, self.pcap_filename(file_id))
+            self.followed[active.name] = file_id
+            self.tail = PcapTail(file_id)
+
+        return 0 if self.tail is None else self.tail.step()
+
+    def finalize(self) -> None:
+        if self.tail is not None:
+            self.tail.finalize()
+            self.tail = None
+
+    @property
+    def file_ids(self) -> set[int]:
+        """
+        Ids of the files not moved out of the capture folder yet
+        """
+        return set(self.followed.values())
@@ -3,24 +3,42 @@ import mmap
 import os
 import sqlite3
 import time
-from collections import defaultdict
-from struct import pack, unpack
+from struct import error as StructError, unpack
 from typing import Any, Generator, Tuple
 
+import numpy as np
+
 import pql.packet_index as pkt_index
 from config.config import Config
+from packet.layers.dns import Dns
+from packet.layers.http import Http
+from packet.layers.https import Https
 from packet.layers.packet_decode import PacketDecode
 from packet.layers.packet_hdr import PktHeader
 from packet.layers.packet_builder import PacketBuilder
-from dbase.proto_index import IndexLine, ProtoManager
+from dbase.dns_index import DnsIndex
+from dbase.flow_index import FlowIndex
+from dbase.host_index import HostIndex
+from dbase.index_file import IndexFile
+from dbase.master_index import MasterIndex
+from dbase.posting_index import PostingIndex
+from dbase.proto_bitmap import ProtoBitmapIndex
+from dbase.time_index import TimeIndex
+from dbase.zone_map import ZoneMap
+from pql.pcap_reader import PCAP_GLOBAL_HEADER_SIZE, PcapReader
 
 log = logging.getLogger("packetdb")
 
-
-PCAP_GLOBAL_HEADER_SIZE = 24
-PCAP_PACKET_HEADER_SIZE = 16
-MAGIC_BE = 0xa1b2c3d4
-MAGIC_LE = 0xd4c3b2a1
+# --- Record fields with a posting list index and the size of their keys
+POSTING_FIELDS = {
+    "ip_src": ">u4",
+    "ip_dst": ">u4",
+    "sport": ">u2",
+    "dport": ">u2",
+    "eth_src": ">u8",
+    "eth_dst": ">u8",
+    "vlan": ">u2",
+}
 
 
 def decode_header(header: bytes, byte_order: str) -> PktHeader:
@@ -34,193 +52,168 @@ def decode_header(header: bytes, byte_order: str) -> PktHeader:
 
 class PcapFile:
 
-    def __init__(self):
+    def __init__(self) -> None:
         self.filename = ""
         self.offset = 0
+        self.reader: PcapReader | None = None
 
-    def open(self, filename: str):
+    def open(self, filename: str, reader: PcapReader | None = None):
         self.filename = filename
+        self.reader = reader
+
+    def get_reader(self) -> PcapReader:
+        if self.reader is None:
+            self.reader = PcapReader(self.filename)
+
+        return self.reader
 
     def next(self):
         try:
-            with open(f"{Config.pcap_path()}/{self.filename}.pcap", "rb") as fd:
-                glob_header = fd.read(PCAP_GLOBAL_HEADER_SIZE)
-                if unpack("!I", glob_header[0:4])[0] == MAGIC_BE:
-                    byte_order = "!I"
-                else:
-                    byte_order = "<I"
-
-                self.offset += 24
-
-                while True:
-                    header = fd.read(PCAP_PACKET_HEADER_SIZE)
-                    if len(header) == 0:
-                        break
-                    else:
-                        pkt_header = decode_header(header, byte_order)
-
-                    incl_len = pkt_header.incl_len
-                    packet = fd.read(incl_len)
-
-                    yield (pkt_header, packet, self.offset)
-                    self.offset += incl_len + 16
+            self.offset = PCAP_GLOBAL_HEADER_SIZE
+            for pkt_header, packet, offset in self.get_reader().packets():
+                self.offset = offset
+                yield (pkt_header, packet, offset)
         except IOError:
             log.error("IO error")
 
     def get_packet_by_id(self, ptr: int, hdr_size: int = 0) -> PacketBuilder | None:
-        with open(f"{Config.pcap_path()}/{self.filename}.pcap", "rb") as fd:
-            glob_header = fd.read(PCAP_GLOBAL_HEADER_SIZE)
-            if unpack("!I", glob_header[0:4])[0] == MAGIC_BE:
-                byte_order = "!I"
-            else:
-                byte_order = "<I"
-
-            fd.seek(ptr)
-            header = fd.read(PCAP_PACKET_HEADER_SIZE)
-            if len(header) == 0:
-                return None
-
-            pkt_header = decode_header(header, byte_order)
-            pkt_header.file_ptr = int(self.filename)
-            pkt_header.pkt_ptr = ptr
-
-            if hdr_size == 0:
-                incl_len = pkt_header.incl_len
-                packet = fd.read(incl_len)
-            else:
-                packet = fd.read(hdr_size)
-
-            pb = PacketBuilder()
-            pb.from_bytes(packet, pkt_header)
-            return pb
-
-    def get(self, ptr: int, hdr_size: int = 0) -> Tuple[PktHeader, bytes] | None:
-        with open(f"{Config.pcap_path()}/{self.filename}.pcap", "rb") as fd:
-            glob_header = fd.read(PCAP_GLOBAL_HEADER_SIZE)
-            if unpack("!I", glob_header[0:4])[0] == MAGIC_BE:
-                byte_order = "!I"
-            else:
-                byte_order = "<I"
-
-            fd.seek(ptr)
-            header = fd.read(PCAP_PACKET_HEADER_SIZE)
-            if len(header) == 0:
-                return None
-
-            pkt_header = decode_header(header, byte_order)
-            pkt_header.file_ptr = int(self.filename)
-            pkt_header.pkt_ptr = ptr
-
-            if hdr_size == 0:
-                incl_len = pkt_header.incl_len
-                packet = fd.read(incl_len)
-            else:
-                packet = fd.read(hdr_size)
-
-            return (pkt_header, packet)
+        result = self.get(ptr, hdr_size)
+        if result is None:
+            return None
+
+        pkt_header, packet = result
+        pb = PacketBuilder()
+        pb.from_bytes(bytes(packet), pkt_header)
+        return pb
+
+    def get(self, ptr: int, hdr_size: int = 0) -> Tuple[PktHeader, memoryview] | None:
+        return self.get_reader().packet(ptr, hdr_size)
 
     def create_index(self, file_id):
-        offset = 0
         pd = PacketDecode()
         index_list = []
+        lengths = []
+        dns_list = []
+        host_list = []
         first_ts = None
         last_ts = None
-        ip_src_index = defaultdict(list)
 
-        # arp_list = []
-        proto_mgr = ProtoManager(file_id)
         start_ts = time.time()
 
-        with open(f"{Config.pcap_path()}/{file_id}.pcap", "r+b") as fd:
-            glob_header = fd.read(PCAP_GLOBAL_HEADER_SIZE)
-            if unpack("!I", glob_header[0:4])[0] == MAGIC_BE:
-                byte_order = "!I"
-            else:
-                byte_order = "<I"
-
-            offset += 24
-
-            while True:
-                header = fd.read(PCAP_PACKET_HEADER_SIZE)
-                if len(header) == 0:
-                    break
-
-                pkt_header = decode_header(header, byte_order)
-                incl_len = pkt_header.incl_len
-                packet = fd.read(incl_len)
-
+        reader = PcapReader(file_id)
+        try:
+            for pkt_header, packet, offset in reader.packets():
                 pd.decode(pkt_header, packet)
-                ts = pd.get_field('pkt.timestamp')
+                record = self.index_record(pd, offset)
+                ts = record[0]
 
                 last_ts = ts
                 if first_ts is None:
                     first_ts = ts
 
-                dport = 0
-                sport = 0
-                if pd.has_tcp:
-                    dport = pd.tcp_dport
-                    sport = pd.tcp_sport
-                elif pd.has_udp:
-                    dport = pd.udp_dport
-                    sport = pd.udp_sport
-
-                ip_src_index[pd.ip_src].append(offset)
-                idx = pkt_index.packet_index(pd)
-                index_list.append(
-                    (ts, offset, idx, pd.ip_dst, pd.ip_src, pd.header_len, dport, sport))
-
-                self.get_protos(proto_mgr, idx, offset, pd.ip_dst, pd.ip_src)
+                if (dns_record := self.dns_record(pd)) is not None:
+                    dns_list.append((len(index_list), *dns_record))
+                host_list += [(len(index_list), field, value) for field, value in self.host_record(pd)]
 
-                offset += incl_len + 16
-
-        # proto_idx = ProtoIndex(file_id, pkt_index.ARP)
-        # proto_idx.save(arp_list)
+                index_list.append(record)
+                lengths.append(pkt_header.orig_len)
+        finally:
+            reader.close()
 
         db_name = f"{Config.pcap_index()}/{file_id}.pidx"
-        proto_mgr.save()
 
-        self.create_db_index(db_name, index_list)
+        self.create_db_index(db_name, index_list, lengths)
+        DnsIndex(file_id).from_packets(dns_list).save()
+        HostIndex(file_id).from_packets(host_list).save()
         end_time = time.time() - start_ts
-        log.info(f"{db_name} completed, {len(index_list)} packets indexed, time: {end_time:.3} {(end_time / len(index_list)) * 1_000_000:.2f}us/packet")
-        # log.info(ip_src_index)
-        # self.save_ip_index(file_id, ip_src_index)
+        log.info(f"{db_name} completed, {len(index_list)} packets indexed, time: {end_time:.3} {(end_time / max(len(index_list), 1)) * 1_000_000:.2f}us/packet")
 
         return (first_ts, last_ts, int(file_id))
 
-    def get_protos(self, proto_mgr: ProtoManager, idx: int, offset: int, ip_dst: int, ip_src: int):
-        if (idx & pkt_index.ARP) == pkt_index.ARP:
-            proto_mgr.add(pkt_index.ARP, IndexLine(offset, ip_dst, ip_src))
-        elif (idx & pkt_index.DHCP) == pkt_index.DHCP:
-            proto_mgr.add(pkt_index.DHCP, IndexLine(offset, ip_dst, ip_src))
-        elif (idx & pkt_index.DNS) == pkt_index.DNS:
-            proto_mgr.add(pkt_index.DNS, IndexLine(offset, ip_dst, ip_src))
-        elif (idx & pkt_index.HTTP) == pkt_index.HTTP:
-            proto_mgr.add(pkt_index.HTTP, IndexLine(offset, ip_dst, ip_src))
-        elif (idx & pkt_index.HTTPS) == pkt_index.HTTPS:
-            proto_mgr.add(pkt_index.HTTPS, IndexLine(offset, ip_dst, ip_src))
-        elif (idx & pkt_index.SSH) == pkt_index.SSH:
-            proto_mgr.add(pkt_index.SSH, IndexLine(offset, ip_dst, ip_src))
-        elif (idx & pkt_index.TELNET) == pkt_index.TELNET:
-            proto_mgr.add(pkt_index.TELNET, IndexLine(offset, ip_dst, ip_src))
-        elif (idx & pkt_index.RDP) == pkt_index.RDP:
-            proto_mgr.add(pkt_index.RDP, IndexLine(offset, ip_dst, ip_src))
-        elif (idx & pkt_index.NTP) == pkt_index.NTP:
-            proto_mgr.add(pkt_index.NTP, IndexLine(offset, ip_dst, ip_src))
-        elif (idx & pkt_index.SNMP) == pkt_index.SNMP:
-            proto_mgr.add(pkt_index.SNMP, IndexLine(offset, ip_dst, ip_src))
-        elif (idx & pkt_index.FTP) == pkt_index.FTP:
-            proto_mgr.add(pkt_index.FTP, IndexLine(offset, ip_dst, ip_src))
-        elif (idx & pkt_index.SIP) == pkt_index.SIP:
-            proto_mgr.add(pkt_index.SIP, IndexLine(offset, ip_dst, ip_src))
-        elif (idx & pkt_index.SMB) == pkt_index.SMB:
-            proto_mgr.add(pkt_index.SMB, IndexLine(offset, ip_dst, ip_src))
-
-    def create_db_index(self, db_name: str, index_list):
-        with open(db_name, "wb") as f:
-            for ix in index_list:
-                index_line = pack(">IIIIIHHH", *ix)
-                f.write(index_line)
+    def index_record(self, pd: PacketDecode, offset: int) -> Tuple[int, ...]:
+        dport = 0
+        sport = 0
+        if pd.has_tcp:
+            dport = pd.tcp_dport
+            sport = pd.tcp_sport
+        elif pd.has_udp:
+            dport = pd.udp_dport
+            sport = pd.udp_sport
+
+        tcp_flags = pd.tcp_flag & 0x1ff if pd.has_tcp else 0
+        ttl = pd.ip_ttl if pd.has_ipv4 else 0
+
+        idx = pkt_index.packet_index(pd)
+        return (pd.get_field('pkt.timestamp'), offset, idx, pd.ip_dst, pd.ip_src, pd.header_len, dport, sport,
+                pd.orig_len, pd.inc_len, tcp_flags, ttl, pd.vlan_id, pd.mac_src, pd.mac_dst)
+
+    def dns_record(self, pd: PacketDecode) -> Tuple[str, list[int]] | None:
+        """
+        Query name and A record addresses of a DNS packet, None for other
+        or malformed packets
+        """
+        if not pd.has_dns:
+            return None
+
+        try:
+            dns = Dns(bytes(pd.udp_payload))
+        except (IndexError, StructError, UnicodeDecodeError):
+            return None
+
+        addresses = [answer.result.value for answer in dns.answer_list if answer.qtype == 1]
+        return (".".join(dns.queries.label_list), addresses)
+
+    def host_record(self, pd: PacketDecode) -> list[Tuple[str, str]]:
+        """
+        Server name of a TLS ClientHello, host and URI of an HTTP request,
+        from the packets the query decoder reads as HTTPS and HTTP
+        """
+        if not pd.has_tcp or pd.tcp_flag_syn or pd.tcp_flag_fin:
+            return []
+
+        payload = bytes(pd.tcp_payload)
+        if len(payload) == 0:
+            return []
+
+        result = []
+        if pd.tcp_dport == 443:
+            https = Https(payload)
+            if https.is_valid and (server_name := https.server_name) is not None:
+                result.append(("https.sni", server_name))
+        elif pd.tcp_dport in [80, 8080]:
+            http = Http(payload)
+            if (uri := http.uri) is not None:
+                result.append(("http.uri", uri))
+            if (host := http.host) is not None:
+                result.append(("http.host", host))
+
+        return result
+
+    def create_db_index(self, db_name: str, index_list, lengths: list[int] | None = None):
+        index_file = IndexFile(db_name, Config.index_layout())
+        records = index_file.save(index_list)
+        self.create_field_index(index_file.file_id, records, lengths)
+
+    def create_field_index(self, index_id: int | str, records, lengths: list[int] | None = None):
+        """
+        Write the secondary indexes of an index file, the flow index needs
+        the packet lengths, from the wide records or given with base records
+        """
+        ZoneMap.from_records(records).save(index_id)
+        ProtoBitmapIndex(index_id).build(records["proto"]).save()
+        TimeIndex(index_id).build(records["ts"]).save()
+
+        # --- Layer 2 fields are only held by the wide records
+        for field, key_dtype in POSTING_FIELDS.items():
+            if field in records.dtype.names:
+                PostingIndex(index_id, field).build(
+                    records[field], key_dtype).save()
+
+        if lengths is None and "orig_len" in records.dtype.names:
+            lengths = records["orig_len"]
+
+        if lengths is not None:
+            FlowIndex(index_id).build(records, np.asarray(lengths)).save()
 
     def build_master_index(self, master_index, clean=False):
         db_name = f"{Config.pcap_master_index()}"
@@ -230,14 +223,7 @@ class PcapFile:
         if clean:
             c.execute("drop table if exists master_index;")
 
-        c.execute("""
-                    create table if not exists master_index (
-                        id integer primary key autoincrement,
-                        start_ts integer not null,
-                        end_ts integer not null,
-                        file_id integer not null
-                        );
-                    """)
+        self.create_master_table(c)
         c.execute('''PRAGMA synchronous = OFF''')
         c.execute('''PRAGMA journal_mode = MEMORY''')
 
@@ -252,6 +238,35 @@ class PcapFile:
 
         conn.close()
 
+        # --- Pick up the new files in the in memory copy of this process
+        MasterIndex.instance().refresh()
+
+    def update_master_index(self, start_ts: int, end_ts: int, file_id: int):
+        """
+        Replace the time range of a file still being written
+        """
+        conn = sqlite3.connect(Config.pcap_master_index())
+        c = conn.cursor()
+        self.create_master_table(c)
+
+        c.execute("delete from master_index where file_id = ?;", (file_id,))
+        c.execute(
+            "INSERT INTO master_index (start_ts, end_ts, file_id) VALUES (?,?,?)", (start_ts, end_ts, file_id))
+        conn.commit()
+        conn.close()
+
+        MasterIndex.instance().refresh()
+
+    def create_master_table(self, c: sqlite3.Cursor):
+        c.execute("""
+                    create table if not exists master_index (
+                        id integer primary key autoincrement,
+                        start_ts integer not null,
+                        end_ts integer not null,
+                        file_id integer not null
+                        );
+                    """)
+
     def chunks(self, l: list[Any], n: int) -> Generator[Any, Any, Any]:
         for i in range(0, len(l), n):
             yield l[i:i + n]
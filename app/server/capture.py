@@ -27,7 +27,7 @@ Here are the steps needed to create a capture session
 
 def create_capture(capture_path: str):
     create_folder(capture_path)
-    create_move_script(f"{capture_path}/capture")
+    create_move_script(f"{capture_path}/capture", f"{capture_path}/pcap")
 
 
 def create_folder(capture_path: str):
@@ -48,12 +48,12 @@ def create_folder(capture_path: str):
     log.info(f"Path created: {path}")
 
 
-def create_move_script(capture_path: str):
-    script = """
-    #!/bin/sh
-    mv ./${1}"""
-
-    script += f" {capture_path}\n"
+def create_move_script(capture_path: str, target_path: str):
+    """
+    Postrotate script of tcpdump, moves a complete capture file out of the
+    capture folder being written
+    """
+    script = f'#!/bin/sh\nmv "${{1}}" {target_path}\n'
 
     with open(f"{capture_path}/move.sh", "w") as f:
         f.write(script)
@@ -63,4 +63,4 @@ def create_move_script(capture_path: str):
 
 
 if __name__ == "__main__":
-    create_move_script("/Users/jpdube/packetdb_test")
+    create_move_script("/Users/jpdube/packetdb_test/capture", "/Users/jpdube/packetdb_test/pcap")
@@ -1,10 +1,14 @@
 import logging
 import multiprocessing as mp
-import os
+import queue
 import time
+from pathlib import Path
 
 from config.config import Config
 from config.config_db import ConfigDB
+from dbase.index_manifest import IndexManifest
+from dbase.segment import SegmentCompactor
+from pql.pcap_tail import LiveCapture
 from pql.pcapfile import PcapFile
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
@@ -13,6 +17,9 @@ log = logging.getLogger("packetdb")
 
 capture_queue = mp.Queue()
 
+# --- Seconds between two indexing steps of the file being captured
+TAIL_INTERVAL = 2
+
 
 class _Handler(FileSystemEventHandler):
 
@@ -44,34 +51,45 @@ class PacketDbWatch:
         self.observer.join()
 
 
-def capture_thread(in_queue: mp.Queue, profile_id: int):
+def capture_thread(in_queue: mp.Queue, profile_id: int, capture_dir: str):
     configdb = ConfigDB()
     pool = mp.Pool()
+    capture = LiveCapture(capture_dir, lambda: configdb.capture_next_id(profile_id))
     while True:
-        flist = []
-        new_file = in_queue.get()
+        new_files = []
+        try:
+            new_files.append(in_queue.get(timeout=TAIL_INTERVAL))
+            for _ in range(in_queue.qsize()):
+                new_files.append(in_queue.get())
+        except queue.Empty:
+            pass
+
+        # --- The file followed while written is finalized once moved
+        flist = [file_id for new_file in new_files if (file_id := capture.rotated(new_file)) is not None]
+        log.debug(f"File list: {flist}")
 
-        file_id = configdb.capture_next_id(profile_id)
-        os.rename(new_file, f"{Config.pcap_path()}/{file_id}.pcap")
-        flist.append(file_id)
-        file_count = in_queue.qsize()
+        if len(flist) > 0:
+            pcapfile = PcapFile()
+            manifest = IndexManifest()
+            for first_ts, last_ts, file_id in pool.imap_unordered(pcapfile.create_index, flist):
+                manifest.record(file_id, Path(f"{Config.pcap_path()}/{file_id}.pcap"),
+                                (first_ts, last_ts))
+            manifest.close()
 
-        for _ in range(file_count):
-            new_file = in_queue.get()
-            file_id = configdb.capture_next_id(profile_id)
-            os.rename(new_file, f"{Config.pcap_path()}/{file_id}.pcap")
-            flist.append(file_id)
+        capture.step()
 
-        log.debug(f"File list: {flist}")
-        pcapfile = PcapFile()
-        result = pool.map(pcapfile.create_index, flist)
-        result.sort(key=lambda a: a[0])
-        pcapfile.build_master_index(result)
+        # --- Merge the small index files of the rotated captures
+        if len(new_files) > 0:
+            SegmentCompactor().run(exclude=capture.file_ids)
 
 
-def start_db_watcher(watch_dir: str, profile_id: int):
+def start_db_watcher(watch_dir: str, profile_id: int, capture_dir: str):
+    """
+    Index the capture written by tcpdump in capture_dir, its postrotate
+    script moves the complete files to watch_dir
+    """
     log.info(f"Database watcher started with folder: {watch_dir}")
     dbwatch = PacketDbWatch(watch_dir)
-    mp.Process(target=capture_thread, args=(capture_queue, profile_id)).start()
+    mp.Process(target=capture_thread, args=(capture_queue, profile_id, capture_dir)).start()
     mp.Process(target=dbwatch.run, args=(
         capture_queue, watch_dir,), daemon=True).start()
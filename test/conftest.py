@@ -0,0 +1,28 @@
+from pathlib import Path
+from typing import NamedTuple
+
+import pytest
+
+
+class Store(NamedTuple):
+    pcap: Path
+    index: Path
+    master_index: Path
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch) -> Store:
+    """
+    Empty pcap and index folders and the master index of a test, the
+    configuration points to them
+    """
+    store = Store(tmp_path / "pcap", tmp_path / "index", tmp_path / "master.db")
+    store.pcap.mkdir()
+    store.index.mkdir()
+
+    monkeypatch.setenv("PCAP_PATH", str(store.pcap))
+    monkeypatch.setenv("PCAP_INDEX", str(store.index))
+    monkeypatch.setenv("PCAP_PROTO_INDEX", str(store.index))
+    monkeypatch.setenv("PCAP_MASTER_INDEX", str(store.master_index))
+    monkeypatch.setenv("NBR_THREADS", "1")
+    return store
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from app.dbase.dns_index import DnsIndex
+from app.dbase.index_plan import FileIndexes
+
+DNS_LIST = [
+    (0, "www.example.com", []),
+    (1, "WWW.Example.com.", [0x5db8d822]),
+    (3, "mail.example.com", []),
+    (4, "mail.example.com", [0x5db8d823, 0x5db8d824]),
+    (7, "example.org", [0x5db8d822]),
+]
+
+
+def test_lookup(store):
+    DnsIndex(1).from_packets(DNS_LIST).save()
+
+    dns_index = DnsIndex(1).load()
+    assert len(dns_index) == 3
+    assert dns_index.lookup("www.example.com").tolist() == [0, 1]
+    assert dns_index.lookup("Mail.Example.COM").tolist() == [3, 4]
+    assert dns_index.lookup("example.com").tolist() == []
+
+    # --- Names under the domain, the domain itself excluded
+    assert dns_index.suffix("example.com").tolist() == [0, 1, 3, 4]
+    assert dns_index.suffix("org").tolist() == [7]
+    assert dns_index.suffix("example.org").tolist() == []
+
+
+def test_resolve(store):
+    DnsIndex(1).from_packets(DNS_LIST).save()
+
+    dns_index = DnsIndex(1).load()
+    assert sorted(dns_index.resolve(0x5db8d822)) == ["example.org", "www.example.com"]
+    assert dns_index.resolve(0x5db8d824) == ["mail.example.com"]
+    assert dns_index.resolve(0x01020304) == []
+
+
+def test_merge(store):
+    first = DnsIndex(1).from_packets(DNS_LIST[:2])
+    second = DnsIndex(2).from_packets(DNS_LIST[2:])
+
+    DnsIndex("s1_2").merge([(first, 0), (second, 10)]).save()
+    dns_index = DnsIndex("s1_2").load()
+    assert dns_index.lookup("www.example.com").tolist() == [0, 1]
+    assert dns_index.lookup("mail.example.com").tolist() == [13, 14]
+    assert dns_index.resolve(0x5db8d823) == ["mail.example.com"]
+
+
+def test_empty(store):
+    DnsIndex(1).from_packets([]).save()
+
+    dns_index = DnsIndex(1).load()
+    assert len(dns_index) == 0
+    assert dns_index.lookup("www.example.com").dtype == np.int64
+    assert len(dns_index.suffix("com")) == 0
+    assert dns_index.resolve(0x5db8d822) == []
+
+
+def test_version(store):
+    DnsIndex(1).from_packets(DNS_LIST).save()
+
+    # --- A file of the layout before the shared name dictionary
+    buffer = bytearray(DnsIndex(1).filename.read_bytes())
+    buffer[4:6] = (1).to_bytes(2, "big")
+    DnsIndex(1).filename.write_bytes(bytes(buffer))
+
+    with pytest.raises(ValueError):
+        DnsIndex(1).load()
+
+    # --- The planner does without it
+    assert FileIndexes(1, 8).dns_index() is None
@@ -0,0 +1,71 @@
+import numpy as np
+
+from app.dbase.flow_index import IP_PROTO_TCP, IP_PROTO_UDP, FlowIndex
+from app.dbase.index_file import INDEX_RECORD
+from app.dbase.index_plan import Conversation
+
+ETH_IPV4_TCP = 0x23
+ETH_IPV4_UDP = 0x13
+
+
+def make_records() -> np.ndarray:
+    records = np.zeros(6, dtype=INDEX_RECORD)
+    records["ts"] = [100, 101, 102, 103, 104, 105]
+    records["ptr"] = [24, 100, 200, 300, 400, 500]
+    records["proto"] = [ETH_IPV4_TCP, ETH_IPV4_TCP, ETH_IPV4_UDP, ETH_IPV4_TCP, 0x41, ETH_IPV4_TCP]
+    records["ip_src"] = [0x0a000001, 0x0a000002, 0x0a000001, 0x0a000001, 0, 0x0a000002]
+    records["ip_dst"] = [0x0a000002, 0x0a000001, 0x08080808, 0x0a000002, 0, 0x0a000001]
+    records["sport"] = [5000, 443, 5001, 5002, 0, 443]
+    records["dport"] = [443, 5000, 53, 443, 0, 5000]
+    return records
+
+
+def test_build(store):
+    lengths = np.array([60, 1500, 80, 60, 42, 1000])
+    FlowIndex(1).build(make_records(), lengths).save()
+
+    flow_index = FlowIndex(1).load()
+    assert len(flow_index) == 3
+
+    # --- Both directions of the conversation are one flow, the ARP record has none
+    flow = flow_index.flow_of(0)
+    assert flow_index.flow_of(4) is None
+    assert flow_index.flow_of(5) == flow
+    entry = flow_index.flows[flow]
+    assert entry["proto"] == IP_PROTO_TCP
+    assert (entry["ip_a"], entry["port_a"], entry["ip_b"], entry["port_b"]) == (0x0a000001, 5000, 0x0a000002, 443)
+    assert (entry["first_ts"], entry["last_ts"]) == (100, 105)
+    assert (entry["packets"], entry["bytes"]) == (3, 2560)
+    assert flow_index.ordinals(np.array([flow])).tolist() == [0, 1, 5]
+
+    udp = flow_index.flows[flow_index.flow_of(2)]
+    assert udp["proto"] == IP_PROTO_UDP
+
+
+def test_conversation(store):
+    records = make_records()
+    flow_index = FlowIndex(1).build(records, np.ones(len(records)))
+
+    flows = flow_index.conversation((0x0a000002, 32), (0x0a000000, 24))
+    assert flow_index.ordinals(flows).tolist() == [0, 1, 3, 5]
+    assert len(flow_index.conversation((0x0a000001, 32), (0x08080800, 24))) == 1
+    assert len(flow_index.conversation((0x0a000002, 32), (0x08080808, 32))) == 0
+
+    # --- Same records as the scan of the index file
+    mask = Conversation((0x0a000002, 32), (0x0a000000, 24)).mask(records)
+    assert np.flatnonzero(mask).tolist() == [0, 1, 3, 5]
+
+
+def test_merge(store):
+    records = make_records()
+    lengths = np.array([60, 1500, 80, 60, 42, 1000])
+    first = FlowIndex(1).build(records[:3], lengths[:3])
+    second = FlowIndex(2).build(records[3:], lengths[3:])
+    second.save()
+
+    merged = FlowIndex("s1-2").merge([(first, 0), (FlowIndex(2).load(), 3)])
+    whole = FlowIndex(3).build(records, lengths)
+
+    assert merged.flows.tobytes() == whole.flows.tobytes()
+    assert merged.starts.tolist() == whole.starts.tolist()
+    assert merged.postings.tolist() == whole.postings.tolist()
@@ -0,0 +1,38 @@
+from app.dbase.host_index import HostIndex
+
+HOST_LIST = [
+    (0, "https.sni", "www.example.com"),
+    (2, "https.sni", "api.example.com"),
+    (3, "http.host", "WWW.Example.com"),
+    (3, "http.uri", "/index.html"),
+    (5, "http.host", "intranet.local"),
+    (5, "http.uri", "/login.php"),
+    (6, "http.uri", "/Login.php."),
+]
+
+
+def test_lookup(store):
+    HostIndex(1).from_packets(HOST_LIST).save()
+
+    host_index = HostIndex(1).load()
+    assert len(host_index) == 7
+    assert host_index.lookup("https.sni", "www.example.com").tolist() == [0]
+    assert host_index.lookup("http.host", "www.example.com").tolist() == [3]
+    assert host_index.lookup("http.host", "api.example.com").tolist() == []
+    assert host_index.suffix("https.sni", "example.com").tolist() == [0, 2]
+
+    # --- URIs are kept byte for byte
+    assert host_index.lookup("http.uri", "/login.php").tolist() == [5]
+    assert host_index.lookup("http.uri", "/Login.php.").tolist() == [6]
+    assert host_index.lookup("http.uri", "/LOGIN.PHP").tolist() == []
+
+
+def test_merge(store):
+    first = HostIndex(1).from_packets(HOST_LIST[:3])
+    second = HostIndex(2).from_packets(HOST_LIST[3:])
+
+    HostIndex("s1_2").merge([(first, 0), (second, 100)]).save()
+    host_index = HostIndex("s1_2").load()
+    assert host_index.suffix("https.sni", "example.com").tolist() == [0, 2]
+    assert host_index.lookup("http.host", "www.example.com").tolist() == [3]
+    assert host_index.lookup("http.host", "intranet.local").tolist() == [105]
@@ -0,0 +1,44 @@
+import numpy as np
+
+from app.dbase.index_codec import (ENC_DELTA, ENC_DICT, ENC_VARINT,
+                                   decode_block, decode_column, encode_block,
+                                   encode_column, varint_decode, varint_encode,
+                                   zigzag_decode, zigzag_encode)
+from app.dbase.index_file import INDEX_RECORD
+
+
+def test_varint():
+    values = np.array([0, 1, 127, 128, 300, 16384, 0xffffffff], dtype=np.uint64)
+    encoded = varint_encode(values)
+    assert encoded[:5] == bytes([0x00, 0x01, 0x7f, 0x80, 0x01])
+
+    decoded, used = varint_decode(encoded + b"\x05", len(values))
+    assert decoded.tolist() == values.tolist()
+    assert used == len(encoded)
+
+
+def test_zigzag():
+    values = np.array([0, -1, 1, -2, 2, -2**31, 2**31], dtype=np.int64)
+    assert zigzag_encode(values)[:5].tolist() == [0, 1, 2, 3, 4]
+    assert zigzag_decode(zigzag_encode(values)).tolist() == values.tolist()
+
+
+def test_columns():
+    column = np.array([1700000000, 1700000001, 1700000001, 1699999999], dtype=">u4")
+    for encoding in (ENC_VARINT, ENC_DELTA, ENC_DICT):
+        encoded = encode_column(column, encoding)
+        values, offset = decode_column(encoded, 0, len(column))
+        assert values.tolist() == column.tolist()
+        assert offset == len(encoded)
+
+
+def test_block():
+    records = np.array([
+        (100, 24, 0x23, 0x0a010203, 0xc0a80301, 54, 443, 50000),
+        (101, 90, 0x93, 0x08080808, 0xc0a80302, 42, 53, 40000),
+        (101, 160, 0x23, 0x0a010203, 0xc0a80301, 54, 22, 50001),
+    ], dtype=INDEX_RECORD)
+
+    encoded = encode_block(records)
+    assert len(encoded) < records.nbytes * 2
+    assert decode_block(encoded, len(records), INDEX_RECORD).tolist() == records.tolist()
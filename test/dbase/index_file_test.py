@@ -0,0 +1,136 @@
+import numpy as np
+
+from app.dbase.index_file import (BLOCK_SIZE, INDEX_RECORD, INDEX_RECORD_SIZE,
+                                  INDEX_RECORD_WIDE, INDEX_V1, INDEX_V2,
+                                  LAYOUT_BASE, LAYOUT_WIDE, IndexFile,
+                                  as_layout, network_mask)
+from app.dbase.index_manager import IndexManager
+from app.dbase.index_plan import Proto, Range
+from app.pql.packet_index import TCP
+from test.helpers import plan_of
+
+
+def search(index_file: IndexFile, plan, interval=(0, 0)) -> list:
+    return IndexManager().select(index_file, plan, interval)[1]["ptr"].tolist()
+
+
+def build_records() -> np.ndarray:
+    return np.array([
+        (100, 24, 0x23, 0x0a010203, 0xc0a80301, 54, 443, 50000),
+        (101, 90, 0x93, 0x08080808, 0xc0a80302, 42, 53, 40000),
+        (102, 160, 0x23, 0x0a010204, 0xc0a80401, 54, 22, 50001),
+        (103, 230, 0x03, 0x0a010203, 0xc0a80301, 34, 0, 0),
+    ], dtype=INDEX_RECORD)
+
+
+def test_record_size():
+    assert INDEX_RECORD_SIZE == 26
+
+
+def test_proto_mask():
+    mask = Proto(TCP).mask(build_records())
+    assert mask.tolist() == [True, False, True, False]
+
+
+def test_network_mask():
+    records = build_records()
+    mask = network_mask(records["ip_src"], [(0xc0a80300, 24)])
+    assert mask.tolist() == [True, True, False, True]
+
+
+def test_ip_and_port():
+    mask = plan_of("ip.dst == 10.1.2.0/24 and tcp.dport == 443").mask(build_records())
+    assert mask.tolist() == [True, False, False, False]
+
+
+def test_interval():
+    mask = Range("ts", 101, 102).mask(build_records())
+    assert mask.tolist() == [False, True, True, False]
+
+
+def test_save_load(store):
+    index_file = IndexFile(store.index / "12.pidx")
+    index_file.save([tuple(r) for r in build_records().tolist()], INDEX_V1)
+
+    assert (store.index / "12.pidx").stat().st_size == 4 * INDEX_RECORD_SIZE
+    assert index_file.file_id == 12
+    assert search(index_file, plan_of("DNS")) == [90]
+
+
+def test_save_load_v2(store):
+    records = build_records()
+    IndexFile(store.index / "12.pidx").save([tuple(r) for r in records.tolist()], INDEX_V2)
+
+    index_file = IndexFile(store.index / "12.pidx").open()
+    assert index_file.version == INDEX_V2
+    assert index_file.nbr_records == 4
+    assert index_file.load().tolist() == records.tolist()
+    assert search(index_file, plan_of("DNS")) == [90]
+    assert search(index_file, Range("ts", 102, 103), (102, 103)) == [160, 230]
+
+
+def test_take_v2(tmp_path):
+    nbr_records = 2 * BLOCK_SIZE + 10
+    records = np.zeros(nbr_records, dtype=INDEX_RECORD)
+    records["ts"] = 1700000000 + np.arange(nbr_records) // 3
+    records["ptr"] = 24 + np.arange(nbr_records) * 60
+    records["ip_src"] = 0xc0a80300 + np.arange(nbr_records) % 7
+    records["dport"] = np.arange(nbr_records) % 1024
+
+    IndexFile(tmp_path / "3.pidx").save(records, INDEX_V2)
+    assert (tmp_path / "3.pidx").stat().st_size < records.nbytes // 2
+
+    index_file = IndexFile(tmp_path / "3.pidx")
+    ordinals = np.array([5, BLOCK_SIZE * 2 + 9, BLOCK_SIZE * 2, 17])
+    assert index_file.take(ordinals).tolist() == records[ordinals].tolist()
+    assert index_file.read(candidates=ordinals)[1]["ptr"].tolist() == records["ptr"][ordinals].tolist()
+
+
+def build_wide_records() -> np.ndarray:
+    records = as_layout(build_records(), INDEX_RECORD_WIDE)
+    records["orig_len"] = [66, 90, 1514, 60]
+    records["incl_len"] = [66, 90, 128, 60]
+    records["tcp_flags"] = [0x02, 0, 0x12, 0]
+    records["ttl"] = [64, 128, 64, 1]
+    records["vlan"] = [1, 1, 10, 1]
+    return records
+
+
+def test_wide_predicates():
+    plan = plan_of("tcp.flag_syn == true and tcp.flag_ack == false")
+    assert plan.mask(build_wide_records()).tolist() == [True, False, False, False]
+
+    plan = plan_of("ip.ttl == 64 and eth.vlan == 10")
+    assert plan.mask(build_wide_records()).tolist() == [False, False, True, False]
+
+    # --- Left to the packets when the records have no such column
+    assert plan.mask(build_records()).tolist() == [True] * 4
+
+
+def test_save_load_wide(tmp_path):
+    records = build_wide_records()
+    IndexFile(tmp_path / "12.pidx", LAYOUT_WIDE).save(records, INDEX_V2)
+
+    index_file = IndexFile(tmp_path / "12.pidx").open()
+    assert index_file.layout == LAYOUT_WIDE
+    assert index_file.load().tolist() == records.tolist()
+
+
+def test_save_load_wide_v1(tmp_path):
+    records = build_wide_records()
+    index_file = IndexFile(tmp_path / "12.pidx", LAYOUT_WIDE)
+    index_file.save(records[:2], INDEX_V1)
+    index_file.append([tuple(r) for r in records[2:].tolist()])
+
+    # --- The base records stay readable as version 1 files
+    assert (tmp_path / "12.pidx").stat().st_size == 4 * INDEX_RECORD_SIZE
+    index_file = IndexFile(tmp_path / "12.pidx").open()
+    assert index_file.layout == LAYOUT_WIDE
+    assert index_file.load().tolist() == records.tolist()
+
+    # --- Rewritten with the base layout the extension goes away
+    IndexFile(tmp_path / "12.pidx").save(records, INDEX_V1)
+    index_file = IndexFile(tmp_path / "12.pidx").open()
+    assert not (tmp_path / "12.pext").exists()
+    assert index_file.layout == LAYOUT_BASE
+    assert index_file.load().tolist() == build_records().tolist()
@@ -0,0 +1,84 @@
+import pytest
+
+from app.dbase.dbengine import DBEngine
+from app.dbase.dns_index import DnsIndex
+from app.dbase.index_manager import IndexManager
+from app.dbase.segment import SegmentCompactor
+from app.pql.parse import parse_source
+from app.pql.pcapfile import PcapFile
+from test.helpers import append_packets, create_file_index, udp_packet
+
+
+def test_covers():
+    covers = IndexManager().covers
+
+    assert covers(parse_source("select count() as c from a where tcp.dport == 80;"))
+    assert covers(parse_source(
+        "select sum(frame.origlen) as s from a where (ip.src == 10.0.0.0/8 and tcp.flag_syn == true) and DNS;"))
+    assert covers(parse_source("select max(ip.ttl) as t from a where 10.0.0.1 to 10.0.0.2;"))
+    assert covers(parse_source("select count() as c from a where tcp.dport == 80 or tcp.dport == 443;"))
+    assert covers(parse_source("select count() as c from a where udp.dport >= 1024 and ip.dst != 8.8.8.8;"))
+
+    # --- Packets are needed for the other fields and predicates
+    assert not covers(parse_source("select ip.src from a where tcp.dport == 80;"))
+    assert not covers(parse_source("select sum(ip.len) as s from a where tcp.dport == 80;"))
+    assert not covers(parse_source("select count() as c from a where tcp.dport == 80 or ip.len > 100;"))
+    assert not covers(parse_source("select count() as c from a where ip[0:1] == [0x45];"))
+    assert not covers(parse_source("select count() as c from a where tcp.dport == 80 group by ip.src;"))
+
+
+def test_follow_stream(store):
+    # --- Two flows interleaved in each file, files 1 and 2 in a segment
+    pcapfile = PcapFile()
+    for file_id in (1, 2, 3):
+        append_packets(store.pcap / f"{file_id}.pcap",
+                       [(file_id * 100 + i, udp_packet(0x0a000001, 0x0a000002, 5000 + i % 2, 1000))
+                        for i in range(4)], header=True)
+        pcapfile.create_index(file_id)
+    assert SegmentCompactor(max_records=20, grace=0).run(exclude={3}) == ["s1-2"]
+
+    rows = DBEngine().exec("select udp.sport from a where udp.sport == 5001;")["result"]
+    packet_id = next(row["id"] for row in rows if row["id"] >> 32 == 2)
+
+    result = DBEngine().follow(f"select ip.src, udp.sport from a where frame.id == {packet_id};")["result"]
+    assert [row["udp.sport"] for row in result] == [5001] * 6
+    assert [row["id"] >> 32 for row in result] == [1, 1, 2, 2, 3, 3]
+    assert packet_id in [row["id"] for row in result]
+
+    with pytest.raises(SyntaxError):
+        DBEngine().follow("select ip.src from a where udp.sport == 5001;")
+
+
+def test_dns_names(store):
+    for file_id in (1, 2):
+        create_file_index(store.index, file_id, 100 * file_id)
+    DnsIndex(1).from_packets([(0, "www.example.com", [0x5db8d822])]).save()
+    DnsIndex(2).from_packets([(1, "example.org", [0x5db8d822, 0x5db8d823])]).save()
+
+    assert DBEngine().dns_names("93.184.216.34") == {"result": ["example.org", "www.example.com"]}
+    assert DBEngine().dns_names("93.184.216.35") == {"result": ["example.org"]}
+    assert DBEngine().dns_names("10.0.0.1") == {"result": []}
+
+    with pytest.raises(ValueError):
+        DBEngine().dns_names("www.example.com")
+
+
+@pytest.mark.parametrize("query", [
+    "select count() as c from a where udp.dport == 1000;",
+    "select count() as c from a where udp.dport == 1000 offset 1;",
+    "select sum(frame.origlen) as s from a where udp.dport == 2000;",
+])
+def test_aggregate_paths(store, monkeypatch, query):
+    append_packets(store.pcap / "1.pcap",
+                   [(100 + i, udp_packet(0x0a000001, 0x0a000002, 5000 + i, (1000, 2000)[i % 2]))
+                    for i in range(6)], header=True)
+    PcapFile().create_index(1)
+    assert IndexManager().covers(parse_source(query))
+
+    # --- The index records and the packets skip the same matches
+    from_index = DBEngine().exec(query)
+    engine = DBEngine()
+    monkeypatch.setattr(type(engine.index_mgr), "covers", lambda self, model: False)
+    from_packets = engine.exec(query)
+
+    assert from_packets == from_index
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+
+from app.dbase.index_manager import IndexManager
+from app.dbase.index_manifest import IndexManifest, fingerprint
+from app.dbase.master_index import MasterIndex
+from app.dbase.segment import SegmentCatalog, SegmentCompactor
+from app.pql.parse import parse_source
+from test.helpers import append_packets, udp_packet
+
+
+def add_pcap_files(store):
+    for file_id in (1, 2):
+        append_packets(store.pcap / f"{file_id}.pcap",
+                       [(100 * file_id, udp_packet(0x0a000001, 0x0a000002, 5000, 53))], header=True)
+
+
+def test_manifest(store, monkeypatch):
+    add_pcap_files(store)
+    pcap = store.pcap / "1.pcap"
+
+    manifest = IndexManifest()
+    assert not manifest.is_current(1, pcap)
+
+    manifest.record(1, pcap, (100, 100))
+    assert manifest.is_current(1, pcap)
+    assert manifest.file_ids() == [1]
+
+    # --- Touched but same content
+    os.utime(pcap, ns=(0, 1))
+    assert manifest.is_current(1, pcap)
+
+    fp = fingerprint(pcap)
+    append_packets(pcap, [(101, udp_packet(0x0a000001, 0x0a000002, 5000, 53))])
+    assert fingerprint(pcap) != fp
+    assert not manifest.is_current(1, pcap)
+
+    monkeypatch.setenv("INDEX_FORMAT", "1")
+    manifest.record(1, pcap, (100, 101))
+    monkeypatch.setenv("INDEX_FORMAT", "2")
+    assert not manifest.is_current(1, pcap)
+
+    monkeypatch.setenv("INDEX_LAYOUT", "1")
+    manifest.record(1, pcap, (100, 101))
+    assert manifest.is_current(1, pcap)
+    monkeypatch.setenv("INDEX_LAYOUT", "2")
+    assert not manifest.is_current(1, pcap)
+
+    manifest.remove(1)
+    assert manifest.file_ids() == []
+    manifest.close()
+
+
+def test_manifest_without_layout(store):
+    add_pcap_files(store)
+    pcap = store.pcap / "1.pcap"
+
+    # --- Table of a manifest written before the layout was recorded
+    conn = sqlite3.connect(store.master_index)
+    conn.execute("""
+                 create table index_manifest (file_id integer primary key, size integer not null,
+                 mtime integer not null, fingerprint text not null, index_format integer not null);
+                 """)
+    conn.execute("insert into index_manifest values (1, ?, ?, ?, 2);",
+                 (pcap.stat().st_size, pcap.stat().st_mtime_ns, fingerprint(pcap)))
+    conn.commit()
+    conn.close()
+
+    manifest = IndexManifest()
+    assert not manifest.is_current(1, pcap)
+
+    manifest.record(1, pcap, (100, 100))
+    assert manifest.is_current(1, pcap)
+    manifest.close()
+
+
+def test_incremental_index(store):
+    add_pcap_files(store)
+
+    IndexManager().create_index_seq()
+    assert (store.index / "1.pidx").exists()
+    assert MasterIndex.instance().refresh().search(0, 1000) == [1, 2]
+
+    unchanged = (store.index / "1.pidx").stat().st_mtime_ns
+    append_packets(store.pcap / "2.pcap", [(250, udp_packet(0x0a000001, 0x0a000002, 5000, 53))])
+    IndexManager().create_index_seq()
+
+    assert (store.index / "1.pidx").stat().st_mtime_ns == unchanged
+    assert MasterIndex.instance().refresh().search(201, 300) == [2]
+
+    os.remove(store.pcap / "1.pcap")
+    IndexManager().create_index_seq()
+    assert not (store.index / "1.pidx").exists()
+    assert not (store.index / "1_ip_src.plst").exists()
+    assert MasterIndex.instance().refresh().search(0, 1000) == [2]
+
+
+def test_removed_file_in_segment(store):
+    add_pcap_files(store)
+    append_packets(store.pcap / "3.pcap", [(300, udp_packet(0x0a000001, 0x0a000002, 5000, 53))], header=True)
+
+    # --- The purge removes every file of an id from the index folder
+    IndexManager().create_index_seq()
+    assert SegmentCompactor(grace=0).run() == ["s1-3"]
+    SegmentCompactor(grace=0).purge()
+
+    os.remove(store.pcap / "2.pcap")
+    IndexManager().create_index_seq()
+
+    catalog = SegmentCatalog.load()
+    assert catalog.covered == {}
+    assert (store.index / "1.pidx").exists() and (store.index / "3.pidx").exists()
+
+    model = parse_source("select ip.src from a where udp.dport == 53 top 10;")
+    assert sorted(ptr.file_id for ptr in IndexManager().search(model)) == [1, 3]
@@ -0,0 +1,125 @@
+import numpy as np
+
+from app.dbase.dns_index import DnsIndex
+from app.dbase.host_index import HostIndex
+from app.dbase.index_file import (INDEX_RECORD, INDEX_RECORD_WIDE, LAYOUT_WIDE,
+                                  IndexFile, as_layout)
+from app.dbase.index_manager import IndexManager
+from app.dbase.index_plan import FileIndexes
+from app.dbase.zone_map import ZoneMap
+from app.pql.packet_index import HTTP, HTTPS
+from app.pql.pcapfile import PcapFile
+from test.helpers import plan_of
+
+
+def build_records() -> np.ndarray:
+    return np.array([
+        (100, 24, 0x23, 0x0a010203, 0xc0a80301, 54, 443, 50000),
+        (101, 90, 0x93, 0x08080808, 0xc0a80302, 42, 53, 40000),
+        (102, 160, 0x23, 0x0a010204, 0xc0a80401, 54, 22, 50001),
+        (103, 230, 0x03, 0x0a010203, 0xc0a80301, 34, 0, 0),
+    ], dtype=INDEX_RECORD)
+
+
+def test_mask():
+    records = build_records()
+
+    assert plan_of("tcp.dport == 22 or udp.dport == 53").mask(records).tolist() == [False, True, True, False]
+    assert plan_of("tcp.dport != 443").mask(records).tolist() == [False, False, True, False]
+    assert plan_of("DNS or ip.src == 192.168.4.0/24").mask(records).tolist() == [False, True, True, False]
+    assert plan_of("ip.dst != 10.1.2.0/24 or tcp.dport < 100").mask(records).tolist() == [False, True, True, False]
+
+    # --- Predicates the index can't evaluate keep every record of their protocol
+    plan = plan_of("tcp.window > 100 or udp.dport == 53")
+    assert not plan.exact
+    assert plan.mask(records).tolist() == [True, True, True, False]
+
+
+def test_ordinals(store):
+    records = IndexFile(store.index / "1.pidx").save(build_records())
+    PcapFile().create_field_index(1, records)
+    indexes = FileIndexes(1, len(records))
+
+    assert plan_of("ip.dst == 10.1.2.3 or udp.dport == 53").ordinals(indexes).tolist() == [0, 1, 3]
+    assert plan_of("ip.dst == 10.1.2.0/24 and ip.src != 192.168.3.1").ordinals(indexes).tolist() == [2]
+    assert plan_of("DNS or tcp.dport < 100").ordinals(indexes).tolist() == [1, 2]
+    assert plan_of("ip[0:1] == [0x45] or DNS").ordinals(indexes) is None
+
+    # --- Single protocol alternatives are read together from the bitmaps
+    plan = plan_of("DNS or HTTPS or ip.dst == 10.1.2.4")
+    assert plan.ordinals(indexes).tolist() == np.flatnonzero(plan.mask(build_records())).tolist()
+    assert plan.ordinals(indexes).tolist() == [1, 2]
+
+    plan = plan_of("tcp.dport == 22 or udp.dport == 53")
+    ordinals, records = IndexManager().select(IndexFile(store.index / "1.pidx"), plan)
+    assert ordinals.tolist() == [1, 2]
+    assert records["ptr"].tolist() == [90, 160]
+
+
+def test_layer2(store):
+    records = as_layout(build_records(), INDEX_RECORD_WIDE)
+    records["vlan"] = [30, 1, 30, 30]
+    records["eth_src"] = [0x001122334455, 0x001122334455, 0x0a0b0c0d0e0f, 0x001122334455]
+    records = IndexFile(store.index / "2.pidx", LAYOUT_WIDE).save(records)
+    PcapFile().create_field_index(2, records)
+    indexes = FileIndexes(2, len(records))
+
+    plan = plan_of("eth.vlan == 30 and eth.src == 00:11:22:33:44:55")
+    assert plan.exact
+    assert plan.ordinals(indexes).tolist() == [0, 3]
+    assert plan.mask(records).tolist() == [True, False, False, True]
+    assert plan_of("eth.src != 00:11:22:33:44:55").ordinals(indexes).tolist() == [2]
+
+
+def test_dns_name(store):
+    records = IndexFile(store.index / "1.pidx").save(build_records())
+    PcapFile().create_field_index(1, records)
+    indexes = FileIndexes(1, len(records))
+
+    # --- Without DNS index the protocol bitmap gives the candidates
+    plan = plan_of('dns.query == "www.example.com"')
+    assert not plan.exact
+    assert plan.ordinals(indexes).tolist() == [1]
+
+    DnsIndex(1).from_packets([(1, "www.example.com", [])]).save()
+    indexes = FileIndexes(1, len(records))
+    assert plan.ordinals(indexes).tolist() == [1]
+    assert plan_of('dns.query == "*.example.com"').ordinals(indexes).tolist() == [1]
+    assert plan_of('dns.query == "example.org"').ordinals(indexes).tolist() == []
+
+
+def test_host_name(store):
+    records = build_records()
+    records["proto"][0] |= HTTPS
+    records["proto"][2] |= HTTP
+    records = IndexFile(store.index / "1.pidx").save(records)
+    PcapFile().create_field_index(1, records)
+    HostIndex(1).from_packets([(0, "https.sni", "www.example.com"), (2, "http.host", "www.example.com"),
+                               (2, "http.uri", "/Index.html")]).save()
+    indexes = FileIndexes(1, len(records))
+
+    assert plan_of('https.sni == "*.example.com"').ordinals(indexes).tolist() == [0]
+    assert plan_of('https.sni == "www.example.com" or http.host == "www.example.com"').ordinals(indexes).tolist() == [0, 2]
+
+    # --- URIs are matched byte for byte, "*." is part of the string
+    assert plan_of('http.uri == "/Index.html"').ordinals(indexes).tolist() == [2]
+    assert plan_of('http.uri == "/index.html"').ordinals(indexes).tolist() == []
+    assert plan_of('http.uri == "*.html"').ordinals(indexes).tolist() == []
+
+
+def test_zone_map():
+    zone_map = ZoneMap.from_records(build_records())
+
+    assert plan_of("DNS or NTP").may_match(zone_map)
+    assert not plan_of("NTP or tcp.dport == 8080").may_match(zone_map)
+    assert not plan_of("ip.dst == 172.16.0.0/12").may_match(zone_map)
+    assert plan_of("ip.dst != 172.16.0.0/12").may_match(zone_map)
+
+
+def test_legacy_protocols():
+    has_proto_index = IndexManager().has_proto_index
+
+    assert has_proto_index(plan_of("DNS or NTP")) == ["DNS", "NTP"]
+    assert has_proto_index(plan_of("DNS and ip.src == 10.0.0.1")) == ["DNS"]
+    assert has_proto_index(plan_of("DNS or tcp.dport == 22")) == []
+    assert has_proto_index(plan_of("ip.src != 10.0.0.1")) == []
@@ -0,0 +1,38 @@
+import numpy as np
+
+from app.dbase.ipv4_search import Ipv4Search, network_range
+
+
+def test_merge_intervals():
+    search = Ipv4Search([(0x0a000105, 24), (0x0a000000, 24), (0x0a000180, 25),
+                         (0xc0a80301, 32), (0xc0a80302, 32)])
+
+    assert network_range(0x0a000105, 24) == (0x0a000100, 0x0a0001ff)
+    assert search.ranges == [(0x0a000000, 0x0a0001ff), (0xc0a80301, 0xc0a80302)]
+
+
+def test_contains():
+    search = Ipv4Search([(0x0a000000, 8), (0xc0a80301, 32)])
+
+    assert 0x0a010203 in search
+    assert 0xc0a80301 in search
+    assert 0xc0a80302 not in search
+    assert 0x09ffffff not in search
+    assert 0x0b000000 not in search
+    assert 0x0a000001 not in Ipv4Search([])
+
+
+def test_mask():
+    search = Ipv4Search([(0xc0a80300, 24), (0x0a000001, 32)])
+    column = np.array([0x0a000001, 0x0a000002, 0xc0a803ff, 0xc0a80400, 0], dtype=">u4")
+
+    assert search.mask(column).tolist() == [True, False, True, False, False]
+    assert Ipv4Search([(0, 0)]).mask(column).all()
+
+
+def test_overlaps_and_compile():
+    search = Ipv4Search.compile([(0xc0a80300, 24)])
+
+    assert search.overlaps(0xc0a80200, 0xc0a80300)
+    assert not search.overlaps(0xc0a80400, 0xc0a805ff)
+    assert Ipv4Search.compile([(0xc0a80300, 24)]) is search
@@ -0,0 +1,63 @@
+import sqlite3
+
+from app.dbase.master_index import MasterIndex
+
+
+def create_table(db_name, rows):
+    conn = sqlite3.connect(db_name)
+    conn.execute("""
+                 create table if not exists master_index (
+                     id integer primary key autoincrement,
+                     start_ts integer not null,
+                     end_ts integer not null,
+                     file_id integer not null
+                     );
+                 """)
+    conn.executemany(
+        "INSERT INTO master_index (start_ts, end_ts, file_id) VALUES (?,?,?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def test_overlap():
+    master_index = MasterIndex("unused")
+    master_index.add([(1, 100, 200, 1), (2, 150, 1000, 2),
+                     (3, 300, 400, 3), (4, 500, 600, 4)])
+
+    assert master_index.search(0, 99) == []
+    assert master_index.search(190, 310) == [1, 2, 3]
+    assert master_index.search(450, 480) == [2]
+    assert master_index.search(550, 560) == [2, 4]
+    assert master_index.search(1000, 2000) == [2]
+    assert master_index.search(1001, 2000) == []
+
+
+def test_unordered_add():
+    master_index = MasterIndex("unused")
+    master_index.add([(1, 500, 600, 4)])
+    master_index.add([(2, 100, 200, 1)])
+
+    assert master_index.start_ts.tolist() == [100, 500]
+    assert master_index.search(0, 1000) == [1, 4]
+
+
+def test_refresh(tmp_path):
+    db_name = str(tmp_path / "master.db")
+    master_index = MasterIndex(db_name)
+    assert len(master_index.refresh()) == 0
+
+    create_table(db_name, [(100, 200, 1), (300, 400, 2)])
+    assert master_index.refresh().search(150, 350) == [1, 2]
+
+    create_table(db_name, [(500, 600, 3)])
+    master_index.refresh()
+    assert master_index.last_id == 3
+    assert master_index.search(0, 1000) == [1, 2, 3]
+
+    # --- Table rebuilt with fewer rows
+    conn = sqlite3.connect(db_name)
+    conn.execute("drop table master_index;")
+    conn.commit()
+    conn.close()
+    create_table(db_name, [(700, 800, 9)])
+    assert master_index.refresh().search(0, 1000) == [9]
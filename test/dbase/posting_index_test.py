@@ -0,0 +1,65 @@
+import numpy as np
+
+from app.dbase.posting_index import (PostingIndex, network_postings,
+                                     network_range)
+
+
+def build_index() -> PostingIndex:
+    column = np.array([0x0a000005, 0x0a000001, 0x0a000005,
+                      0xc0a80301, 0x0a000001, 0x0a000102], dtype=">u4")
+    PostingIndex(1, "ip_dst").build(column).save()
+
+    return PostingIndex(1, "ip_dst").load()
+
+
+def test_lookup(store):
+    index = build_index()
+
+    assert index.keys.tolist() == [0x0a000001, 0x0a000005, 0x0a000102, 0xc0a80301]
+    assert index.lookup(0x0a000005).tolist() == [0, 2]
+    assert index.lookup(0x0a000001).tolist() == [1, 4]
+    assert index.lookup(0x0a000002).tolist() == []
+
+
+def test_range_sorted(store):
+    index = build_index()
+
+    assert index.range(0x0a000000, 0x0a0000ff).tolist() == [0, 1, 2, 4]
+    assert index.range(0x0b000000, 0xffffffff).tolist() == [3]
+
+
+def test_network_postings(store):
+    index = build_index()
+
+    assert network_range(0x0a000105, 24) == (0x0a000100, 0x0a0001ff)
+    assert network_postings(index, [(0x0a000100, 24), (0xc0a80301, 32)]).tolist() == [3, 5]
+
+
+def test_empty_index(store):
+    PostingIndex(2, "ip_src").build(np.empty(0, dtype=">u4")).save()
+
+    assert PostingIndex(2, "ip_src").load().lookup(1).tolist() == []
+
+
+def test_port_keys(store):
+    column = np.array([443, 53, 443, 22, 53], dtype=">u2")
+    PostingIndex(3, "dport").build(column, ">u2").save()
+
+    index = PostingIndex(3, "dport").load()
+    assert index.keys.dtype.itemsize == 2
+    assert index.lookup(443).tolist() == [0, 2]
+    assert index.lookup(53).tolist() == [1, 4]
+
+
+def test_merge(store):
+    index = build_index()
+    new_column = np.array([0x0a000001, 0x0b000001, 0x0a000005], dtype=">u4")
+    new_index = PostingIndex(1, "ip_dst").build(new_column)
+
+    index.merge([(index, 0), (new_index, 6)]).save()
+    index = PostingIndex(1, "ip_dst").load()
+
+    assert index.keys.tolist() == [0x0a000001, 0x0a000005, 0x0a000102, 0x0b000001, 0xc0a80301]
+    assert index.lookup(0x0a000001).tolist() == [1, 4, 6]
+    assert index.lookup(0x0a000005).tolist() == [0, 2, 8]
+    assert index.lookup(0x0b000001).tolist() == [7]
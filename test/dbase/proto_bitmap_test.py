@@ -0,0 +1,52 @@
+import numpy as np
+
+from app.dbase.proto_bitmap import (ARRAY_MAX, CONTAINER_ARRAY,
+                                    CONTAINER_BITMAP, ProtoBitmapIndex,
+                                    RoaringBitmap)
+
+
+def test_roundtrip():
+    ordinals = np.array([3, 1, 70000, 65535, 65536, 3])
+    bitmap = RoaringBitmap.from_ordinals(ordinals)
+
+    assert sorted(bitmap.containers) == [0, 1]
+    assert bitmap.to_ordinals().tolist() == [1, 3, 65535, 65536, 70000]
+    assert len(bitmap) == 5
+
+
+def test_dense_container():
+    dense = RoaringBitmap.from_ordinals(np.arange(0, 20000, 2))
+    sparse = RoaringBitmap.from_ordinals(np.array([2, 3, 4, 19998, 30000]))
+
+    assert dense.containers[0][0] == CONTAINER_BITMAP
+    assert sparse.containers[0][0] == CONTAINER_ARRAY
+    assert (dense & sparse).to_ordinals().tolist() == [2, 4, 19998]
+    assert len(dense | sparse) == 10002
+
+    odd = RoaringBitmap.from_ordinals(np.arange(1, ARRAY_MAX * 3, 2))
+    assert len(dense & odd) == 0
+    assert (dense | odd).to_ordinals().tolist() == list(range(0, ARRAY_MAX * 3)) + list(range(ARRAY_MAX * 3, 20000, 2))
+
+
+def test_proto_bitmap_index(store):
+    proto = np.array([0x23, 0x93, 0x23, 0x03, 0x13], dtype=">u4")
+    ProtoBitmapIndex(7).build(proto).save()
+
+    index = ProtoBitmapIndex(7).load()
+    assert sorted(index.bitmaps) == [0x01, 0x02, 0x10, 0x20, 0x80]
+    assert index.match_all(0x20).to_ordinals().tolist() == [0, 2]
+    assert index.match_all(0x90).to_ordinals().tolist() == [1]
+    assert index.match_any(0x90).to_ordinals().tolist() == [1, 4]
+    assert index.match_all(0x40).to_ordinals().tolist() == []
+    assert index.match_all(0) is None
+
+
+def test_merge():
+    proto = np.array([0x23, 0x93, 0x23, 0x03, 0x13, 0x41], dtype=">u4")
+    index = ProtoBitmapIndex(7).build(proto[:4])
+    index.merge([(index, 0), (ProtoBitmapIndex(7).build(proto[4:]), 4)])
+
+    expected = ProtoBitmapIndex(7).build(proto)
+    assert sorted(index.bitmaps) == sorted(expected.bitmaps)
+    for bit, bitmap in expected.bitmaps.items():
+        assert index.bitmap(bit).to_ordinals().tolist() == bitmap.to_ordinals().tolist()
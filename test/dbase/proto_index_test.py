@@ -0,0 +1,34 @@
+from struct import pack
+
+import numpy as np
+
+from app.dbase.proto_index import PROTO_INDEX_LINE, IndexLine, ProtoIndex
+
+
+def test_save_load(store):
+    ProtoIndex(3, 0x80).save([IndexLine(24, 0x08080808, 0xc0a80301),
+                              IndexLine(90, 0x0a010203, 0xc0a80302)])
+    assert (store.index / "3_80.pidx").stat().st_size == 12 + 2 * 12
+
+    lines = ProtoIndex(3, 0x80).load(3, 0x80)
+    assert len(lines) == 2
+    assert lines[1].ptr == 90
+    assert lines.ip_dst.tolist() == [0x08080808, 0x0a010203]
+
+
+def test_legacy_file(store):
+    # --- File written one field at a time like the original implementation
+    with open(store.index / "4_200.pidx", "wb") as f:
+        f.write(pack(">I", 0xa1b2c3d4))
+        f.write(pack(">H", 0x0001))
+        f.write(pack(">H", 0x0000))
+        f.write(pack(">I", 1))
+        f.write(pack(">III", 160, 0x01020304, 0x05060708))
+
+    lines = ProtoIndex(4, 0x200).load(4, 0x200)
+    assert (lines[0].ptr, lines[0].ip_dst, lines[0].ip_src) == (160, 0x01020304, 0x05060708)
+
+
+def test_empty(store):
+    ProtoIndex(5, 0x40).save(np.empty(0, dtype=PROTO_INDEX_LINE))
+    assert len(ProtoIndex(5, 0x40).load(5, 0x40)) == 0
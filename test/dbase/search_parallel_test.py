@@ -0,0 +1,99 @@
+import multiprocessing
+
+import pytest
+
+from app.dbase.dbengine import DBEngine
+from app.dbase.index_manager import (SEARCH_SLOTS, IndexManager, SearchPool,
+                                     init_worker, search_worker)
+from app.dbase.index_plan import query_plan
+from app.dbase.segment import SegmentCatalog, SegmentCompactor
+from app.pql.parse import parse_source
+from app.pql.pcapfile import PcapFile
+from test.helpers import append_packets, udp_packet
+
+QUERIES = [
+    "select ip.src, ip.dst, udp.dport from a where udp.dport == 1000;",
+    "select ip.dst, udp.sport from a where ip.dst == 10.0.0.0/30 or udp.dport == 2000;",
+    "select ip.src, udp.dport from a where udp.dport == 1000 top 5;",
+    "select ip.dst from a where ip.src == 10.0.1.0/24 top 4 offset 3;",
+    "select ip.src from a where ip.dst == 10.9.9.9;",
+]
+
+
+@pytest.fixture
+def capture(store, monkeypatch):
+    """
+    Four pcap files, the first three merged in a segment, searched by two
+    workers whatever the number of cores of the machine
+    """
+    monkeypatch.setattr(multiprocessing, "cpu_count", lambda: 2)
+    monkeypatch.setenv("NBR_THREADS", "2")
+    pcapfile = PcapFile()
+    for file_id in range(1, 5):
+        append_packets(store.pcap / f"{file_id}.pcap",
+                       [(file_id * 100 + i, udp_packet(0x0a000100 + file_id, 0x0a000000 + i % 4,
+                                                       5000 + i, (1000, 2000)[i % 2]))
+                        for i in range(6)], header=True)
+        pcapfile.create_index(file_id)
+
+    assert SegmentCompactor(max_records=20, grace=0).run(exclude={4}) == ["s1-3"]
+    yield store
+    SearchPool.shutdown()
+
+
+def test_same_result(capture):
+    assert SegmentCatalog.load().covered == {1: "s1-3", 2: "s1-3", 3: "s1-3"}
+
+    for query in QUERIES:
+        sequential = DBEngine().exec(query)
+        parallel = DBEngine().run_parallel(query)
+        assert parallel == sequential, query
+
+    assert len(DBEngine().exec(QUERIES[2])["result"]) == 5
+    assert len(DBEngine().run_parallel(QUERIES[3])["result"]) == 4
+
+
+def test_order(capture):
+    model = parse_source(QUERIES[0])
+    expected = [(r.file_id, r.ptr) for r in IndexManager().search(model)]
+    result = [(r.file_id, r.ptr) for r in IndexManager().search_parallel(model)]
+
+    # --- Newest file first, then the segment files
+    assert result == expected
+    assert [file_id for file_id, _ in result][:3] == [4, 4, 4]
+
+
+def test_cancellation(capture):
+    model = parse_source(QUERIES[0])
+    stream = IndexManager().search_parallel(model)
+    next(stream)
+    stream.close()
+
+    # --- The slot of the query is back and cleared
+    assert len(SearchPool.free_slots) == SEARCH_SLOTS
+    assert all(flag == 0 for flag in SearchPool.flags)
+
+    # --- A task of a finished query stops before searching
+    query = SearchPool.acquire()
+    SearchPool.release(query[0])
+    init_worker(SearchPool.flags)
+    index_file = capture.index / "4.pidx"
+    assert search_worker(model, query_plan(model), index_file, False, None, query) == []
+
+    # --- The next query of the slot runs
+    query = SearchPool.acquire()
+    assert len(search_worker(model, query_plan(model), index_file, False, None, query)) == 3
+    SearchPool.release(query[0])
+
+
+def test_shutdown(capture):
+    model = parse_source(QUERIES[0])
+    expected = list(IndexManager().search_parallel(model))
+
+    SearchPool.shutdown()
+    assert SearchPool.pool is None and SearchPool.flags is None
+
+    # --- The pool is created again by the next query
+    assert list(IndexManager().search_parallel(model)) == expected
+    assert SearchPool.pool is not None
+    assert SearchPool.pool._max_workers == 2
@@ -0,0 +1,48 @@
+from app.dbase.index_file import IndexFile
+from app.dbase.index_manager import IndexManager
+from app.dbase.index_plan import And, Proto, Range
+from app.dbase.segment import SegmentCatalog, SegmentCompactor
+from test.helpers import create_file_index
+
+
+def test_compaction(store):
+    for file_id in (1, 2, 3):
+        create_file_index(store.index, file_id, 100 * file_id)
+
+    compactor = SegmentCompactor(max_records=4, grace=0)
+    assert compactor.run() == ["s1-2"]
+    assert (store.index / "s1-2.sdir").exists()
+    assert (store.index / "1.pidx").exists()
+
+    catalog = SegmentCatalog.load()
+    assert catalog.covered == {1: "s1-2", 2: "s1-2"}
+    files_list = catalog.resolve([store.index / f"{i}.pidx" for i in (1, 2, 3)])
+    assert [f.name for f in files_list] == ["3.pidx", "s1-2.pidx"]
+
+    plan = And([Proto(0x80), Range("ip_src", 0xc0a80302, 0xc0a80302)])
+    result = IndexManager().search_pkt(store.index / "s1-2.pidx", plan,
+                                       segment=catalog.get(store.index / "s1-2.pidx"))
+    assert [(r.file_id, r.ptr) for r in result] == [(2, 90)]
+
+    result = IndexManager().search_pkt(store.index / "s1-2.pidx", Proto(0x20),
+                                       segment=catalog.get(store.index / "s1-2.pidx"))
+    assert [(r.file_id, r.ptr) for r in result] == [(2, 24), (1, 24)]
+
+    compactor.purge()
+    assert not (store.index / "1.pidx").exists()
+    assert not (store.index / "2_ip_src.plst").exists()
+    assert (store.index / "3.pidx").exists()
+    assert (store.index / "s1-2.pidx").exists()
+
+
+def test_interrupted_compaction(store):
+    for file_id in (1, 2):
+        create_file_index(store.index, file_id, 100 * file_id)
+
+    # --- Segment written without its directory
+    IndexFile(store.index / "s1-2.pidx").save(IndexFile(store.index / "1.pidx").load())
+    assert SegmentCatalog.load().resolve([store.index / "s1-2.pidx"]) == []
+
+    SegmentCompactor(grace=0).purge()
+    assert not (store.index / "s1-2.pidx").exists()
+    assert (store.index / "1.pidx").exists()
@@ -0,0 +1,41 @@
+import numpy as np
+
+from app.dbase.time_index import TimeIndex
+
+
+def test_ordinal_range(store):
+    ts = np.repeat(np.arange(100, 110), 10).astype(">u4")
+    TimeIndex(4, step=8).build(ts).save()
+
+    time_index = TimeIndex(4).load()
+    assert time_index.step == 8
+    assert time_index.nbr_records == 100
+    assert len(time_index.entries) == 13
+
+    first, last = time_index.ordinal_range(103, 104)
+    assert first <= 30 and last >= 50
+    assert (first, last) == (24, 56)
+    assert time_index.ordinal_range(109, 200) == (88, 100)
+    assert time_index.ordinal_range(50, 99) == (0, 0)
+    assert time_index.ordinal_range(110, 200) == (0, 0)
+
+
+def test_unordered(store):
+    # --- An out of order timestamp in the second entry
+    ts = np.array([100, 101, 150, 102, 103, 104, 105, 106], dtype=">u4")
+    time_index = TimeIndex(5, step=2).build(ts)
+
+    assert time_index.ordinal_range(150, 150) == (2, 8)
+    assert time_index.ordinal_range(104, 104) == (2, 6)
+    assert time_index.ordinal_range(100, 100) == (0, 2)
+
+
+def test_append(store):
+    ts = np.array([100, 104, 101, 103, 110, 90, 111, 112, 113, 95], dtype=">u4")
+    TimeIndex(6, step=4).build(ts[:3]).save()
+    TimeIndex(6).load().append(ts[3:5]).save()
+    time_index = TimeIndex(6).load().append(ts[5:])
+
+    expected = TimeIndex(6, step=4).build(ts)
+    assert time_index.nbr_records == 10
+    assert time_index.entries.tolist() == expected.entries.tolist()
@@ -0,0 +1,76 @@
+from struct import calcsize
+
+import numpy as np
+
+from app.dbase.index_file import INDEX_RECORD
+from app.dbase.index_plan import Range
+from app.dbase.zone_map import PORT_LIST_MAX, ZONE_MAP_HEADER, ZoneMap
+from test.helpers import plan_of
+
+
+def build_zone_map() -> ZoneMap:
+    records = np.array([
+        (100, 24, 0x23, 0x0a010203, 0xc0a80301, 54, 443, 50000),
+        (150, 90, 0x93, 0x08080808, 0xc0a80302, 42, 53, 40000),
+    ], dtype=INDEX_RECORD)
+
+    return ZoneMap.from_records(records)
+
+
+def test_summary():
+    zone_map = build_zone_map()
+    assert zone_map.proto == 0xb3
+    assert (zone_map.min_ts, zone_map.max_ts) == (100, 150)
+    assert (zone_map.min_ip_dst, zone_map.max_ip_dst) == (0x08080808, 0x0a010203)
+    assert zone_map.ports.tolist() == [53, 443, 40000, 50000]
+
+
+def test_proto_pruning():
+    zone_map = build_zone_map()
+    assert plan_of("DNS").may_match(zone_map)
+    assert not plan_of("HTTPS").may_match(zone_map)
+
+
+def test_ip_pruning():
+    zone_map = build_zone_map()
+    assert not plan_of("ip.src == 192.168.4.0/24").may_match(zone_map)
+    assert plan_of("ip.src == 192.168.4.0/24 or ip.src == 192.168.0.0/16").may_match(zone_map)
+
+
+def test_port_and_interval_pruning():
+    zone_map = build_zone_map()
+    assert not plan_of("tcp.dport == 22").may_match(zone_map)
+    assert not Range("ts", 151, 200).may_match(zone_map)
+    assert Range("ts", 10, 100).may_match(zone_map)
+
+
+def test_save_load(store):
+    zone_map = build_zone_map()
+    zone_map.save(3)
+
+    loaded = ZoneMap.load(3)
+    assert loaded.proto == zone_map.proto
+    assert loaded.max_ip_src == zone_map.max_ip_src
+    assert loaded.ports.tolist() == zone_map.ports.tolist()
+    assert ZoneMap.load(4) is None
+
+
+def test_port_bitmap(store):
+    zone_map = ZoneMap(ports=np.arange(PORT_LIST_MAX + 10, dtype=np.uint16))
+    zone_map.save(5)
+
+    assert (store.index / "5.zmap").stat().st_size == calcsize(ZONE_MAP_HEADER) + 8192
+    assert ZoneMap.load(5).ports.tolist() == zone_map.ports.tolist()
+
+
+def test_merge():
+    records = np.array([
+        (120, 60, 0x41, 0x0b000001, 0xc0a80001, 60, 22, 2222),
+    ], dtype=INDEX_RECORD)
+    zone_map = build_zone_map().merge(ZoneMap.from_records(records))
+
+    assert zone_map.proto == 0xf3
+    assert (zone_map.min_ts, zone_map.max_ts) == (100, 150)
+    assert (zone_map.min_ip_dst, zone_map.max_ip_dst) == (0x08080808, 0x0b000001)
+    assert (zone_map.min_ip_src, zone_map.max_ip_src) == (0xc0a80001, 0xc0a80302)
+    assert zone_map.ports.tolist() == [22, 53, 443, 2222, 40000, 50000]
@@ -0,0 +1,60 @@
+from pathlib import Path
+from struct import pack
+
+import numpy as np
+
+from app.dbase.index_file import INDEX_RECORD, IndexFile
+from app.dbase.index_plan import query_plan
+from app.packet.layers.packet_builder import PacketBuilder, PktHeader
+from app.pql.parse import parse_source
+from app.pql.pcapfile import PcapFile
+
+
+def udp_packet(src: int, dst: int, sport: int, dport: int) -> bytes:
+    payload = b"\x00" * 8
+    udp = pack("!HHHH", sport, dport, 8 + len(payload), 0) + payload
+    ip = pack("!BBHHHBBHII", 0x45, 0, 20 + len(udp), 1, 0, 64, 17, 0, src, dst)
+    return b"\x00\x11\x22\x33\x44\x55\x66\x77\x88\x99\xaa\xbb\x08\x00" + ip + udp
+
+
+def tcp_bytes(src: str, dst: str, sport: int, dport: int, flags: int = 0x18, payload: bytes = b"") -> bytes:
+    eth = bytes.fromhex("001122334455" "66778899aabb" "0800")
+    ip = pack(">BBHHHBBH4s4s", 0x45, 0, 40 + len(payload), 1, 0, 64, 6, 0,
+              bytes(int(b) for b in src.split(".")), bytes(int(b) for b in dst.split(".")))
+    tcp = pack(">HHIIBBHHH", sport, dport, 1, 0, 0x50, flags, 1024, 0, 0)
+    return eth + ip + tcp + payload
+
+
+def tcp_packet(src: str, dst: str, sport: int, dport: int, flags: int = 0x18) -> PacketBuilder:
+    raw = tcp_bytes(src, dst, sport, dport, flags)
+
+    pb = PacketBuilder()
+    pb.from_bytes(raw, PktHeader(timestamp=1700000000, ts_offset=0, incl_len=len(raw), orig_len=len(raw)))
+    return pb
+
+
+def append_packets(path, packets, header=False):
+    with open(path, "ab") as f:
+        if header:
+            f.write(pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for ts, packet in packets:
+            f.write(pack("<IIII", ts, 0, len(packet), len(packet)))
+            f.write(packet)
+
+
+def create_file_index(path: Path, file_id: int, ts: int):
+    records = np.array([
+        (ts, 24, 0x23, 0x0a010203, 0xc0a80300 + file_id, 54, 443, 50000),
+        (ts + 1, 90, 0x93, 0x08080808, 0xc0a80300 + file_id, 42, 53, 40000),
+    ], dtype=INDEX_RECORD)
+
+    records = IndexFile(path / f"{file_id}.pidx").save(records)
+    PcapFile().create_field_index(file_id, records)
+
+
+def expression(text: str):
+    return parse_source(f"select ip.src from a where {text} top 1;").where_expr
+
+
+def plan_of(where: str):
+    return query_plan(parse_source(f"select ip.src from a where {where};"))
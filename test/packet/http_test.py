@@ -0,0 +1,18 @@
+from app.packet.layers.http import *
+
+
+def test_http_request():
+    http = Http(b"GET /index.html?q=1 HTTP/1.1\r\nUser-Agent: test\r\nHost: www.example.com:8080\r\n\r\n")
+
+    assert (http.method == "GET")
+    assert (http.uri == "/index.html?q=1")
+    assert (http.host == "www.example.com")
+    assert (http.get_field("http.host") == "www.example.com")
+
+
+def test_http_response():
+    http = Http(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+
+    assert (http.uri is None)
+    assert (http.host is None)
+    assert (http.get_field("http.method") is None)
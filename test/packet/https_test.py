@@ -52,3 +52,25 @@ def test_https_version():
     https = Https(bytes(packet))
 
     assert (https.tls_version == TlsVersion.V1_2.value)
+
+
+def client_hello(server_name: bytes) -> bytes:
+    sni = (len(server_name) + 3).to_bytes(2, "big") + b"\x00" + len(server_name).to_bytes(2, "big") + server_name
+    extensions = b"\x00\x0a\x00\x02\x00\x17" + b"\x00\x00" + len(sni).to_bytes(2, "big") + sni
+    body = b"\x03\x03" + bytes(32) + b"\x00" + b"\x00\x02\x13\x01" + b"\x01\x00"
+    body += len(extensions).to_bytes(2, "big") + extensions
+    handshake = b"\x01" + len(body).to_bytes(3, "big") + body
+    return b"\x16\x03\x01" + len(handshake).to_bytes(2, "big") + handshake
+
+
+def test_https_server_name():
+    https = Https(client_hello(b"www.example.com"))
+
+    assert (https.is_valid)
+    assert (https.server_name == "www.example.com")
+    assert (https.get_field("https.sni") == "www.example.com")
+
+
+def test_https_server_name_truncated():
+    assert (Https(client_hello(b"www.example.com")[:60]).server_name is None)
+    assert (Https(bytes([0x17, 0x03, 0x03, 0x00, 0x05, 0x01, 0x02])).server_name is None)
@@ -0,0 +1,56 @@
+from app.packet.layers.packet_builder import PacketBuilder, PktHeader
+from app.pql.compiler import compile_expr
+from test.helpers import expression, tcp_bytes, tcp_packet
+
+
+def test_expected_results():
+    packets = [
+        tcp_packet("192.168.2.10", "10.1.2.3", 40000, 22),
+        tcp_packet("10.1.2.3", "192.168.2.10", 443, 40000, flags=0x02),
+    ]
+    expected = {
+        "ip.dst == 10.1.2.3": [True, False],
+        "ip.src == 192.168.2.0/24": [True, False],
+        "ip.src != 192.168.2.0/24": [False, True],
+        "ip.dst == 10.1.2.3 and tcp.dport == 22": [True, False],
+        "ip.dst == 8.8.8.8 or tcp.sport == 443": [False, True],
+        "tcp.flag_syn == true": [False, True],
+        "tcp.dport > 1024 and tcp.dport <= 40000": [False, True],
+        "ip[0:1] == [0x9c]": [True, False],
+        "(tcp.dport >> 8) == 0x9c": [False, True],
+        "(tcp.sport & 0xff) == 0xbb": [False, True],
+        "eth.dst == 00:11:22:33:44:55": [True, True],
+        "frame.timestamp > now(-1h)": [False, False],
+        "frame.timestamp < now(-1h)": [True, True],
+    }
+
+    for text, results in expected.items():
+        program = compile_expr(expression(text))
+        assert [bool(program(pb)) for pb in packets] == results, text
+
+
+def test_network_bounds():
+    program = compile_expr(expression("ip.src == 192.168.2.0/24"))
+
+    assert program(tcp_packet("192.168.2.255", "10.1.2.3", 1, 2))
+    assert not program(tcp_packet("192.168.3.0", "10.1.2.3", 1, 2))
+
+
+def test_string_fields():
+    raw = tcp_bytes("192.168.2.10", "10.1.2.3", 40000, 80,
+                    payload=b"GET /Index.html HTTP/1.1\r\nHost: WWW.Example.com\r\n\r\n")
+    pb = PacketBuilder()
+    pb.from_bytes(raw, PktHeader(timestamp=1700000000, ts_offset=0, incl_len=len(raw), orig_len=len(raw)))
+
+    # --- Host names ignore the case and match "*." domains, URIs are exact
+    expected = {
+        'http.host == "www.example.com"': True,
+        'http.host == "*.example.com"': True,
+        'http.uri == "/Index.html"': True,
+        'http.uri == "/index.html"': False,
+        'http.uri == "*.html"': False,
+        'http.uri != "/index.html"': True,
+    }
+    for text, result in expected.items():
+        model = expression(text)
+        assert compile_expr(model)(pb) == result, text
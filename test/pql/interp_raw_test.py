@@ -0,0 +1,47 @@
+from app.dbase.packet_ptr import PktPtr
+from app.packet.layers.packet_builder import PktHeader
+from app.pql.interp_raw import WhereFilter, exec_program
+from app.pql.parse import parse_source
+from test.helpers import tcp_bytes
+
+REQUEST = b"GET /p3 HTTP/1.1\r\nHost: web1.local\r\n\r\n"
+
+
+def where(text: str) -> WhereFilter:
+    return WhereFilter(parse_source(f"select ip.src from a where {text} top 1;").where_expr)
+
+
+def packet_ref(raw: bytes) -> PktPtr:
+    header = PktHeader(timestamp=1700000000, ts_offset=0, incl_len=len(raw), orig_len=len(raw))
+    return PktPtr(file_id=0, ptr=0, ip_dst=0, ip_src=0, pkt_hdr_size=0, header=header, packet=raw)
+
+
+def test_split_filter():
+    both = where("http.host == \"web1.local\" and tcp.dport == 80")
+    assert both.header is not None and both.rest is not None
+
+    header = where("ip.dst == 10.1.2.3 and ip[0:1] == [0x45]")
+    assert header.header is not None and header.rest is None
+
+    rest = where("http.host == \"web1.local\"")
+    assert rest.header is None and rest.rest is not None
+
+
+def test_two_phases():
+    http = packet_ref(tcp_bytes("192.168.2.10", "10.1.2.3", 40000, 80, payload=REQUEST))
+    other = packet_ref(tcp_bytes("192.168.2.10", "10.1.2.3", 40000, 81, payload=REQUEST))
+    both = where("http.host == \"web1.local\" and tcp.dport == 80")
+
+    pb = exec_program(both, http)
+    assert pb is not None
+    assert pb.get_field("http.host") == "web1.local"
+    assert exec_program(both, other) is None
+    assert exec_program(where("http.host == \"other.local\" and tcp.dport == 80"), http) is None
+
+
+def test_projection():
+    http = packet_ref(tcp_bytes("192.168.2.10", "10.1.2.3", 40000, 80, payload=REQUEST))
+    header = where("tcp.dport == 80")
+
+    assert exec_program(header, http, project=False).get_field("http.host") is None
+    assert exec_program(header, http).get_field("http.host") == "web1.local"
@@ -156,3 +156,17 @@ def test_integer():
         assert (tok_date.value == src)
     else:
         assert (False)
+
+
+def test_string():
+    lexer = Lexer('dns.query == "Host1.example.com";')
+    tokens = lexer.tokenize()
+    tok_string = tokens[4]
+    assert (tok_string.type == Tokens.TOK_STRING)
+    assert (tok_string.value == "Host1.example.com")
+    assert (tokens[5].type == Tokens.TOK_SEMI)
+
+
+def test_unterminated_string():
+    with pytest.raises(SyntaxError):
+        Lexer('dns.query == "Host1.example.com;').tokenize()
@@ -0,0 +1,66 @@
+from app.pql.compiler import compile_expr
+from app.pql.optimizer import fold_constants, optimize, split_header
+from test.helpers import expression, tcp_packet
+
+
+def test_fold_constants():
+    folded = fold_constants(expression("tcp.dport == (400 + 43)"))
+    assert type(folded.right).__name__ == "Integer"
+    assert folded.right.value == 443
+
+    folded = fold_constants(expression("frame.timestamp > now(-1h)"))
+    assert type(folded.right).__name__ == "Integer"
+
+    folded = fold_constants(expression("tcp.dport == 22 and true"))
+    assert repr(folded) == repr(expression("tcp.dport == 22"))
+
+
+def test_flatten_and_order():
+    optimized = optimize(expression("dns.query == \"a.local\" and ip[0:1] == [0x45] and tcp.dport == 53 and DNS"))
+
+    assert type(optimized).__name__ == "Chain"
+    assert [type(value).__name__ for value in optimized.values] == ["ConstDecl", "BinOp", "BinOp", "BinOp"]
+    assert optimized.values[1].left.value == "tcp.dport"
+    assert type(optimized.values[2].left).__name__ == "LabelByte"
+    assert optimized.values[3].left.value == "dns.query"
+
+
+def test_merge_networks():
+    optimized = optimize(expression("ip.dst == 10.1.2.0/24 or ip.dst == 10.1.3.0/24 or ip.dst == 8.8.8.8"))
+    assert type(optimized).__name__ == "NetworkSet"
+    assert optimized.ranges == [(0x08080808, 0x08080808), (0x0a010200, 0x0a0103ff)]
+
+    optimized = optimize(expression("ip.src == 10.0.0.0/8 and ip.src == 10.1.0.0/16 and ip.src != 10.1.2.3"))
+    assert type(optimized).__name__ == "Chain"
+    assert optimized.values[0].ranges == [(0x0a010000, 0x0a01ffff)]
+
+    # --- Disjoint networks have no address in common
+    optimized = optimize(expression("ip.src == 10.0.0.0/8 and ip.src == 11.0.0.0/8"))
+    assert optimized.ranges == []
+    assert not compile_expr(optimized)(tcp_packet("10.1.2.3", "11.1.2.3", 1, 2))
+
+
+def test_expected_results():
+    packets = [
+        tcp_packet("192.168.2.10", "10.1.2.3", 40000, 22),
+        tcp_packet("10.1.2.3", "192.168.2.10", 443, 40000, flags=0x02),
+    ]
+    expected = {
+        "ip.dst == 10.1.2.0/24 or ip.dst == 8.8.8.8": [True, False],
+        "ip.dst != 10.1.2.0/24 and ip.dst != 8.8.8.8": [False, True],
+        "ip.src == 192.168.0.0/16 and ip.src == 192.168.2.0/24 and tcp.dport == 22": [True, False],
+        "(tcp.dport == 20 + 2 or tcp.sport == 443) and tcp.flag_syn == true": [False, True],
+        "ip[0:1] == [0x9c] and frame.timestamp < now(-1h)": [True, False],
+    }
+
+    for text, results in expected.items():
+        program = compile_expr(optimize(expression(text)))
+        assert [bool(program(pb)) for pb in packets] == results, text
+
+
+def test_split_header():
+    header, rest = split_header(optimize(expression("dns.query == \"a.local\" and ip.dst == 8.8.8.8 and ip[0:1] == [0x45] and DNS")))
+
+    assert [type(value).__name__ for value in header.values] == ["BinOp", "BinOp"]
+    assert [type(value).__name__ for value in rest.values] == ["ConstDecl", "BinOp"]
+    assert split_header(optimize(expression("tcp.dport == 53")))[1] is None
@@ -63,6 +63,20 @@ def test_mac():
     assert (model.to_int == 0x000102030405)
 
 
+def test_string():
+    tokens = tokenize('"*.Example.com"')
+    model = parser.parse_string(parser.Tokenizer(tokens))
+    assert (model.value == "*.Example.com")
+    assert (model.matches_name("www.example.com."))
+    assert (not model.matches_name("example.com"))
+    assert (not model.matches_name(None))
+
+    # --- Other strings are compared byte for byte
+    assert (model.matches("*.Example.com"))
+    assert (not model.matches("www.example.com"))
+    assert (not model.matches("*.example.com"))
+
+
 def test_integer():
     tokens = tokenize("123")
     model = parser.parse_integer(parser.Tokenizer(tokens))
@@ -160,3 +174,19 @@ def test_bandwidth():
     print(model)
     assert (model.as_of == "bw_bytes")
     assert (model.fieldname == "frame.orig_len")
+
+
+def test_conversation():
+    model = parser.parse_source(
+        "select ip.src from a where tcp.dport == 443 and 10.0.0.1 to 192.168.1.0/24;")
+    assert (model.where_expr.right.op == Tokens.TOK_TO)
+    assert ((model.where_expr.right.left.to_int, model.where_expr.right.left.mask) == (0x0a000001, 32))
+    assert ((model.where_expr.right.right.to_int, model.where_expr.right.right.mask) == (0xc0a80100, 24))
+
+
+def test_wide_fields():
+    model = parser.parse_source(
+        "select ip.src from a where tcp.flag_syn == true and tcp.flag_ack == false and ip.ttl == 64;")
+    assert (model.where_expr.right.left.value == "ip.ttl")
+    assert (model.where_expr.left.right.left.value == "tcp.flag_ack")
+    assert (model.where_expr.left.right.right.value is False)
@@ -0,0 +1,97 @@
+from struct import pack
+
+from app.dbase.packet_ptr import PktPtr
+from app.pql.pcap_reader import COALESCE_GAP, PcapReader, PcapReaderPool, batched
+
+
+def write_pcap(path, packets, byte_order="<"):
+    with open(path, "wb") as f:
+        f.write(pack(f"{byte_order}IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for ts, packet in packets:
+            f.write(pack(f"{byte_order}IIII", ts, 0, len(packet), len(packet)))
+            f.write(packet)
+
+
+def test_read_packets(store):
+    write_pcap(store.pcap / "7.pcap", [(100, b"\x01\x02\x03"), (101, b"\x04\x05")])
+
+    reader = PcapReader(7)
+    result = [(hdr.timestamp, bytes(pkt), offset)
+              for hdr, pkt, offset in reader.packets()]
+
+    assert result == [(100, b"\x01\x02\x03", 24), (101, b"\x04\x05", 43)]
+    reader.close()
+
+
+def test_big_endian(store):
+    write_pcap(store.pcap / "8.pcap", [(0x01020304, b"\xaa")], ">")
+
+    hdr, pkt = PcapReader(8).packet(24)
+    assert hdr.timestamp == 0x01020304
+    assert hdr.file_ptr == 8
+    assert hdr.pkt_ptr == 24
+    assert isinstance(pkt, memoryview)
+    assert pkt == b"\xaa"
+
+
+def test_truncated_packet(store):
+    write_pcap(store.pcap / "9.pcap", [(100, b"\x01\x02\x03")])
+    with open(store.pcap / "9.pcap", "ab") as f:
+        f.write(pack("<IIII", 101, 0, 10, 10) + b"\x01")
+
+    assert len(list(PcapReader(9).packets())) == 1
+
+
+def test_pool_reuse(store):
+    write_pcap(store.pcap / "10.pcap", [(100, b"\x01")])
+
+    pool = PcapReaderPool()
+    reader = pool.get(10)
+    assert pool.get("10") is reader
+
+    hdr, pkt = reader.packet(24)
+    pool.close()
+    assert pool.readers == {}
+
+
+def test_read_batch(store):
+    packets = [(100 + i, bytes([i]) * 100) for i in range(10)]
+    packets.append((200, b"\xff" * (COALESCE_GAP + 1)))
+    packets.append((201, b"\xee"))
+    write_pcap(store.pcap / "11.pcap", packets)
+
+    reader = PcapReader(11)
+    offsets = [offset for _, _, offset in reader.packets()]
+
+    # --- The first packets are read together, the last one is too far
+    result = reader.read_batch([offsets[11], offsets[3], offsets[0], offsets[9], offsets[0]])
+    assert reader.reads == 2
+    assert sorted(result) == [offsets[0], offsets[3], offsets[9], offsets[11]]
+    assert result[offsets[3]][0].timestamp == 103
+    assert bytes(result[offsets[3]][1]) == b"\x03" * 100
+    assert bytes(result[offsets[11]][1]) == b"\xee"
+    reader.close()
+
+
+def test_pool_fetch(store):
+    write_pcap(store.pcap / "12.pcap", [(100, b"\x01"), (101, b"\x02")])
+    write_pcap(store.pcap / "13.pcap", [(102, b"\x03")])
+
+    ptr_list = [PktPtr(file_id=12, ptr=41, ip_dst=0, ip_src=0, pkt_hdr_size=0),
+                PktPtr(file_id=13, ptr=24, ip_dst=0, ip_src=0, pkt_hdr_size=0),
+                PktPtr(file_id=12, ptr=24, ip_dst=0, ip_src=0, pkt_hdr_size=0)]
+
+    pool = PcapReaderPool()
+    pool.fetch(ptr_list)
+    assert [bytes(pkt_ptr.packet) for pkt_ptr in ptr_list] == [b"\x02", b"\x03", b"\x01"]
+    assert [pkt_ptr.header.timestamp for pkt_ptr in ptr_list] == [101, 102, 100]
+    assert pool.get(12).reads == 1
+    pool.close()
+
+
+def test_batched():
+    batches = list(batched(range(20), 2, 8))
+
+    assert [len(batch) for batch in batches] == [2, 4, 8, 6]
+    assert [item for batch in batches for item in batch] == list(range(20))
+    assert list(batched([], 2, 8)) == []
@@ -0,0 +1,123 @@
+import subprocess
+from struct import pack
+
+import numpy as np
+
+from app.dbase.index_file import INDEX_V1, INDEX_V2, IndexFile
+from app.dbase.index_manifest import IndexManifest
+from app.dbase.master_index import MasterIndex
+from app.dbase.posting_index import PostingIndex
+from app.dbase.proto_bitmap import ProtoBitmapIndex
+from app.dbase.time_index import TimeIndex
+from app.dbase.zone_map import ZoneMap
+from app.pql.pcap_tail import LiveCapture, PcapTail
+from app.pql.pcapfile import POSTING_FIELDS, PcapFile
+from app.server.capture import create_move_script
+from test.helpers import append_packets, udp_packet
+
+
+def test_tail(store):
+    pcap = store.pcap / "5.pcap"
+    append_packets(pcap, [(100, udp_packet(0x0a000001, 0x0a000002, 5000, 53)),
+                          (101, udp_packet(0x0a000001, 0x0a000003, 5001, 123))], header=True)
+
+    tail = PcapTail(5)
+    assert tail.step() == 2
+    assert tail.step() == 0
+    assert MasterIndex.instance().refresh().search(100, 101) == [5]
+
+    # --- Packet being written
+    packet = udp_packet(0x0a000004, 0x0a000002, 5002, 53)
+    with open(pcap, "ab") as f:
+        f.write(pack("<IIII", 102, 0, len(packet), len(packet)) + packet[:10])
+    assert tail.step() == 0
+
+    with open(pcap, "ab") as f:
+        f.write(packet[10:])
+    assert tail.step() == 1
+    assert MasterIndex.instance().refresh().search(102, 102) == [5]
+
+    index_file = IndexFile(store.index / "5.pidx").open()
+    assert index_file.version == INDEX_V1
+    assert index_file.load()["dport"].tolist() == [53, 123, 53]
+
+    # --- A new indexer resumes after the last indexed packet
+    append_packets(pcap, [(103, udp_packet(0x0a000001, 0x0a000002, 5003, 53))])
+    tail = PcapTail(5)
+    assert tail.first_ts == 100
+    assert tail.step() == 1
+
+    tail.finalize()
+    index_file = IndexFile(store.index / "5.pidx").open()
+    assert index_file.version == INDEX_V2
+    assert index_file.load()["ts"].tolist() == [100, 101, 102, 103]
+    assert len(MasterIndex.instance().refresh()) == 1
+
+
+def test_incremental_sidecars(store):
+    pcap = store.pcap / "5.pcap"
+    append_packets(pcap, [], header=True)
+    tail = PcapTail(5)
+    for step in range(4):
+        append_packets(pcap, [(100 + step * 3 + i, udp_packet(0x0a000001 + i, 0x0a000002 + step, 5000 + i, 53 + step))
+                              for i in range(3)])
+        assert tail.step() == 3
+
+    # --- The merged indexes are those of the whole file
+    records = np.array(IndexFile(store.index / "5.pidx").load())
+    PcapFile().create_field_index(6, records)
+
+    merged_zone, full_zone = ZoneMap.load(5), ZoneMap.load(6)
+    assert (merged_zone.proto, merged_zone.min_ts, merged_zone.max_ts) == (full_zone.proto, full_zone.min_ts, full_zone.max_ts)
+    assert (merged_zone.min_ip_dst, merged_zone.max_ip_dst) == (full_zone.min_ip_dst, full_zone.max_ip_dst)
+    assert merged_zone.ports.tolist() == full_zone.ports.tolist()
+    assert TimeIndex(5).load().entries.tolist() == TimeIndex(6).load().entries.tolist()
+    for bit, bitmap in ProtoBitmapIndex(6).load().bitmaps.items():
+        assert ProtoBitmapIndex(5).load().bitmap(bit).to_ordinals().tolist() == bitmap.to_ordinals().tolist()
+    for field in POSTING_FIELDS:
+        if field in records.dtype.names:
+            merged, full = PostingIndex(5, field).load(), PostingIndex(6, field).load()
+            assert merged.keys.tolist() == full.keys.tolist()
+            assert merged.starts.tolist() == full.starts.tolist()
+            assert merged.postings.tolist() == full.postings.tolist()
+
+
+def test_live_capture(store, tmp_path):
+    capture_dir = tmp_path / "capture"
+    capture_dir.mkdir()
+    create_move_script(str(capture_dir), str(store.pcap))
+    ids = iter(range(10, 20))
+    capture = LiveCapture(capture_dir, lambda: next(ids))
+
+    # --- tcpdump writes its first file
+    append_packets(capture_dir / "trace", [(100, udp_packet(0x0a000001, 0x0a000002, 5000, 53))], header=True)
+    assert capture.step() == 1
+    assert capture.file_ids == {10}
+    assert MasterIndex.instance().refresh().search(100, 100) == [10]
+
+    append_packets(capture_dir / "trace", [(101, udp_packet(0x0a000001, 0x0a000003, 5001, 53))])
+    assert capture.step() == 1
+
+    # --- Rotation, the postrotate script moves the complete file to the
+    #     watched pcap folder and tcpdump starts the next one
+    append_packets(capture_dir / "trace", [(102, udp_packet(0x0a000001, 0x0a000004, 5002, 53))])
+    subprocess.run([capture_dir / "move.sh", capture_dir / "trace"], check=True)
+    append_packets(capture_dir / "trace1", [(103, udp_packet(0x0a000001, 0x0a000005, 5003, 53))], header=True)
+
+    # --- The link of the followed file is ignored, the moved one is the
+    #     followed file
+    assert capture.rotated(store.pcap / "10.pcap") is None
+    assert capture.rotated(store.pcap / "trace") is None
+    assert capture.step() == 1
+    assert capture.file_ids == {11}
+
+    assert sorted(f.name for f in store.pcap.iterdir()) == ["10.pcap", "11.pcap"]
+    index_file = IndexFile(store.index / "10.pidx").open()
+    assert index_file.version == INDEX_V2
+    assert index_file.load()["ts"].tolist() == [100, 101, 102]
+    assert IndexManifest().file_ids() == [10]
+
+    # --- A file moved while not followed is indexed by the caller
+    append_packets(store.pcap / "other", [], header=True)
+    assert capture.rotated(store.pcap / "other") == 12
+    assert (store.pcap / "12.pcap").exists()